@@ -11,7 +11,8 @@ This script fetches commit objects for repositories specified by in the input
     * commits - number of commits in the default branch
     * last_updated - timestamp when the repository was processed
 
-It generates a .csv file to store the progress of retrieval.
+It tracks the progress of retrieval in a .db job ledger next to the progress
+.csv file, which is rewritten with the results of all done repositories.
 It also generates a summary .csv file with basic information of each commit:
 
     * full_name - repository name
@@ -21,7 +22,8 @@ It also generates a summary .csv file with basic information of each commit:
     * author_date - author date
     * verified - whether the commit is verified
 
-The commit objects are written to .json files for each repository.
+The commit objects are written to .json files for each repository, as are
+the comments, issues and pull requests retrieved by the other commands.
 
 This script requires that `pandas` and `github` be installed within the
 Python environment you are running this script in.
@@ -32,6 +34,7 @@ Python environment you are running this script in.
 from argparse import ArgumentParser
 from ghminer.retriever import grab_commits
 from ghminer.retriever import grab_comments
+from ghminer.retriever import grab_issues
 from ghminer.parser import save_as_parquet
 from ghminer.parser import parse_xref_from_parquet
 from ghminer.parser import CommentXrefRecordReader
@@ -68,6 +71,18 @@ def _parse_args():
         '-d', '--trace', action="store_true",
         default=False, help='Print trace messages')
 
+    parser_sav_iss = subparsers.add_parser(
+        'save-parquet-issue', aliases=['spi'])
+    parser_sav_iss.add_argument(
+        '-s', '--src-dir', required=True,
+        help='Path to source directory containing issues.json files')
+    parser_sav_iss.add_argument(
+        '-p', '--parquet-file', required=True,
+        help='Path to the .parquet file to store issues')
+    parser_sav_iss.add_argument(
+        '-k', '--kind', choices=["issues", "pulls"], default="issues",
+        help='Save issues or pull requests, default issues')
+
     parser_xref = subparsers.add_parser('parse-xref', aliases=['xref'])
     parser_xref.add_argument(
         '-p', '--parquet-file', required=True,
@@ -136,6 +151,23 @@ def _parse_args():
     parser_grb.add_argument(
         '--progress-file', default="progress.csv",
         help='File to save commit retrieval progress, default progress.csv')
+    parser_grb.add_argument(
+        '-i', '--incremental', action="store_true", default=False,
+        help='Only fetch commits newer than the ones fetched last time')
+    parser_grb.add_argument(
+        '-b', '--backend', choices=["rest", "graphql"], default="rest",
+        help='API to page the commit history with, default rest')
+    parser_grb.add_argument(
+        '-w', '--workers', type=int, default=1,
+        help='Number of repositories to fetch concurrently, default 1')
+    parser_grb.add_argument(
+        '--window-workers', type=int, default=1,
+        help='Threads per very large repository fetching its history '
+             'windows concurrently, default 1')
+    parser_grb.add_argument(
+        '--ledger-file', default=None,
+        help='Job ledger shared by miners on several hosts, default the '
+             '.db file next to the progress file')
 
     parser_grbc = subparsers.add_parser('grab-comment', aliases=['grbc'])
     parser_grbc.add_argument(
@@ -150,6 +182,27 @@ def _parse_args():
     parser_grbc.add_argument(
         '--progress-file', default="progress.csv",
         help='File to save comment retrieval progress, default progress.csv')
+    parser_grbc.add_argument(
+        '-i', '--incremental', action="store_true", default=False,
+        help='Only fetch comments updated since the last fetch')
+    parser_grbc.add_argument(
+        '--window-workers', type=int, default=1,
+        help='Threads per very large repository fetching its comment '
+             'windows concurrently, default 1')
+
+    parser_grbi = subparsers.add_parser('grab-issue', aliases=['grbi'])
+    parser_grbi.add_argument(
+        '-o', '--output-dir', required=True,
+        help='Path to save output files')
+    parser_grbi.add_argument(
+        '-f', '--repo-list-file', required=True,
+        help='The list of repository to retrieve issues and pull requests')
+    parser_grbi.add_argument(
+        '-d', '--trace', action="store_true", default=False,
+        help='Print trace messages')
+    parser_grbi.add_argument(
+        '--progress-file', default="progress.csv",
+        help='File to save issue retrieval progress, default progress.csv')
 
     # Parse the arguments
     args = parser.parse_args()
@@ -164,6 +217,10 @@ def _save_parquet_comment(args):
     save_as_parquet(args.src_dir, "comments.json", args.parquet_file)
 
 
+def _save_parquet_issue(args):
+    save_as_parquet(args.src_dir, f"{args.kind}.json", args.parquet_file)
+
+
 def _parse_xref(args):
     parse_xref_from_parquet(
         CommitXrefRecordReader(),
@@ -212,7 +269,18 @@ def _grab_comments(args):
         repo_list_file,
         base_dir=subdir,
         progress_file=progress_file,
-        trace=trace
+        trace=trace,
+        incremental=args.incremental,
+        window_workers=args.window_workers
+    )
+
+
+def _grab_issues(args):
+    grab_issues(
+        args.repo_list_file,
+        base_dir=args.output_dir,
+        progress_file=args.progress_file,
+        trace=args.trace
     )
 
 
@@ -226,7 +294,12 @@ def _grab_commits(args):
         repo_list_file,
         base_dir=subdir,
         progress_file=progress_file,
-        trace=trace
+        trace=trace,
+        incremental=args.incremental,
+        backend=args.backend,
+        workers=args.workers,
+        window_workers=args.window_workers,
+        ledger_file=args.ledger_file
     )
 
 
@@ -236,10 +309,14 @@ if __name__ == "__main__":
       'grb': _grab_commits,
       'grab-comment': _grab_comments,
       'grbc': _grab_comments,
+      'grab-issue': _grab_issues,
+      'grbi': _grab_issues,
       'save-parquet': _save_parquet,
       'sp': _save_parquet,
       'save-parquet-comment': _save_parquet_comment,
       'spc': _save_parquet_comment,
+      'save-parquet-issue': _save_parquet_issue,
+      'spi': _save_parquet_issue,
       'parse-xref': _parse_xref,
       'xref': _parse_xref,
       'parse-xref-comment': _parse_xref_comment,
@@ -1,2 +1,4 @@
 [github]
 access_token=****************************************
+# optional extra tokens, comma or newline separated, to pool their quotas
+# access_tokens=****************************************,****************************************
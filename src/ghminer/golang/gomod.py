@@ -2,15 +2,55 @@
 # -*- coding: utf-8 -*-
 """Retrieve golang repository objects."""
 
+import base64
+import json
 import pandas as pd
 
 import semver
-from github import Github
-from datetime import datetime
+from github import RateLimitExceededException
 from timeit import default_timer as timer
-from pathlib import Path
-from ..utils import load_access_token
+from ..utils import default_pool
 from ..utils import load_repo_info
+from ..utils.common import iterate_pages
+from ..utils.graphql import not_found
+from ..utils.graphql import run_query
+from ..utils.ledger import LEASE_BATCH
+from ..utils.ledger import open_ledger
+from ..utils.ratelimit import QuotaScheduler
+from ..utils.ratelimit import limited_call
+from . import mirror
+from .store import add_index
+from .store import has_blob
+from .store import load_index
+from .store import store_blob
+
+# git objects fetched per aliased GraphQL query
+GOMOD_BATCH = 50
+
+_TAGS_QUERY = """
+query {
+    repository(owner: %s, name: %s) {
+        defaultBranchRef { name }
+        refs(refPrefix: "refs/tags/", first: 100%s) {
+            pageInfo {
+                hasNextPage
+                endCursor
+            }
+            nodes { name }
+        }
+    }
+}
+"""
+
+_TREE_FIELDS = "... on Tree { entries { name type oid } }"
+
+_OBJECTS_QUERY = """
+query {
+    repository(owner: %s, name: %s) {
+        %s
+    }
+}
+"""
 
 
 # semver comparison
@@ -25,77 +65,108 @@ def _semver_sort(ver_list):
     return [f"v{sv}" for sv in svers]
 
 
-def load_gomod(repo, path, version):
-    """Retrieve the content of `go.mod` file."""
-    try:
-        content = repo.get_contents(path, ref=version)
-        return (True, content)
-    except Exception as e:
-        print(f"Fail to load {repo.full_name}/{path}@{version} due to: {e}")
-        return (False, None)
+def _is_module_path(path):
+    if path != "go.mod" and not path.endswith("/go.mod"):
+        return False
+    # the go command ignores vendored copies, test data and hidden ones
+    return not any(
+        d in ("vendor", "testdata") or d.startswith((".", "_"))
+        for d in path.split("/")[:-1]
+    )
+
+
+def _walk_tree(repo, sha, prefix, limiter):
+    # one level per call, the directories the go command ignores are pruned
+    mods = []
+    tree = limited_call(limiter, repo.get_git_tree, sha)
+    for e in tree.tree:
+        path = f"{prefix}{e.path}"
+        if e.type == "blob" and _is_module_path(path):
+            mods.append((path, e.sha))
+        elif e.type == "tree" and _is_module_path(f"{path}/go.mod"):
+            mods.extend(_walk_tree(repo, e.sha, f"{path}/", limiter))
+    return mods
+
+
+def load_mod_tree(repo, version, limiter=None):
+    """Find all `go.mod` files of `version` in one recursive tree listing.
 
+    A recursive listing is truncated past 100,000 entries, the tree of such
+    a version is walked one directory at a time instead.
 
-def load_subdirs(repo, version):
-    """Search in sub directory, descend one level."""
+    Returns
+    -------
+    list
+        the path and the git blob SHA of each `go.mod`
+    """
     try:
-        contents = repo.get_contents(".", ref=version)
-        return [
-            c.name for c in contents
-            if c.type == 'dir' and not c.name.startswith('.')
-        ]
+        tree = limited_call(
+            limiter, repo.get_git_tree, version, recursive=True
+        )
+        if tree.truncated:
+            return _walk_tree(repo, tree.sha, "", limiter)
+    except RateLimitExceededException:
+        # throttled is not missing, leave it to the caller to retry
+        raise
     except Exception as e:
-        print("Fail to load sub directories of %s@%s due to: %s" % (
-            repo.full_name,
-            version,
-            e
-        ))
+        print(f"Fail to list {repo.full_name}@{version} due to: {e}")
         return []
+    return [
+        (e.path, e.sha) for e in tree.tree
+        if e.type == "blob" and _is_module_path(e.path)
+    ]
+
+
+def _load_blob(repo, sha):
+    return base64.b64decode(repo.get_git_blob(sha).content)
+
+
+def _sub_path(gmod_path):
+    return gmod_path[0:-len('go.mod')].rstrip('/')
 
 
 def persist_gomod(
-        owner, repo_name, version, content, gmod_path, base_dir):
-    """Persist mod info into files for later analysis."""
-    mod_file = f"{base_dir}/{owner}/{repo_name}/{version}/{gmod_path}"
-    sub = Path(mod_file[0:-len('go.mod')])
-    sub.mkdir(parents=True, exist_ok=True)
-    with open(mod_file, 'wb') as f:
-        f.write(content)
-
-
-def _persist_progress(
-        owner, repo_name, use_module, latest_ver, base_dir, progress_file):
-    # persist mod info into files for later analysis
-    mod_file = f"{base_dir}/{progress_file}"
-    sub = Path(mod_file[0:-len(progress_file)])
-    sub.mkdir(parents=True, exist_ok=True)
-    if not Path(mod_file).exists():
-        with open(mod_file, 'w') as f:
-            f.write("full_name,use_module,latest_version,last_updated\n")
-
-    with open(mod_file, 'a') as f:
-        f.write("%s/%s,%s,%s,%s\n" % (
-            owner,
-            repo_name,
-            1 if use_module else 0,
-            latest_ver,
-            datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        ))
+        owner, repo_name, version, content, gmod_path, base_dir, sha=None):
+    """Persist mod info into files for later analysis.
+
+    The content is stored once per git blob SHA and indexed by version and
+    sub path, see `ghminer.golang.store`.
+    """
+    sha = store_blob(base_dir, content, sha)
+    add_index(base_dir, owner, repo_name, version, {_sub_path(gmod_path): sha})
 
 
-def load_mod_info(client, owner, repo_name, base_dir="mod-info"):
-    """Load all `go.mod` file for all published versions."""
-    repo = load_repo_info(client, f"{owner}/{repo_name}")
+def _indexed_versions(base_dir, owner, repo_name):
+    # tags do not move, a version indexed by a previous run is kept
+    return {ver for ver, _ in load_index(base_dir, owner, repo_name)}
+
+
+def _tag_names(repo, limiter):
+    return [t.name for t in iterate_pages(repo.get_tags(), limiter)]
+
+
+def load_mod_info(
+        client, owner, repo_name, base_dir="mod-info", limiter=None):
+    """Load all `go.mod` file for all published versions.
+
+    The `go.mod` files of a version are found in one recursive listing of
+    its git tree, every module is recorded with its sub path. Only the
+    blobs missing from the store are downloaded. Every API call goes
+    through the optional `limiter`, see `QuotaScheduler`.
+    """
+    repo = limited_call(
+        limiter, load_repo_info, client, f"{owner}/{repo_name}"
+    )
     if not repo:
         return False, ""
     else:
         mod_count = 0
         # try all tagged versions plus latest version on default branch
         # content = repo.get_contents("go.mod", ref="v0.3.0")
-        tags = repo.get_tags()
         vers = [
-            t.name for t in tags
-            if t.name.startswith('v')
-            and semver.version.Version.is_valid(t.name[1:])
+            t for t in _tag_names(repo, limiter)
+            if t.startswith('v')
+            and semver.version.Version.is_valid(t[1:])
         ]
         if len(vers) == 0:
             vers.append(repo.default_branch)
@@ -104,82 +175,338 @@ def load_mod_info(client, owner, repo_name, base_dir="mod-info"):
             vers = _semver_sort(vers)
 
         latest_ver = vers[0]
+        indexed = _indexed_versions(base_dir, owner, repo_name)
         for ver in vers:
-            ok, content = load_gomod(repo, "go.mod", ver)
-            if ok:
-                persist_gomod(
-                    owner, repo_name, ver,
-                    content.decoded_content, "go.mod", base_dir
-                )
+            if ver in indexed:
                 mod_count += 1
-            else:
-                subdirs = load_subdirs(repo, ver)
-                for subdir in subdirs:
-                    gmod_path = f"{subdir}/go.mod"
-                    ok, content = load_gomod(repo, gmod_path, ver)
-                    if ok:
-                        persist_gomod(
-                            owner, repo_name, ver,
-                            content.decoded_content, gmod_path, base_dir)
-                        mod_count += 1
-                        break
-                else:
-                    break
+                continue
+            mods = load_mod_tree(repo, ver, limiter)
+            if not mods:
+                break
+            for gmod_path, sha in mods:
+                # the blobs of unchanged go.mod files are stored already
+                if not has_blob(base_dir, sha):
+                    store_blob(
+                        base_dir, limited_call(limiter, _load_blob, repo, sha),
+                        sha
+                    )
+            # indexed once all its blobs are stored, a crash before leaves
+            # the version to the next run
+            add_index(base_dir, owner, repo_name, ver, {
+                _sub_path(gmod_path): sha for gmod_path, sha in mods
+            })
+            mod_count += 1
         return mod_count > 0, latest_ver
 
 
+def _tag_refs(owner, repo_name, limiter):
+    """Retrieve the default branch and the tag names, None if missing."""
+    cursor = None
+    has_next = True
+    tags = []
+    default_branch = ""
+    while has_next:
+        result = limited_call(limiter, run_query, _TAGS_QUERY % (
+            json.dumps(owner),
+            json.dumps(repo_name),
+            f", after: {json.dumps(cursor)}" if cursor else "",
+        ))
+        # a failed page is raised, only a missing repository is None
+        not_found(result)
+        repository = result["data"]["repository"]
+        if repository is None:
+            return None
+        if repository["defaultBranchRef"]:
+            default_branch = repository["defaultBranchRef"]["name"]
+        refs = repository["refs"]
+        tags.extend(n["name"] for n in refs["nodes"])
+        has_next = refs["pageInfo"]["hasNextPage"]
+        cursor = refs["pageInfo"]["endCursor"]
+    return default_branch, tags
+
+
+def _load_objects(owner, repo_name, selectors, fields, limiter):
+    """Retrieve git objects, None if missing.
+
+    Each selector is the argument of an `object` field, either an
+    `expression` like `rev:path` or an `oid`, and `fields` are selected
+    on it. A query failing with any error but NOT_FOUND is raised.
+    """
+    objects = []
+    for i in range(0, len(selectors), GOMOD_BATCH):
+        batch = selectors[i:i + GOMOD_BATCH]
+        aliases = [
+            f"o{j}: object({selector}) {{ {fields} }}"
+            for j, selector in enumerate(batch)
+        ]
+        result = limited_call(limiter, run_query, _OBJECTS_QUERY % (
+            json.dumps(owner),
+            json.dumps(repo_name),
+            "\n        ".join(aliases),
+        ))
+        # a failed batch is raised, its null aliases are not missing files
+        not_found(result)
+        repository = result["data"]["repository"] or {}
+        objects.extend(
+            repository.get(f"o{j}", None) for j in range(len(batch))
+        )
+    return objects
+
+
+def _is_blob(obj):
+    return obj is not None and obj.get("text", None) is not None
+
+
+def _walk_trees(owner, repo_name, vers, trees, limiter):
+    """Find all `go.mod` files of each of `vers`, see `load_mod_tree`.
+
+    The trees of all `vers` are walked together, one level per round of
+    queries. `trees` holds the entries of every tree listed so far by its
+    oid, a tree unchanged since another version is not queried again.
+
+    Returns
+    -------
+    dict
+        the path and the git blob SHA of each `go.mod` by version
+    """
+    roots = _load_objects(
+        owner, repo_name,
+        [f"expression: {json.dumps(f'{ver}:')}" for ver in vers],
+        f"oid {_TREE_FIELDS}", limiter
+    )
+    mods = {ver: [] for ver in vers}
+    level = []
+    for ver, root in zip(vers, roots):
+        if root and root.get("entries", None) is not None:
+            trees[root["oid"]] = root["entries"]
+            level.append((ver, "", root["oid"]))
+    while level:
+        missing = list(dict.fromkeys(
+            oid for _, _, oid in level if oid not in trees
+        ))
+        listed = _load_objects(
+            owner, repo_name, [f"oid: {json.dumps(oid)}" for oid in missing],
+            _TREE_FIELDS, limiter
+        )
+        for oid, tree in zip(missing, listed):
+            trees[oid] = (tree or {}).get("entries", None) or []
+        # the directories the go command ignores are pruned
+        next_level = []
+        for ver, prefix, oid in level:
+            for e in trees[oid]:
+                path = f"{prefix}{e['name']}"
+                if e["type"] == "blob" and _is_module_path(path):
+                    mods[ver].append((path, e["oid"]))
+                elif e["type"] == "tree" and _is_module_path(
+                        f"{path}/go.mod"):
+                    next_level.append((ver, f"{path}/", e["oid"]))
+        level = next_level
+    return mods
+
+
+def _store_blobs(owner, repo_name, shas, base_dir, limiter):
+    # only the blobs missing from the store are downloaded
+    missing = list(dict.fromkeys(
+        sha for sha in shas if not has_blob(base_dir, sha)
+    ))
+    blobs = _load_objects(
+        owner, repo_name, [f"oid: {json.dumps(sha)}" for sha in missing],
+        "... on Blob { text oid }", limiter
+    )
+    for sha, blob in zip(missing, blobs):
+        if not _is_blob(blob):
+            raise Exception(f"Fail to load the blob {sha}")
+        store_blob(base_dir, blob["text"].encode(), sha)
+
+
+def load_mod_info_graphql(
+        owner, repo_name, base_dir="mod-info", limiter=None):
+    """Load all `go.mod` file for all published versions through GraphQL.
+
+    The tags are listed 100 per query. The git trees of `GOMOD_BATCH`
+    versions at a time are walked together, one level per round of
+    aliased `object` queries, and a tree shared with a version walked
+    before is listed only once. Like `load_mod_info`, every `go.mod` of a
+    version is recorded with its sub path.
+    """
+    refs = _tag_refs(owner, repo_name, limiter)
+    if refs is None:
+        return False, ""
+    default_branch, tags = refs
+    vers = [
+        t for t in tags
+        if t.startswith('v')
+        and semver.version.Version.is_valid(t[1:])
+    ]
+    if len(vers) == 0:
+        vers.append(default_branch)
+    else:
+        vers = _semver_sort(vers)
+
+    latest_ver = vers[0]
+    indexed = _indexed_versions(base_dir, owner, repo_name)
+    mod_count = len(indexed & set(vers))
+    vers = [v for v in vers if v not in indexed]
+    trees = {}
+    # batch by batch, older versions are not needed after a miss
+    for i in range(0, len(vers), GOMOD_BATCH):
+        batch = vers[i:i + GOMOD_BATCH]
+        mods = _walk_trees(owner, repo_name, batch, trees, limiter)
+        found = []
+        for ver in batch:
+            if not mods[ver]:
+                break
+            found.append(ver)
+        _store_blobs(
+            owner, repo_name, [sha for v in found for _, sha in mods[v]],
+            base_dir, limiter
+        )
+        # indexed once all its blobs are stored, see `load_mod_info`
+        for ver in found:
+            add_index(base_dir, owner, repo_name, ver, {
+                _sub_path(gmod_path): sha for gmod_path, sha in mods[ver]
+            })
+            mod_count += 1
+        if len(found) < len(batch):
+            break
+    return mod_count > 0, latest_ver
+
+
+def load_mod_info_local(mirror_dir, owner, repo_name, base_dir="mod-info"):
+    """Load all `go.mod` file for all published versions from a mirror.
+
+    The repository is read from its bare mirror in `mirror_dir`, see
+    `ghminer.golang.mirror`, no API call is made. Like `load_mod_info`,
+    every `go.mod` of a version is recorded with its sub path. The blobs
+    missing from the store are read through one `git cat-file --batch`.
+    """
+    git_dir = mirror.mirror_path(mirror_dir, owner, repo_name)
+    if not git_dir:
+        print(f"Fail to locate the mirror of {owner}/{repo_name}")
+        return False, ""
+    vers = [
+        t for t in mirror.list_tags(git_dir)
+        if t.startswith('v')
+        and semver.version.Version.is_valid(t[1:])
+    ]
+    if len(vers) == 0:
+        vers.append(mirror.default_branch(git_dir))
+        revs = ["HEAD"]
+    else:
+        vers = _semver_sort(vers)
+        revs = [f"refs/tags/{v}" for v in vers]
+
+    latest_ver = vers[0]
+    indexed = _indexed_versions(base_dir, owner, repo_name)
+    found = []
+    for ver, rev in zip(vers, revs):
+        if ver in indexed:
+            continue
+        mods = [
+            (path, sha) for path, sha in mirror.list_blobs(git_dir, rev)
+            if _is_module_path(path)
+        ]
+        if not mods:
+            break
+        found.extend((ver, path, sha) for path, sha in mods)
+
+    missing = list(dict.fromkeys(
+        sha for _, _, sha in found if not has_blob(base_dir, sha)
+    ))
+    for sha, content in mirror.read_blobs(git_dir, missing).items():
+        store_blob(base_dir, content, sha)
+    mods = {}
+    for ver, path, sha in found:
+        mods.setdefault(ver, {})[_sub_path(path)] = sha
+    for ver, ver_mods in mods.items():
+        add_index(base_dir, owner, repo_name, ver, ver_mods)
+    mod_count = len(indexed & set(vers)) + len({ver for ver, _, _ in found})
+    return mod_count > 0, latest_ver
+
+
 # client is the Github instance
-# row is a row of Pandas DataFrame
-def _do_mod_check(client, row, base_dir, progress_file, trace=False):
-    comps = row['full_name'].split('/')
+def _do_mod_check(
+        client, full_name, base_dir, trace=False, limiter=None,
+        backend="rest", mirror_dir=None):
+    comps = full_name.split('/')
     owner = comps[0]
     name = comps[1]
 
     t0 = timer()
-    use_module, latest_ver = load_mod_info(client, owner, name, base_dir)
-    _persist_progress(
-        owner, name, use_module, latest_ver, base_dir, progress_file
-    )
+    if backend == "local":
+        use_module, latest_ver = load_mod_info_local(
+            mirror_dir, owner, name, base_dir
+        )
+    elif backend == "graphql":
+        use_module, latest_ver = load_mod_info_graphql(
+            owner, name, base_dir, limiter
+        )
+    else:
+        use_module, latest_ver = load_mod_info(
+            client, owner, name, base_dir, limiter
+        )
     t1 = timer()
     if trace:
         print(f"Grab gomod for {owner}/{name} took {t1-t0}s")
-    return use_module
-
-
-def grab_gomod(repo_csv_file, base_dir, progress_file, trace=False):
-    """Retrieve all `go.mod` for repositories given in `repo_csv_file`."""
-    client = Github(load_access_token(), per_page=100)
-    to_check_df = pd.read_csv(repo_csv_file)
-
-    progress_path = f"{base_dir}/{progress_file}"
-    if Path(progress_path).exists():
-        checked_df = pd.read_csv(progress_path)
-        df2 = to_check_df.merge(checked_df, how="left", on="full_name")
-        # filter already processed repos, equivalent to SQL is null
-        df2 = df2.query("use_module != use_module")
-        df2.apply(
-            lambda r: _do_mod_check(client, r, base_dir, progress_file, trace),
-            axis=1
-        )
-    else:
-        df2 = to_check_df
-        df2.apply(
-            lambda r: _do_mod_check(client, r, base_dir, progress_file, trace),
-            axis=1
+    return {
+        "use_module": 1 if use_module else 0,
+        "latest_version": latest_ver,
+    }
+
+
+def grab_gomod(
+        repo_csv_file, base_dir, progress_file, trace=False,
+        ledger_file=None, backend="rest", mirror_dir=None):
+    """Retrieve all `go.mod` for repositories given in `repo_csv_file`.
+
+    When the quota runs out the retrieval pauses until it resets, so a
+    throttled `go.mod` is never recorded as missing. The progress is
+    tracked in a `JobLedger` next to `progress_file`, the results are
+    exported to `progress_file` at the end. To scale out, processes on
+    several hosts share one `ledger_file` and lease batches of
+    repositories from it, each with its own `base_dir`.
+
+    The `backend` is either `rest`, `graphql`, see
+    `load_mod_info_graphql`, or `local`, which reads the bare mirrors in
+    `mirror_dir` without any API call, see `load_mod_info_local`.
+    """
+    if backend not in ("rest", "graphql", "local"):
+        raise ValueError(f"Unknown go.mod backend: {backend}")
+    if backend == "local" and not mirror_dir:
+        raise ValueError("The local backend needs a mirror directory")
+    pool = None if backend == "local" else default_pool()
+    scheduler = None if backend == "local" else QuotaScheduler(
+        pool, "graphql" if backend == "graphql" else "core", trace=trace
+    )
+    keys = list(pd.read_csv(repo_csv_file, usecols=["full_name"]).full_name)
+    with open_ledger(
+            base_dir, progress_file, "full_name", ledger_file) as ledger:
+        ledger.add(keys)
+        for batch in ledger.batches(LEASE_BATCH):
+            for full_name in batch:
+                ledger.run(
+                    full_name, _do_mod_check,
+                    pool.client() if pool else None, full_name, base_dir,
+                    trace, scheduler, backend, mirror_dir
+                )
+        ledger.export_csv(
+            f"{base_dir}/{progress_file}", "full_name",
+            ["use_module", "latest_version"]
         )
 
 
-def load_latest_ver(client, owner, repo_name):
+def load_latest_ver(client, owner, repo_name, limiter=None):
     """Retrieve the latest version for given repository."""
-    repo = load_repo_info(client, f"{owner}/{repo_name}")
+    repo = limited_call(
+        limiter, load_repo_info, client, f"{owner}/{repo_name}"
+    )
     if repo:
         # try all tagged versions plus latest version on default branch
         # content = repo.get_contents("go.mod", ref="v0.3.0")
-        tags = repo.get_tags()
         vers = [
-            t.name for t in tags
-            if t.name.startswith('v')
-            and semver.version.Version.is_valid(t.name[1:])
+            t for t in _tag_names(repo, limiter)
+            if t.startswith('v')
+            and semver.version.Version.is_valid(t[1:])
         ]
         if len(vers) == 0:
             vers.append(repo.default_branch)
@@ -190,21 +517,20 @@ def load_latest_ver(client, owner, repo_name):
     return ""
 
 
-def _do_version_check(client, row, base_dir, progress_file, trace=False):
-    comps = row['full_name'].split('/')
+def _do_version_check(
+        client, full_name, use_module, trace=False, limiter=None):
+    comps = full_name.split('/')
     owner = comps[0]
     name = comps[1]
-    use_module = row['use_module']
+    # a missing flag in the old progress fails this job only
+    use_module = int(use_module)
 
     t0 = timer()
-    latest_ver = load_latest_ver(client, owner, name, base_dir)
-    _persist_progress(
-        owner, name, use_module, latest_ver, base_dir, progress_file
-    )
+    latest_ver = load_latest_ver(client, owner, name, limiter)
     t1 = timer()
     if trace:
         print(f"Grab latest version for {owner}/{name} took {t1-t0}s")
-    return latest_ver
+    return {"use_module": use_module, "latest_version": latest_ver}
 
 
 def grab_latest_version(
@@ -213,13 +539,19 @@ def grab_latest_version(
         progress_file="new_progress.csv",
         trace=False):
     """Retrieve latest version of given repository in `old_progress_file`."""
-    client = Github(load_access_token(), per_page=100)
+    pool = default_pool()
+    scheduler = QuotaScheduler(pool, trace=trace)
 
     progress_path = f"{base_dir}/{old_progress_file}"
     df_old = pd.read_csv(progress_path)
-    df_old.apply(
-        lambda r: _do_version_check(
-            client, r, base_dir, progress_file, trace
-        ),
-        axis=1
-    )
+    use_modules = dict(zip(df_old["full_name"], df_old["use_module"]))
+    with open_ledger(base_dir, progress_file, "full_name") as ledger:
+        for full_name in ledger.schedule(list(use_modules)):
+            ledger.run(
+                full_name, _do_version_check, pool.client(), full_name,
+                use_modules[full_name], trace, scheduler
+            )
+        ledger.export_csv(
+            f"{base_dir}/{progress_file}", "full_name",
+            ["use_module", "latest_version"]
+        )
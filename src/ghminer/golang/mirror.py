@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Read tags, trees and blobs from local bare mirrors of repositories.
+
+The mirrors are laid out as `{mirror_dir}/{owner}/{repo}.git`, e.g. made by
+`git clone --mirror`, and are read with the git command, no API quota is
+used.
+
+"""
+
+import subprocess
+
+from pathlib import Path
+
+
+def mirror_path(mirror_dir, owner, repo_name):
+    """Return the path of the bare mirror of given repository.
+
+    Parameters
+    ----------
+    mirror_dir : str
+        the directory of the mirrors
+    owner : str
+        the owner of the repository
+    repo_name : str
+        the name of the repository w/o owner
+
+    Returns
+    -------
+    str
+        the path of the mirror, None if there is none
+    """
+    for name in (f"{repo_name}.git", repo_name):
+        path = Path(mirror_dir, owner, name)
+        if path.is_dir():
+            return str(path)
+    return None
+
+
+def _git(git_dir, *args, stdin=None):
+    return subprocess.run(
+        ["git", f"--git-dir={git_dir}", *args],
+        input=stdin, capture_output=True, check=True
+    ).stdout
+
+
+def list_tags(git_dir):
+    """List the tag names of the mirror `git_dir`."""
+    out = _git(git_dir, "for-each-ref", "--format=%(refname:strip=2)",
+               "refs/tags")
+    return out.decode().split()
+
+
+def default_branch(git_dir):
+    """Return the branch HEAD of the mirror `git_dir` points to."""
+    return _git(git_dir, "symbolic-ref", "--short", "HEAD").decode().strip()
+
+
+def list_blobs(git_dir, rev):
+    """List the path and SHA of every blob in the tree of `rev`.
+
+    Returns
+    -------
+    list
+        the path and the git blob SHA of each file, recursively
+    """
+    out = _git(git_dir, "ls-tree", "-r", "-z", "--full-tree", rev)
+    blobs = []
+    for entry in out.decode().split("\0"):
+        if not entry:
+            continue
+        meta, path = entry.split("\t", 1)
+        _, kind, sha = meta.split()
+        if kind == "blob":
+            blobs.append((path, sha))
+    return blobs
+
+
+def read_blobs(git_dir, shas):
+    """Read the contents of blobs through one `git cat-file --batch`.
+
+    Parameters
+    ----------
+    git_dir : str
+        the path of the mirror
+    shas : list
+        the git blob SHAs to read
+
+    Returns
+    -------
+    dict
+        the content of each blob by SHA
+    """
+    if not shas:
+        return {}
+    out = _git(git_dir, "cat-file", "--batch",
+               stdin="".join(f"{sha}\n" for sha in shas).encode())
+    contents = {}
+    pos = 0
+    for sha in shas:
+        # each object is `<sha> <type> <size>\n<content>\n`
+        eol = out.index(b"\n", pos)
+        size = int(out[pos:eol].split()[2])
+        contents[sha] = out[eol + 1:eol + 1 + size]
+        pos = eol + 1 + size + 1
+    return contents
@@ -8,12 +8,8 @@ import requests
 import re
 
 from html.parser import HTMLParser
-from datetime import datetime
 from timeit import default_timer as timer
-from pathlib import Path
-from requests.exceptions import ConnectionError
-from requests.exceptions import SSLError
-from requests.exceptions import TooManyRedirects
+from ..utils.ledger import open_ledger
 
 
 class GoImportMetaHTMLParser(HTMLParser):
@@ -41,7 +37,7 @@ class GoImportMetaHTMLParser(HTMLParser):
 
     def feed(self, text):
         """Override to reset github name."""
-        self._gith_name = ""
+        self._github_name = ""
         super().feed(text)
 
     def handle_starttag(self, tag, attrs):
@@ -64,27 +60,6 @@ class GoImportMetaHTMLParser(HTMLParser):
                         self._github_name = comps[2][idx+2:]
 
 
-def _persist_progress(
-        module, github_name, fail_reason, base_dir, progress_file):
-    # persist mod info into files for later analysis
-    mod_file = f"{base_dir}/{progress_file}"
-    sub = Path(mod_file[0:-len(progress_file)])
-    sub.mkdir(parents=True, exist_ok=True)
-    if not Path(mod_file).exists():
-        with open(mod_file, 'w') as f:
-            f.write("module,github_name,fail_reason,last_updated\n")
-
-    with open(mod_file, 'a') as f:
-        f.write(
-            "%s,%s,%s,%s\n" % (
-                module,
-                github_name if github_name else '-',
-                fail_reason,
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            )
-        )
-
-
 def _parse_gopkgin_path(module):
     comps = module.split('/')
     user = None
@@ -99,12 +74,9 @@ def _parse_gopkgin_path(module):
     return user, pkg, ver
 
 
-# client is the Github instance
-# row is a row of Pandas DataFrame
-def _convert_name(parser, module, base_dir, progress_file, trace=False):
+def _convert_name(parser, module, trace=False):
     t0 = timer()
     github_name = ""
-    fail_reason = ""
     try:
         if trace:
             print(f"work on {module}")
@@ -119,29 +91,26 @@ def _convert_name(parser, module, base_dir, progress_file, trace=False):
             q = {"go-get": "1"}
             request_url = f"https://{module}"
             resp = requests.get(request_url, params=q, allow_redirects=True)
+            if resp.status_code == 429 or resp.status_code >= 500:
+                # the host failed to answer, which tells nothing of its meta
+                resp.raise_for_status()
             parser.feed(resp.text)
             github_name = parser.github_name
 
-    except ConnectionError as e:
-        fail_reason = "ConnectionError"
-        print(f"fail to convert {module} to github name due to {e}")
-    except SSLError as e:
-        fail_reason = "SSLError"
-        print(f"fail to convert {module} to github name due to {e}")
-    except TooManyRedirects as e:
-        fail_reason = "TooManyRedirects"
-        print(f"fail to convert {module} to github name due to {e}")
     except Exception as e:
-        print(type(e))
+        # e.g. ConnectionError, SSLError or TooManyRedirects, the ledger
+        # records the module failed with the error type and retries it
         print(f"fail to convert {module} to github name due to {e}")
-    finally:
-        _persist_progress(
-            module, github_name, fail_reason, base_dir, progress_file)
+        raise
 
     t1 = timer()
     if trace:
         print(f"Convert {module} to {github_name} took {t1-t0}s")
-    return github_name
+    return {
+        # only a host without go-import meta gives no github name
+        "github_name": github_name if github_name else '-',
+        "fail_reason": "",
+    }
 
 
 def convert_names(repo_csv_file, progress_file, trace=False):
@@ -152,7 +121,8 @@ def convert_names(repo_csv_file, progress_file, trace=False):
     repo_csv_file : str
         The import name list file
     progress_file : str
-        The name of .csv file to store progress
+        The name of .csv file to store progress, tracked in a `JobLedger`
+        next to it while converting
     trace : bool
         Whether to print tracing messages
 
@@ -162,26 +132,11 @@ def convert_names(repo_csv_file, progress_file, trace=False):
     """
     base_dir = "."
     parser = GoImportMetaHTMLParser()
-    to_check_df = pd.read_csv(repo_csv_file)
-
-    progress_path = f"{base_dir}/{progress_file}"
-    if Path(progress_path).exists():
-        checked_df = pd.read_csv(progress_path)
-        df2 = to_check_df.merge(checked_df, how="left", on="module")
-        # filter already processed repos, equivalent to SQL is null
-        df2 = df2.query("github_name != github_name")
-        if not df2.empty:
-            df2.apply(
-                lambda r: _convert_name(
-                    parser, r["module"], base_dir, progress_file, trace
-                ),
-                axis=1
-            )
-    else:
-        df2 = to_check_df
-        df2.apply(
-            lambda r: _convert_name(
-                parser, r["module"], base_dir, progress_file, trace
-            ),
-            axis=1
+    keys = list(pd.read_csv(repo_csv_file, usecols=["module"]).module)
+    with open_ledger(base_dir, progress_file, "module") as ledger:
+        for module in ledger.schedule(keys):
+            ledger.run(module, _convert_name, parser, module, trace)
+        ledger.export_csv(
+            f"{base_dir}/{progress_file}", "module",
+            ["github_name", "fail_reason"]
         )
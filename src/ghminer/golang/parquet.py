@@ -7,6 +7,10 @@ import pandas as pd
 from os import listdir
 from os.path import isfile, join
 from pathlib import Path
+from .store import BLOB_DIR
+from .store import blob_sha
+from .store import load_blob
+from .store import load_index
 
 
 def _load_gomod_content(gmod_path):
@@ -16,10 +20,41 @@ def _load_gomod_content(gmod_path):
     return ""
 
 
+def _load_indexed(base_dir, owner, repo, index, contents):
+    rows = []
+    for (version, sub_path), sha in index.items():
+        if sha not in contents:
+            # each distinct go.mod is read once
+            contents[sha] = load_blob(base_dir, sha).decode()
+        rows.append({
+            "repo": f"{owner}/{repo}",
+            "version": version,
+            "sub_path": sub_path,
+            "blob": sha,
+            "content": contents[sha],
+        })
+    return rows
+
+
+def _row(owner, repo, version, sub_path, gmod_path):
+    content = _load_gomod_content(gmod_path)
+    return {
+        "repo": f"{owner}/{repo}",
+        "version": version,
+        "sub_path": sub_path,
+        "blob": blob_sha(content.encode()),
+        "content": content,
+    }
+
+
 def save_as_parquet(base_dir="mod-info", dest_file="gomod.parquet"):
     """Save the `go.mod` files into a .parquet file.
 
-    The .parquet file is compressed using snappy.
+    The .parquet file is compressed using snappy. The `go.mod` files are
+    read through the blob index of each repository, see
+    `ghminer.golang.store`, the `blob` column tells which rows share one
+    file. Repositories fetched before the store was introduced are read
+    from their version directories.
 
     Parameters
     ----------
@@ -33,25 +68,27 @@ def save_as_parquet(base_dir="mod-info", dest_file="gomod.parquet"):
     None
     """
     dikt_list = []
+    contents = {}
     for owner in listdir(base_dir):
-        if isfile(join(base_dir, owner)):
+        if owner == BLOB_DIR or isfile(join(base_dir, owner)):
             continue
         for repo in listdir(join(base_dir, owner)):
             if isfile(join(base_dir, owner, repo)):
                 continue
+            index = load_index(base_dir, owner, repo)
+            if index:
+                dikt_list.extend(
+                    _load_indexed(base_dir, owner, repo, index, contents)
+                )
+                continue
             for version in listdir(join(base_dir, owner, repo)):
                 if isfile(join(base_dir, owner, repo, version)):
                     continue
                 gmod_path = join(base_dir, owner, repo, version, "go.mod")
                 if isfile(gmod_path):
-                    # parse go.mod
-                    content = _load_gomod_content(gmod_path)
-                    dikt_list.append({
-                        "repo": f"{owner}/{repo}",
-                        "version": version,
-                        "sub_path": "",
-                        "content": content,
-                    })
+                    dikt_list.append(
+                        _row(owner, repo, version, "", gmod_path)
+                    )
                 else:
                     for subdir in listdir(
                         join(base_dir, owner, repo, version)
@@ -63,14 +100,9 @@ def save_as_parquet(base_dir="mod-info", dest_file="gomod.parquet"):
                         gmod_path = join(
                             base_dir, owner, repo, version, subdir, "go.mod")
                         if isfile(gmod_path):
-                            # parse go.mod
-                            content = _load_gomod_content(gmod_path)
-                            dikt_list.append({
-                                "repo": f"{owner}/{repo}",
-                                "version": version,
-                                "sub_path": subdir,
-                                "content": content,
-                            })
+                            dikt_list.append(
+                                _row(owner, repo, version, subdir, gmod_path)
+                            )
 
     df = pd.DataFrame(dikt_list)
     df.to_parquet(dest_file, compression="snappy", index=False)
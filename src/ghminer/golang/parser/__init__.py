@@ -26,17 +26,29 @@ def _prepare_csv(deps_file="dependencies.csv"):
             f.write("full_name,public_name,version,dep_module,dep_version\n")
 
 
-def _parse_record(row, f):
-    mod = GoMod(row["content"])
-    deps = [
+def _parse_deps(content):
+    mod = GoMod(content)
+    return [
         (mod.module_path, req.module, req.version)
         for req in mod.requires if not req.indirect
     ]
+
+
+def _parse_record(row, f, parsed):
+    # rows sharing a go.mod blob are parsed once
+    key = row["blob"] if "blob" in row else None
+    if key is None or key not in parsed:
+        deps = _parse_deps(row["content"])
+        if key is not None:
+            parsed[key] = deps
+    else:
+        deps = parsed[key]
     persist_deps(row["repo"], row["version"], deps, f)
 
 
 def parse_deps_from_parquet(parquet_file, deps_file, trace=False):
     df = pd.read_parquet(parquet_file)
     _prepare_csv(deps_file)
+    parsed = {}
     with open(deps_file, 'a') as f:
-        df.apply(lambda row: _parse_record(row, f), axis=1)
+        df.apply(lambda row: _parse_record(row, f, parsed), axis=1)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Content-addressed store of `go.mod` files.
+
+Most tags of a repository share a byte-identical `go.mod`. Each distinct
+file is stored once under its git blob SHA in `{base_dir}/_blobs/`, and a
+per repository index in `{base_dir}/{owner}/{repo}/gomod.index` maps every
+version and sub path to its blob.
+
+"""
+
+import hashlib
+import json
+
+from pathlib import Path
+from ..utils.common import atomic_path
+
+# directory of the blobs under the base directory, no GitHub login starts
+# with an underscore
+BLOB_DIR = "_blobs"
+# index of the blobs of each repository
+INDEX_FILE = "gomod.index"
+
+
+def blob_sha(content):
+    """Compute the git blob SHA of `content`.
+
+    Parameters
+    ----------
+    content : bytes
+        the content of the file
+
+    Returns
+    -------
+    str
+        the SHA as git computes it for a blob, 40 hex digits
+    """
+    header = f"blob {len(content)}\0".encode()
+    return hashlib.sha1(header + content).hexdigest()
+
+
+def blob_path(base_dir, sha):
+    """Return the path of the blob `sha` under `base_dir`."""
+    return f"{base_dir}/{BLOB_DIR}/{sha[:2]}/{sha}"
+
+
+def has_blob(base_dir, sha):
+    """Tell whether the blob `sha` is stored under `base_dir`."""
+    return Path(blob_path(base_dir, sha)).exists()
+
+
+def store_blob(base_dir, content, sha=None):
+    """Store `content` unless a blob with the same SHA is stored already.
+
+    Parameters
+    ----------
+    base_dir : str
+        the base directory of the store
+    content : bytes
+        the content of the file
+    sha : str
+        the git blob SHA of `content` if known, e.g. from the API
+
+    Returns
+    -------
+    str
+        the git blob SHA of `content`
+    """
+    sha = sha or blob_sha(content)
+    path = blob_path(base_dir, sha)
+    if not has_blob(base_dir, sha):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with atomic_path(path) as tmp:
+            with open(tmp, 'wb') as f:
+                f.write(content)
+    return sha
+
+
+def load_blob(base_dir, sha):
+    """Load the content of the blob `sha`, see `store_blob`."""
+    with open(blob_path(base_dir, sha), 'rb') as f:
+        return f.read()
+
+
+def load_index(base_dir, owner, repo_name):
+    """Load the blob index of given repository.
+
+    A line torn by a crash during `add_index` is skipped, its version is
+    indexed again by the next run.
+
+    Parameters
+    ----------
+    base_dir : str
+        the base directory of the store
+    owner : str
+        the owner of the repository
+    repo_name : str
+        the name of the repository w/o owner
+
+    Returns
+    -------
+    dict
+        the blob SHA of each (version, sub_path), empty if none is indexed
+    """
+    index = {}
+    path = Path(f"{base_dir}/{owner}/{repo_name}/{INDEX_FILE}")
+    if path.exists():
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                for sub_path, sha in entry["mods"].items():
+                    index[(entry["version"], sub_path)] = sha
+    return index
+
+
+def add_index(base_dir, owner, repo_name, version, mods):
+    """Record the blobs of the `go.mod` files of `version`.
+
+    All modules of a version are appended in one line, once their blobs
+    are stored, a version is indexed either completely or not at all. A
+    later entry of the same version and sub path takes precedence.
+
+    Parameters
+    ----------
+    base_dir : str
+        the base directory of the store
+    owner : str
+        the owner of the repository
+    repo_name : str
+        the name of the repository w/o owner
+    version : str
+        the version, i.e. tag or branch
+    mods : dict
+        the git blob SHA of each sub path
+
+    Returns
+    -------
+    None
+    """
+    path = Path(f"{base_dir}/{owner}/{repo_name}/{INDEX_FILE}")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a+b') as f:
+        line = json.dumps({"version": version, "mods": mods}) + "\n"
+        if f.tell() > 0:
+            f.seek(-1, 2)
+            if f.read(1) != b"\n":
+                # a line torn by a crash is ended before the new one
+                line = "\n" + line
+        f.write(line.encode())
@@ -8,13 +8,23 @@ from .comment import (
     grab_comments,
 )
 
+from .issue import (
+    grab_issues,
+)
+
 
 from .repository import (
     collect_data,
 )
 
+from .refresh import (
+    refresh_repos,
+)
+
 __all__ = [
     "collect_data",
     "grab_commits",
     "grab_comments",
+    "grab_issues",
+    "refresh_repos",
 ]
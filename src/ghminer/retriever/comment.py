@@ -5,20 +5,52 @@
 import json
 import pandas as pd
 
-from github import Github
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+from github import GithubObject
+from github import RateLimitExceededException
+from isodate import parse_datetime
 from timeit import default_timer as timer
 from pathlib import Path
-from ..utils import load_access_token
+from ..utils import default_pool
 from ..utils import load_repo_info
+from ..utils.common import iterate_page_lists
+from ..utils.common import load_state
+from ..utils.common import remove_file
+from ..utils.common import save_checkpoint
+from ..utils.common import save_state
+from ..utils.common import truncate_file
+from ..utils.ledger import open_ledger
+from ..utils.parts import fetch_parts
+from ..utils.parts import has_plan
+from ..utils.parts import load_plan
+from ..utils.parts import part_count
+from ..utils.parts import remove_parts
+from ..utils.parts import stitch_parts
+from ..utils.ratelimit import AdaptiveConcurrency
+from ..utils.ratelimit import QuotaScheduler
+from ..utils.ratelimit import limited_call
 
 
-def _load_partial_comments(repo, trace=False):
+# full fetches from this size on are fetched window by window concurrently
+LARGE_HISTORY = 20000
+# comments per concurrently fetched window
+PART_COMMENTS = 2000
+# count probes placing the window bounds, comments cluster in time
+GRID_POINTS = 16
+
+
+def _load_partial_comments(repo, since=None, trace=False):
     try:
+        # oldest first, so that a checkpoint is a point in time
         comment_page = repo.get_issues_comments(
-            sort='updated', direction='desc'
+            sort='updated', direction='asc',
+            since=parse_datetime(since) if since else GithubObject.NotSet
         )
         return (True, comment_page)
+    except RateLimitExceededException:
+        raise
     except Exception as e:
         if trace:
             print("Fail to load comments of %s due to: %s" % (
@@ -28,47 +60,206 @@ def _load_partial_comments(repo, trace=False):
         return (False, None)
 
 
-def persist_progress(
-        owner, repo_name, comments, base_dir, progress_file):
-    """Save the progress of comment retrieval for resumption."""
-    path = f"{base_dir}/{progress_file}"
-    sub = Path(path[0:-len(progress_file)])
-    sub.mkdir(parents=True, exist_ok=True)
-    if not Path(path).exists():
-        with open(path, 'w') as f:
-            f.write("full_name,comments,last_updated\n")
-
-    with open(path, 'a') as f:
-        f.write("%s/%s,%s,%s\n" % (
-            owner,
-            repo_name,
-            comments,
-            datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+def _walk_comments(page, fh_json, since, seen, limiter=None, until=None):
+    """Write comments updated before `until`, yield the state per page."""
+    fetched = 0
+    for items in iterate_page_lists(page, limiter):
+        done = False
+        for c in items:
+            raw_data = vars(c).get("_rawData", None)
+            if not raw_data or raw_data["id"] in seen:
+                continue
+            if until and raw_data["updated_at"] >= until:
+                done = True
+                break
+            fetched += 1
+            _write_json(fh_json, raw_data)
+            if raw_data["updated_at"] != since:
+                # `since` is inclusive, remember what was written at the
+                # last update time
+                since = raw_data["updated_at"]
+                seen = set()
+            seen.add(raw_data["id"])
+        yield fetched, since, seen
+        if done:
+            return
+
+
+def _format_time(dt):
+    return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _fetch_part(pool, owner, repo_name, limiter, trace, job, fh_json):
+    _, start, end = job
+    # the repository is bound to the client of this thread
+    repo = limited_call(
+        limiter, load_repo_info, pool.client(), f"{owner}/{repo_name}"
+    )
+    meta = {"fetched": 0, "since": None, "ids": []}
+    ok, page = _load_partial_comments(repo, start, trace)
+    if ok:
+        for fetched, since, seen in _walk_comments(
+                page, fh_json, None, set(), limiter, end):
+            meta = {
+                "fetched": fetched, "since": since, "ids": sorted(seen),
+            }
+    return meta
+
+
+def _count_since(pool, full_name, limiter, trace, since):
+    # the probes run concurrently, each on the client of its thread, the
+    # lazy repository costs no call
+    repo = pool.client().get_repo(full_name, lazy=True)
+    ok, page = _load_partial_comments(repo, _format_time(since), trace)
+    return limited_call(limiter, lambda: page.totalCount) if ok else 0
+
+
+def _plan_windows(
+        pool, full_name, created_at, total, windows, executor, limiter,
+        trace):
+    """Split the update times into windows of about equal comment count."""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    step = (now - created_at) / GRID_POINTS
+    points = [created_at + step * i for i in range(GRID_POINTS + 1)]
+    counts = list(executor.map(
+        partial(_count_since, pool, full_name, limiter, trace),
+        points[1:-1]
+    ))
+    # the number of comments updated before each point
+    before = [0] + sorted(total - c for c in counts) + [total]
+    bounds = [created_at]
+    i = 1
+    for k in range(1, windows):
+        target = total * k / windows
+        while i < GRID_POINTS and before[i] < target:
+            i += 1
+        frac = (target - before[i - 1]) / max(1, before[i] - before[i - 1])
+        bounds.append(points[i - 1] + (points[i] - points[i - 1]) * frac)
+    bounds = list(dict.fromkeys(_format_time(b) for b in bounds))
+    # the last window is open, comments updated meanwhile are kept
+    return [
+        (i, b, bounds[i + 1] if i + 1 < len(bounds) else None)
+        for i, b in enumerate(bounds)
+    ]
+
+
+def _load_comments_parallel(
+        repo, total, jsons_file, window_workers, limiter, trace):
+    owner, repo_name = repo.full_name.split('/')
+    pool = default_pool()
+    with ThreadPoolExecutor(max_workers=window_workers) as executor:
+        jobs = load_plan(jsons_file, partial(
+            _plan_windows, pool, repo.full_name,
+            repo.created_at.replace(tzinfo=None), total,
+            part_count(total, PART_COMMENTS, window_workers), executor,
+            limiter, trace
         ))
+        fetch = partial(
+            _fetch_part, pool, owner, repo_name, limiter, trace
+        )
+        metas = fetch_parts(jsons_file, jobs, fetch, executor)
+
+    # stitch the windows back together in chronological order
+    comments = 0
+    since = None
+    ids = []
+    with open(jsons_file, 'w') as fh_json:
+        fh_json.write("\n")
+        stitch_parts(jsons_file, jobs, fh_json)
+    for meta in metas:
+        comments += meta["fetched"]
+        if meta["since"]:
+            since = meta["since"]
+            ids = meta["ids"]
+    remove_parts(jsons_file)
+    return comments, since, ids
 
 
-def load_comments(client, owner, repo_name, base_dir, trace=False):
-    """Load comment objects for given repository."""
-    repo = load_repo_info(client, f"{owner}/{repo_name}")
+def load_comments(
+        client, owner, repo_name, base_dir, trace=False, limiter=None,
+        incremental=False, window_workers=1):
+    """Load comment objects for given repository.
+
+    Every API call goes through the optional `limiter`, see
+    `QuotaScheduler`.
+
+    Comments are fetched by ascending update time and the last update
+    time is recorded in `comments.state`. In incremental mode only the
+    comments updated since are fetched and appended, an edited comment is
+    appended again with its new content.
+
+    When `window_workers` is above one, a full fetch of at least
+    `LARGE_HISTORY` comments is split into windows of update time which
+    are fetched concurrently and stitched back in chronological order.
+
+    A checkpoint is saved in `comments.checkpoint` after each page, or a
+    marker per window of a concurrent fetch. A run interrupted by a crash
+    cuts `comments.json` back to the last complete page and resumes from
+    its update time, skipping the comments already written.
+    """
+    repo = limited_call(
+        limiter, load_repo_info, client, f"{owner}/{repo_name}"
+    )
     if not repo:
-        return '', 0
+        return 0
     else:
-        comments = 0
         jsons_file = f"{base_dir}/{owner}/{repo_name}/comments.json"
+        state_file = f"{base_dir}/{owner}/{repo_name}/comments.state"
+        checkpoint_file = (
+            f"{base_dir}/{owner}/{repo_name}/comments.checkpoint"
+        )
         sub = Path(jsons_file[0:-len('comments.json')])
         sub.mkdir(parents=True, exist_ok=True)
-        with open(jsons_file, 'w') as fh_json:
-            fh_json.write("\n")
+        checkpoint = load_state(checkpoint_file)
+        state = load_state(state_file) if incremental else None
+        if checkpoint:
+            truncate_file(jsons_file, checkpoint["offset"])
+            state = checkpoint
+        elif not state:
+            with open(jsons_file, 'w') as fh_json:
+                fh_json.write("\n")
+        comments = state["comments"] if state else 0
+        since = state["since"] if state else None
+        seen = set(state["ids"]) if state else set()
 
-        with open(jsons_file, 'a') as fh_json:
-            ok, page = _load_partial_comments(repo, trace)
+        total = 0
+        if has_plan(jsons_file):
+            # an interrupted concurrent fetch
+            total = LARGE_HISTORY
+        elif window_workers > 1 and not state:
+            ok, page = _load_partial_comments(repo, None, trace)
+            # one call, the count comes from the last page link
             if ok:
-                comments += page.totalCount
-                for c in page:
-                    raw_data = vars(c).get("_rawData", None)
-                    if raw_data:
-                        _write_json(fh_json, raw_data)
+                total = limited_call(limiter, lambda: page.totalCount)
+        if total >= LARGE_HISTORY:
+            if trace:
+                print(f"Fetch {total} comments of {owner}/{repo_name} with "
+                      f"{window_workers} window workers")
+            comments, since, seen = _load_comments_parallel(
+                repo, total, jsons_file, window_workers, limiter, trace
+            )
+        else:
+            with open(jsons_file, 'a') as fh_json:
+                ok, page = _load_partial_comments(repo, since, trace)
+                if ok:
+                    # count while paging, totalCount costs an extra call
+                    base = comments
+                    for fetched, since, seen in _walk_comments(
+                            page, fh_json, since, seen, limiter):
+                        comments = base + fetched
+                        save_checkpoint(checkpoint_file, fh_json, {
+                            "comments": comments,
+                            "since": since,
+                            "ids": sorted(seen),
+                        })
 
+        if since is not None:
+            save_state(state_file, {
+                "since": since,
+                "ids": sorted(seen),
+                "comments": comments,
+            })
+        remove_file(checkpoint_file)
         return comments
 
 
@@ -77,47 +268,54 @@ def _write_json(fh, raw_data):
 
 
 # client is the Github instance
-# row is a row of Pandas DataFrame
-def _do_comment_fetch(client, row, base_dir, progress_file, trace=False):
-    comps = row['full_name'].split('/')
+def _do_comment_fetch(
+        client, full_name, base_dir, trace=False, limiter=None,
+        incremental=False, window_workers=1):
+    comps = full_name.split('/')
     owner = comps[0]
     name = comps[1]
 
     t0 = timer()
     comments = load_comments(
-        client, owner, name, base_dir, trace
-    )
-    persist_progress(
-        owner, name, comments, base_dir, progress_file
+        client, owner, name, base_dir, trace, limiter, incremental,
+        window_workers
     )
     t1 = timer()
     if trace:
         print(f"Grab comments for {owner}/{name} took {t1-t0}s")
-    return comments
-
-
-def grab_comments(repo_csv_file, base_dir, progress_file, trace=False):
-    """Load comment objects for repositories specified in `repo_csv_file`."""
-    client = Github(load_access_token(), per_page=100)
-    to_check_df = pd.read_csv(repo_csv_file)
-
-    progress_path = f"{base_dir}/{progress_file}"
-    if Path(progress_path).exists():
-        checked_df = pd.read_csv(progress_path)
-        df2 = to_check_df.merge(checked_df, how="left", on="full_name")
-        # filter already processed repos, equivalent to SQL is null
-        df2 = df2.query("comments != comments")
-        df2.apply(
-            lambda r: _do_comment_fetch(
-                client, r, base_dir, progress_file, trace
-            ),
-            axis=1
-        )
-    else:
-        df2 = to_check_df
-        df2.apply(
-            lambda r: _do_comment_fetch(
-                client, r, base_dir, progress_file, trace
-            ),
-            axis=1
+    return {"comments": comments}
+
+
+def grab_comments(
+        repo_csv_file, base_dir, progress_file, trace=False,
+        incremental=False, window_workers=1):
+    """Load comment objects for repositories specified in `repo_csv_file`.
+
+    When the quota runs out the retrieval pauses until it resets, a
+    repository is only recorded as done once all of its comments are
+    fetched. The progress is tracked in a `JobLedger` next to
+    `progress_file`, the results are exported to `progress_file` at the
+    end.
+
+    In incremental mode every repository is revisited and only the
+    comments updated since the previous run are appended. Very large
+    repositories are fetched with up to `window_workers` threads, see
+    `load_comments`.
+    """
+    pool = default_pool()
+    scheduler = QuotaScheduler(
+        pool, concurrency=AdaptiveConcurrency(window_workers, trace=trace),
+        trace=trace
+    )
+    keys = list(pd.read_csv(repo_csv_file, usecols=["full_name"]).full_name)
+    with open_ledger(base_dir, progress_file, "full_name") as ledger:
+        if incremental:
+            ledger.reset(keys, if_idle=True)
+        for full_name in ledger.schedule(keys):
+            ledger.run(
+                full_name, _do_comment_fetch, pool.client(), full_name,
+                base_dir, trace, scheduler, incremental, window_workers
+            )
+        ledger.export_csv(
+            f"{base_dir}/{progress_file}", "full_name", ["comments"]
         )
@@ -4,21 +4,81 @@
 
 import json
 import pandas as pd
+import shutil
 
-from github import Github
-from datetime import datetime
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from functools import partial
+from io import StringIO
+from datetime import date, datetime, timedelta, timezone
+from github import RateLimitExceededException
+from isodate import parse_datetime
 from timeit import default_timer as timer
 from pathlib import Path
-from ..utils import load_access_token
+from ..utils import default_pool
 from ..utils import load_repo_info
-from ..utils.common import daterange
+from ..utils.common import atomic_path
 from ..utils.common import convert_iso_date
+from ..utils.common import daterange
+from ..utils.common import iterate_pages
+from ..utils.common import load_state
+from ..utils.common import remove_file
+from ..utils.common import save_checkpoint
+from ..utils.common import save_state
+from ..utils.common import truncate_file
+from ..utils.graphql import not_found
+from ..utils.graphql import run_query
+from ..utils.ledger import LEASE_BATCH
+from ..utils.ledger import open_ledger
+from ..utils.parts import fetch_parts
+from ..utils.parts import has_plan
+from ..utils.parts import load_plan
+from ..utils.parts import part_count
+from ..utils.parts import remove_parts
+from ..utils.parts import stitch_parts
+from ..utils.ratelimit import AdaptiveConcurrency
+from ..utils.ratelimit import CORE_BURST
+from ..utils.ratelimit import CORE_QUOTA
+from ..utils.ratelimit import QuotaScheduler
+from ..utils.ratelimit import TokenBucket
+from ..utils.ratelimit import limited_call
+
+# bounds and initial size of the commit time window in days
+MIN_SLICE = 1
+MAX_SLICE = 3650
+INITIAL_SLICE = 30
+# commits a window should hold, a few pages keep the window meaningful
+TARGET_COMMITS = 500
+
+# full histories from this size on are fetched window by window concurrently
+LARGE_HISTORY = 50000
+# commits per concurrently fetched window
+PART_COMMITS = 5000
+
+CSV_HEADER = "full_name,branch,sha,author_name,author_date,verified\n"
+
+
+def _next_slice(slice, commits, target=TARGET_COMMITS):
+    """Size the next window after the density of the current one.
+
+    Empty windows quadruple the size, other windows scale towards `target`
+    commits, by a factor between 1/4 and 4 to damp bursts of activity.
+    """
+    if commits == 0:
+        factor = 4
+    else:
+        factor = min(4, max(0.25, target / commits))
+    return int(min(MAX_SLICE, max(MIN_SLICE, slice * factor)))
 
 
 def _load_partial_commits(repo, branch, start, end, trace=False):
     try:
         commit_page = repo.get_commits(sha=branch, since=start, until=end)
         return (True, commit_page)
+    except RateLimitExceededException:
+        raise
     except Exception as e:
         if trace:
             print("Fail to load commits of %s/@%s due to: %s" % (
@@ -29,30 +89,161 @@ def _load_partial_commits(repo, branch, start, end, trace=False):
         return (False, None)
 
 
-def persist_progress(
-        owner, repo_name, default_branch, commits,
-        base_dir="commit-info", progress_file="progress.csv"):
-    """Save the progress of commit retrieval for resumption."""
-    path = f"{base_dir}/{progress_file}"
-    sub = Path(path[0:-len(progress_file)])
-    sub.mkdir(parents=True, exist_ok=True)
-    if not Path(path).exists():
-        with open(path, 'w') as f:
-            f.write("full_name,default_branch,commits,last_updated\n")
-
-    with open(path, 'a') as f:
-        f.write("%s/%s,%s,%s,%s\n" % (
-            owner,
-            repo_name,
-            default_branch,
-            commits,
-            datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        ))
-
-
-def load_commits(client, owner, repo_name, base_dir, trace=False):
-    """Load commit objects for given repository."""
-    repo = load_repo_info(client, f"{owner}/{repo_name}")
+def _committer_date(raw_data):
+    cmit = raw_data.get("commit", None) or {}
+    committer = cmit.get("committer", None) or {}
+    if not committer.get("date", None):
+        return None
+    dt = parse_datetime(committer["date"])
+    if dt.tzinfo:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _newer(newest, shas, dt, dt_shas):
+    """Merge the commits at `dt` into the newest ones seen so far.
+
+    All commits sharing the newest committer date are kept, an inclusive
+    `since` of the next run returns every one of them again.
+    """
+    if dt is None:
+        return newest, shas
+    if newest is None or dt > newest:
+        return dt, list(dt_shas)
+    if dt == newest:
+        return newest, shas + [sha for sha in dt_shas if sha not in shas]
+    return newest, shas
+
+
+def _walk_window(
+        repo, owner, repo_name, branch, since, until, fh_json, fh_csv,
+        skip_shas=(), limiter=None, trace=False):
+    """Write the commits of one window, return count and newest commits."""
+    fetched = 0
+    newest = None
+    newest_shas = []
+    ok, page = _load_partial_commits(repo, branch, since, until, trace)
+    if not ok:
+        return fetched, newest, newest_shas
+    # count while paging, totalCount costs an extra call
+    for c in iterate_pages(page, limiter):
+        raw_data = vars(c).get("_rawData", None)
+        if raw_data and raw_data.get("sha") in skip_shas:
+            continue
+        fetched += 1
+        if raw_data:
+            newest, newest_shas = _newer(
+                newest, newest_shas, _committer_date(raw_data),
+                [raw_data.get("sha", "")]
+            )
+            _write_csv(fh_csv, owner, repo_name, branch, raw_data)
+            _write_json(fh_json, raw_data)
+    return fetched, newest, newest_shas
+
+
+def _format_date(dt):
+    return dt.strftime('%Y-%m-%d %H:%M:%S') if dt else None
+
+
+def _parse_date(text):
+    return datetime.strptime(text, '%Y-%m-%d %H:%M:%S') if text else None
+
+
+def _day_bounds(start, end):
+    s = datetime(start.year, start.month, start.day, 0, 0, 0)
+    e = datetime(end.year, end.month, end.day, 23, 59, 59)
+    return s, e
+
+
+def _fetch_part(
+        pool, owner, repo_name, branch, limiter, trace, job, fh_json):
+    _, start, end = job
+    # the repository is bound to the client of this thread
+    repo = limited_call(
+        limiter, load_repo_info, pool.client(), f"{owner}/{repo_name}"
+    )
+    s, e = _day_bounds(date.fromisoformat(start), date.fromisoformat(end))
+    fh_csv = StringIO()
+    fetched, dt, shas = _walk_window(
+        repo, owner, repo_name, branch, s, e,
+        fh_json, fh_csv, limiter=limiter, trace=trace
+    )
+    return {
+        "fetched": fetched,
+        "date": _format_date(dt),
+        "shas": shas,
+        "csv": fh_csv.getvalue(),
+    }
+
+
+def _plan_days(start_date, end_date, total, window_workers):
+    windows = part_count(total, PART_COMMITS, window_workers)
+    slice = max(1, -(-((end_date - start_date).days + 1) // windows))
+    return [
+        (i, t[0].isoformat(), t[1].isoformat())
+        for i, t in enumerate(daterange(start_date, end_date, slice))
+    ]
+
+
+def _load_commits_parallel(
+        owner, repo_name, branch, start_date, end_date, total, jsons_file,
+        csvs_file, window_workers, limiter, trace):
+    jobs = load_plan(jsons_file, partial(
+        _plan_days, start_date, end_date, total, window_workers
+    ))
+    fetch = partial(
+        _fetch_part, default_pool(), owner, repo_name, branch, limiter,
+        trace
+    )
+    with ThreadPoolExecutor(max_workers=window_workers) as executor:
+        metas = fetch_parts(jsons_file, jobs, fetch, executor)
+
+    # stitch the windows back together in chronological order
+    commits = 0
+    newest = None
+    newest_shas = []
+    # both files are rewritten, a stitch interrupted by a crash is redone
+    with open(jsons_file, 'w') as fh_json, open(csvs_file, 'w') as fh_csv:
+        fh_json.write("\n")
+        stitch_parts(jsons_file, jobs, fh_json)
+        for meta in metas:
+            fh_csv.write(meta["csv"])
+            commits += meta["fetched"]
+            newest, newest_shas = _newer(
+                newest, newest_shas, _parse_date(meta["date"]), meta["shas"]
+            )
+    remove_parts(jsons_file)
+    return commits, newest, newest_shas
+
+
+def load_commits(
+        client, owner, repo_name, base_dir, trace=False, incremental=False,
+        limiter=None, window_workers=1):
+    """Load commit objects for given repository.
+
+    The history is walked in time windows whose size adapts to the observed
+    commit density, growing over quiet periods and shrinking over busy ones.
+    The newest fetched commits, those sharing the newest committer date,
+    are recorded in `commits.state` next to `commits.json`. In incremental
+    mode only the commits since that date are fetched and appended, the
+    recorded ones are skipped. A changed default branch is fetched in full
+    again. Commits landing on the branch with an
+    older committer date, e.g. fast-forward merges of old work, are not
+    seen by an incremental run. Every API call goes through the optional
+    `limiter`, see `QuotaScheduler`.
+
+    When `window_workers` is above one, a full fetch of a history with at
+    least `LARGE_HISTORY` commits is split into fixed windows which are
+    fetched concurrently and stitched back in chronological order.
+
+    After each window a checkpoint is saved in `commits.checkpoint`, or a
+    marker per window of a concurrent fetch. A run interrupted by a crash
+    resumes after the last complete window, the commits written after it
+    are cut from `commits.json` first.
+    """
+    repo = limited_call(
+        limiter, load_repo_info, client, f"{owner}/{repo_name}"
+    )
     if not repo:
         return '', 0
     else:
@@ -61,46 +252,311 @@ def load_commits(client, owner, repo_name, base_dir, trace=False):
         # get repo creation date
         start_date = repo.created_at.date()
         end_date = datetime.now().date()
-        slice = 30
 
         jsons_file = f"{base_dir}/{owner}/{repo_name}/commits.json"
+        csvs_file = f"{base_dir}/{owner}/{repo_name}/commits.csv"
         sub = Path(jsons_file[0:-len('commits.json')])
         sub.mkdir(parents=True, exist_ok=True)
-        with open(jsons_file, 'w') as fh_json:
-            fh_json.write("\n")
-
-        # persist mod info into files for later analysis
-        csv_file = f"{base_dir}/commits.csv"
-        sub = Path(csv_file[0:-len('commits.csv')])
-        sub.mkdir(parents=True, exist_ok=True)
-        if not Path(csv_file).exists():
-            with open(csv_file, 'w') as f:
-                f.write(
-                    "full_name,branch,sha,author_name,author_date,verified\n"
-                )
+        state_file = f"{base_dir}/{owner}/{repo_name}/commits.state"
+        checkpoint_file = (
+            f"{base_dir}/{owner}/{repo_name}/commits.checkpoint"
+        )
+        checkpoint = load_state(checkpoint_file)
+        state = load_state(state_file) if incremental else None
+        if checkpoint and checkpoint.get("branch", None) != default_branch:
+            # the default branch changed, start over with a full fetch
+            checkpoint = None
+            state = None
+        slice = INITIAL_SLICE
+        if checkpoint:
+            # resume after the last window of the interrupted run
+            truncate_file(jsons_file, checkpoint["offset"])
+            truncate_file(csvs_file, checkpoint["csv_offset"])
+            state = None
+            commits = checkpoint["commits"]
+            newest = _parse_date(checkpoint["date"])
+            newest_shas = checkpoint["shas"]
+            start_date = date.fromisoformat(checkpoint["start"])
+            slice = checkpoint["slice"]
+        elif state and state.get("branch", None) == default_branch:
+            commits = state["commits"]
+            newest = _parse_date(state["date"])
+            newest_shas = state["shas"]
+            start_date = newest.date()
+        else:
+            # a full fetch rewrites the files, also when the default
+            # branch changed
+            state = None
+            newest = None
+            newest_shas = []
+            with open(jsons_file, 'w') as fh_json:
+                fh_json.write("\n")
+            with open(csvs_file, 'w'):
+                pass
+        # the commits at the newest date of the previous run come again
+        skip_shas = set(
+            checkpoint["skip_shas"] if checkpoint else newest_shas
+        )
 
-        with open(jsons_file, 'a') as fh_json:
-            with open(csv_file, 'a') as fh_csv:
-                for t in daterange(start_date, end_date, slice):
-                    s = datetime(t[0].year, t[0].month, t[0].day, 0, 0, 0)
-                    e = datetime(t[1].year, t[1].month, t[1].day, 23, 59, 59)
-                    ok, page = _load_partial_commits(
-                        repo, default_branch, s, e, trace
+        total = 0
+        if has_plan(jsons_file):
+            # an interrupted concurrent fetch
+            total = LARGE_HISTORY
+        elif window_workers > 1 and not state and not checkpoint:
+            # one call, the count comes from the last page link
+            history = repo.get_commits(sha=default_branch)
+            total = limited_call(limiter, lambda: history.totalCount)
+        if total >= LARGE_HISTORY:
+            if trace:
+                print(f"Fetch {total} commits of {owner}/{repo_name} with "
+                      f"{window_workers} window workers")
+            commits, newest, newest_shas = _load_commits_parallel(
+                owner, repo_name, default_branch, start_date, end_date,
+                total, jsons_file, csvs_file, window_workers, limiter,
+                trace
+            )
+        else:
+            with open(jsons_file, 'a') as fh_json, \
+                    open(csvs_file, 'a') as fh_csv:
+                start = start_date
+                while start <= end_date:
+                    end = min(start + timedelta(slice - 1), end_date)
+                    s, e = _day_bounds(start, end)
+                    if state and start == start_date:
+                        # `since` is inclusive, the newest commits come again
+                        s = newest
+                    fetched, dt, shas = _walk_window(
+                        repo, owner, repo_name, default_branch, s, e,
+                        fh_json, fh_csv, skip_shas, limiter, trace
+                    )
+                    newest, newest_shas = _newer(
+                        newest, newest_shas, dt, shas
                     )
-                    if ok:
-                        commits += page.totalCount
-                        for c in page:
-                            raw_data = vars(c).get("_rawData", None)
-                            if raw_data:
-                                _write_csv(
-                                    fh_csv, owner, repo_name,
-                                    default_branch, raw_data
-                                )
-                                _write_json(fh_json, raw_data)
+                    commits += fetched
+                    slice = _next_slice(slice, fetched)
+                    start = end + timedelta(1)
+                    save_checkpoint(checkpoint_file, fh_json, {
+                        "branch": default_branch,
+                        "start": start.isoformat(),
+                        "slice": slice,
+                        "shas": newest_shas,
+                        "date": _format_date(newest),
+                        "commits": commits,
+                        "skip_shas": sorted(skip_shas),
+                    }, fh_csv)
 
+        if newest is not None:
+            save_state(state_file, {
+                "branch": default_branch,
+                "shas": newest_shas,
+                "date": _format_date(newest),
+                "commits": commits,
+            })
+        remove_file(checkpoint_file)
         return default_branch, commits
 
 
+_HISTORY_QUERY = """
+query {
+    repository(owner: %s, name: %s) {
+        defaultBranchRef {
+            name
+            target {
+                ... on Commit {
+                    history(first: 100%s%s) {
+                        pageInfo {
+                            hasNextPage
+                            endCursor
+                        }
+                        nodes {
+                            oid
+                            message
+                            additions
+                            deletions
+                            author { name email date }
+                            committer { name email date }
+                            signature { isValid state }
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+"""
+
+
+def _history_query(owner, repo_name, cursor, since):
+    return _HISTORY_QUERY % (
+        json.dumps(owner),
+        json.dumps(repo_name),
+        f", after: {json.dumps(cursor)}" if cursor else "",
+        f", since: {json.dumps(since)}" if since else "",
+    )
+
+
+def _to_rest_shape(node):
+    # mimic the REST payload so that the parsers keep working
+    signature = node.get("signature", None)
+    return {
+        "sha": node["oid"],
+        "commit": {
+            "author": node["author"],
+            "committer": node["committer"],
+            "message": node["message"],
+            "verification": {
+                "verified": bool(signature and signature["isValid"]),
+                "reason": signature["state"].lower()
+                if signature else "unsigned",
+            },
+        },
+        "stats": {
+            "additions": node["additions"],
+            "deletions": node["deletions"],
+            "total": node["additions"] + node["deletions"],
+        },
+    }
+
+
+def load_commits_graphql(
+        owner, repo_name, base_dir, trace=False, incremental=False,
+        limiter=None):
+    """Load commit objects for given repository through GraphQL.
+
+    The default branch history is paged 100 commits per query with a
+    projected field set, no time windows and no count probes are needed.
+    The output is the same `commits.json`, `commits.state` and
+    `commits.csv` as `load_commits` produces, and the checkpoint saved in
+    `commits.checkpoint` after each page lets an interrupted run resume
+    from the page cursor. A failed query is raised, a rerun resumes there.
+    """
+    jsons_file = f"{base_dir}/{owner}/{repo_name}/commits.json"
+    csvs_file = f"{base_dir}/{owner}/{repo_name}/commits.csv"
+    sub = Path(jsons_file[0:-len('commits.json')])
+    sub.mkdir(parents=True, exist_ok=True)
+    state_file = f"{base_dir}/{owner}/{repo_name}/commits.state"
+    checkpoint_file = f"{base_dir}/{owner}/{repo_name}/commits.checkpoint"
+    checkpoint = load_state(checkpoint_file)
+    state = load_state(state_file) if incremental else None
+
+    since = None
+    cursor = None
+    has_next = True
+    commits = 0
+    newest = None
+    newest_shas = []
+    skip_shas = set()
+    default_branch = ""
+    mode = 'w'
+    if checkpoint:
+        # resume after the last page of the interrupted run
+        truncate_file(jsons_file, checkpoint["offset"])
+        truncate_file(csvs_file, checkpoint["csv_offset"])
+        state = checkpoint
+        cursor = checkpoint["cursor"]
+        since = checkpoint["since"]
+        commits = checkpoint["commits"]
+        newest_shas = checkpoint["shas"]
+        newest = _parse_date(checkpoint["date"])
+        skip_shas = set(checkpoint["skip_shas"])
+        mode = 'a'
+    elif state:
+        # `since` is inclusive, the newest commits come again
+        commits = state["commits"]
+        newest_shas = state["shas"]
+        skip_shas = set(newest_shas)
+        newest = _parse_date(state["date"])
+        since = newest.strftime("%Y-%m-%dT%H:%M:%SZ")
+        mode = 'a'
+    while has_next:
+        # a failed page is raised, the repository is not recorded as done
+        # and a rerun resumes at the checkpoint
+        result = limited_call(
+            limiter, run_query,
+            _history_query(owner, repo_name, cursor, since)
+        )
+        not_found(result)
+        repository = result["data"]["repository"]
+        if repository is None:
+            if trace:
+                print(f"Fail to locate {owner}/{repo_name}")
+            return default_branch, commits
+        branch_ref = repository["defaultBranchRef"]
+        if branch_ref is None:
+            # empty repository
+            return default_branch, commits
+        if not default_branch:
+            default_branch = branch_ref["name"]
+            if state and state.get("branch", None) != default_branch:
+                # the default branch changed, start over with a full fetch
+                state = None
+                cursor = None
+                since = None
+                commits = 0
+                newest = None
+                newest_shas = []
+                skip_shas = set()
+                mode = 'w'
+                continue
+        history = branch_ref["target"]["history"]
+        with open(jsons_file, mode) as fh_json, \
+                open(csvs_file, mode) as fh_csv:
+            if mode == 'w':
+                fh_json.write("\n")
+                mode = 'a'
+            for node in history["nodes"]:
+                if node["oid"] in skip_shas:
+                    continue
+                raw_data = _to_rest_shape(node)
+                newest, newest_shas = _newer(
+                    newest, newest_shas, _committer_date(raw_data),
+                    [node["oid"]]
+                )
+                _write_csv(fh_csv, owner, repo_name, default_branch, raw_data)
+                _write_json(fh_json, raw_data)
+                commits += 1
+            has_next = history["pageInfo"]["hasNextPage"]
+            cursor = history["pageInfo"]["endCursor"]
+            save_checkpoint(checkpoint_file, fh_json, {
+                "branch": default_branch,
+                "cursor": cursor,
+                "since": since,
+                "shas": newest_shas,
+                "date": _format_date(newest),
+                "commits": commits,
+                "skip_shas": sorted(skip_shas),
+            }, fh_csv)
+
+    if newest is not None:
+        save_state(state_file, {
+            "branch": default_branch,
+            "shas": newest_shas,
+            "date": _format_date(newest),
+            "commits": commits,
+        })
+    remove_file(checkpoint_file)
+    return default_branch, commits
+
+
+def _combine_csv(base_dir, keys):
+    """Combine the `commits.csv` of each repository into one .csv file.
+
+    The file is rebuilt by every run, so rows written before a crash are
+    never duplicated. Repositories still being fetched are left out.
+    """
+    Path(base_dir).mkdir(parents=True, exist_ok=True)
+    with atomic_path(f"{base_dir}/commits.csv") as tmp:
+        with open(tmp, 'w') as f:
+            f.write(CSV_HEADER)
+            for full_name in keys:
+                sub = Path(f"{base_dir}/{full_name}")
+                if (sub / "commits.csv").exists() and not any(
+                        (sub / name).exists() for name in (
+                            "commits.checkpoint", "commits.json.parts")):
+                    with open(sub / "commits.csv", 'r') as fh_csv:
+                        shutil.copyfileobj(fh_csv, f)
+
+
 def _write_json(fh, raw_data):
     fh.write(f"{json.dumps(raw_data)}\n")
 
@@ -133,48 +589,129 @@ def _write_csv(fh, owner, repo_name, default_branch, raw_data):
     ))
 
 
-# client is the Github instance
-# row is a row of Pandas DataFrame
-def _do_commit_fetch(client, row, base_dir, progress_file, trace=False):
-    comps = row['full_name'].split('/')
+# pool is the TokenPool handing out Github instances
+def _do_commit_fetch(
+        pool, ledger, full_name, base_dir, trace=False, incremental=False,
+        backend="rest", limiter=None, window_workers=1):
+    return ledger.run(
+        full_name, _fetch_repo_commits, pool, full_name, base_dir, trace,
+        incremental, backend, limiter, window_workers
+    )
+
+
+def _fetch_repo_commits(
+        pool, full_name, base_dir, trace, incremental, backend, limiter,
+        window_workers):
+    comps = full_name.split('/')
     owner = comps[0]
     name = comps[1]
 
     t0 = timer()
-    default_branch, commits = load_commits(
-        client, owner, name, base_dir, trace
-    )
-    persist_progress(
-        owner, name, default_branch, commits, base_dir, progress_file
-    )
+    if backend == "graphql":
+        default_branch, commits = load_commits_graphql(
+            owner, name, base_dir, trace, incremental, limiter
+        )
+    else:
+        default_branch, commits = load_commits(
+            pool.client(), owner, name, base_dir, trace,
+            incremental, limiter, window_workers
+        )
     t1 = timer()
     if trace:
         print(f"Grab commits for {owner}/{name} took {t1-t0}s")
-    return commits
-
-
-def grab_commits(repo_csv_file, base_dir, progress_file, trace=False):
-    """Load commit objects for repositories specified in `repo_csv_file`."""
-    client = Github(load_access_token(), per_page=100)
-    to_check_df = pd.read_csv(repo_csv_file)
-
-    progress_path = f"{base_dir}/{progress_file}"
-    if Path(progress_path).exists():
-        checked_df = pd.read_csv(progress_path)
-        df2 = to_check_df.merge(checked_df, how="left", on="full_name")
-        # filter already processed repos, equivalent to SQL is null
-        df2 = df2.query("commits != commits")
-        df2.apply(
-            lambda r: _do_commit_fetch(
-                client, r, base_dir, progress_file, trace
-            ),
-            axis=1
+    return {"default_branch": default_branch, "commits": commits}
+
+
+def grab_commits(
+        repo_csv_file, base_dir, progress_file, trace=False,
+        incremental=False, backend="rest", workers=1, window_workers=1,
+        ledger_file=None):
+    """Load commit objects for repositories specified in `repo_csv_file`.
+
+    In incremental mode every repository is revisited and only the commits
+    newer than the ones fetched by the previous run are appended. The
+    `backend` is either `rest` or `graphql`, see `load_commits_graphql`.
+    Up to `workers` repositories are fetched concurrently, a worker starts
+    the next leased repository as soon as it is free. All workers share
+    one limiter tuned to the hourly API quota of all pooled tokens and
+    each request goes to the token with most quota left. When the
+    quota runs out the workers pause until it resets, a repository is only
+    recorded as done once all of its commits are fetched.
+    The number of concurrent calls adapts to the secondary rate limits,
+    see `AdaptiveConcurrency`.
+    The REST backend additionally fetches the windows of very large
+    histories with up to `window_workers` threads per repository.
+
+    The progress is tracked in a `JobLedger` next to `progress_file`, a
+    failed repository is retried by the next runs. The results of all
+    done repositories are exported to `progress_file` at the end, and the
+    `commits.csv` of the repositories are combined into `commits.csv` in
+    `base_dir`.
+
+    To scale out, processes on several hosts share one `ledger_file` and
+    lease batches of repositories from it, each with its own `base_dir`.
+    The `commits.state` and `commits.checkpoint` of a repository stay in
+    the `base_dir` of the host which fetched it, so incremental mode is
+    not supported with a shared `ledger_file`, and a failed repository
+    retried by another host is fetched from the start there. Its partial
+    output is left out of the `commits.csv` of the first host.
+    """
+    if backend not in ("rest", "graphql"):
+        raise ValueError(f"Unknown commit backend: {backend}")
+    if incremental and ledger_file:
+        # another host would lease a repository without its state
+        raise ValueError(
+            "Incremental mode is not supported with a shared ledger file"
         )
-    else:
-        df2 = to_check_df
-        df2.apply(
-            lambda r: _do_commit_fetch(
-                client, r, base_dir, progress_file, trace
+    keys = list(pd.read_csv(repo_csv_file, usecols=["full_name"]).full_name)
+    ledger = open_ledger(base_dir, progress_file, "full_name", ledger_file)
+    if incremental:
+        ledger.reset(keys, if_idle=True)
+    ledger.add(keys)
+
+    pool = default_pool()
+    fetch = partial(
+        _do_commit_fetch,
+        pool,
+        ledger,
+        base_dir=base_dir,
+        trace=trace,
+        incremental=incremental,
+        backend=backend,
+        limiter=QuotaScheduler(
+            pool, "graphql" if backend == "graphql" else "core",
+            limiter=TokenBucket(
+                CORE_QUOTA[0] * len(pool.tokens), CORE_QUOTA[1],
+                burst=CORE_BURST
+            ),
+            concurrency=AdaptiveConcurrency(
+                workers * window_workers, trace=trace
             ),
-            axis=1
+            trace=trace
+        ),
+        window_workers=window_workers
+    )
+    with ledger, ThreadPoolExecutor(max_workers=workers) as executor:
+        # keep every worker busy, a huge history holds one worker only
+        leased = deque()
+        running = set()
+        while True:
+            while len(running) < workers:
+                if not leased:
+                    leased.extend(
+                        ledger.lease_batch(max(LEASE_BATCH, workers))
+                    )
+                    if not leased:
+                        break
+                running.add(executor.submit(fetch, leased.popleft()))
+            if not running:
+                break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()
+        _combine_csv(base_dir, keys)
+        # the progress file stays the result file of the retrieval
+        ledger.export_csv(
+            f"{base_dir}/{progress_file}", "full_name",
+            ["default_branch", "commits"]
         )
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Package to retrieve issues and pull requests."""
+
+import json
+import pandas as pd
+
+from timeit import default_timer as timer
+from pathlib import Path
+from ..utils import default_pool
+from ..utils.common import load_state
+from ..utils.common import remove_file
+from ..utils.common import save_checkpoint
+from ..utils.common import truncate_file
+from ..utils.graphql import not_found
+from ..utils.graphql import run_query
+from ..utils.ledger import open_ledger
+from ..utils.ratelimit import QuotaScheduler
+from ..utils.ratelimit import limited_call
+
+# issues or pull requests per query, each with its nested connections
+PAGE_SIZE = 50
+# comments, reviews and labels inlined per issue or pull request
+NESTED_SIZE = 50
+
+# the kinds of discussion and the connection of each
+KINDS = {
+    "issues": "issues",
+    "pulls": "pullRequests",
+}
+
+_COMMON_FIELDS = """
+    number
+    title
+    body
+    state
+    createdAt
+    updatedAt
+    closedAt
+    url
+    author { login }
+    labels(first: %(nested)d) { nodes { name } }
+    comments(first: %(nested)d) {
+        totalCount
+        nodes {
+            databaseId
+            author { login }
+            body
+            createdAt
+            updatedAt
+        }
+    }
+"""
+
+_PULL_FIELDS = """
+    merged
+    mergedAt
+    baseRefName
+    headRefName
+    additions
+    deletions
+    changedFiles
+    reviews(first: %(nested)d) {
+        totalCount
+        nodes {
+            databaseId
+            author { login }
+            state
+            body
+            submittedAt
+        }
+    }
+"""
+
+_PAGE_QUERY = """
+query {
+    repository(owner: %s, name: %s) {
+        %s(first: %d%s, orderBy: {field: UPDATED_AT, direction: ASC}) {
+            pageInfo {
+                hasNextPage
+                endCursor
+            }
+            nodes {
+                %s
+            }
+        }
+    }
+}
+"""
+
+
+def _page_query(owner, repo_name, kind, cursor):
+    fields = _COMMON_FIELDS
+    if kind == "pulls":
+        fields += _PULL_FIELDS
+    return _PAGE_QUERY % (
+        json.dumps(owner),
+        json.dumps(repo_name),
+        KINDS[kind],
+        PAGE_SIZE,
+        f", after: {json.dumps(cursor)}" if cursor else "",
+        fields % {"nested": NESTED_SIZE},
+    )
+
+
+def load_issues(
+        owner, repo_name, base_dir, kind="issues", trace=False,
+        limiter=None):
+    """Load the issues or pull requests of given repository through GraphQL.
+
+    Each query fetches a page of `PAGE_SIZE` issues, or pull requests when
+    `kind` is `pulls`, together with their first `NESTED_SIZE` labels,
+    comments and reviews, the `totalCount` of a nested connection tells
+    whether there are more. The nodes are written one per line to
+    `issues.json` or `pulls.json`, see `save_as_parquet`.
+
+    A checkpoint with the page cursor is saved after each page, a run
+    interrupted by a crash or a failed query resumes after the last
+    complete page. Failed queries are raised rather than returning the
+    issues loaded so far.
+
+    Parameters
+    ----------
+    owner : str
+        the owner of the repository
+    repo_name : str
+        the name of the repository w/o owner
+    base_dir : str
+        the base directory of the output files
+    kind : str
+        `issues` or `pulls`
+    trace : bool
+        print trace messages
+    limiter : QuotaScheduler
+        the limiter of each query, None for no limit
+
+    Returns
+    -------
+    int
+        the number of issues or pull requests written
+    """
+    jsons_file = f"{base_dir}/{owner}/{repo_name}/{kind}.json"
+    checkpoint_file = f"{base_dir}/{owner}/{repo_name}/{kind}.checkpoint"
+    Path(f"{base_dir}/{owner}/{repo_name}").mkdir(parents=True, exist_ok=True)
+    checkpoint = load_state(checkpoint_file)
+    if checkpoint:
+        # resume after the last page of the interrupted run
+        truncate_file(jsons_file, checkpoint["offset"])
+        cursor = checkpoint["cursor"]
+        count = checkpoint["count"]
+    else:
+        with open(jsons_file, 'w') as fh_json:
+            fh_json.write("\n")
+        cursor = None
+        count = 0
+
+    has_next = True
+    while has_next:
+        # a failed page is raised, the repository is not recorded as done
+        # and a rerun resumes at the checkpoint
+        result = limited_call(
+            limiter, run_query, _page_query(owner, repo_name, kind, cursor)
+        )
+        not_found(result)
+        repository = result["data"]["repository"]
+        if repository is None:
+            if trace:
+                print(f"Fail to locate {owner}/{repo_name}")
+            break
+        page = repository[KINDS[kind]]
+        with open(jsons_file, 'a') as fh_json:
+            for node in page["nodes"]:
+                fh_json.write(f"{json.dumps(node)}\n")
+                count += 1
+            has_next = page["pageInfo"]["hasNextPage"]
+            cursor = page["pageInfo"]["endCursor"]
+            save_checkpoint(checkpoint_file, fh_json, {
+                "cursor": cursor,
+                "count": count,
+            })
+
+    remove_file(checkpoint_file)
+    return count
+
+
+def _do_issue_fetch(full_name, base_dir, trace=False, limiter=None):
+    comps = full_name.split('/')
+    owner = comps[0]
+    name = comps[1]
+
+    t0 = timer()
+    result = {
+        kind: load_issues(owner, name, base_dir, kind, trace, limiter)
+        for kind in KINDS
+    }
+    t1 = timer()
+    if trace:
+        print(f"Grab issues and pulls for {owner}/{name} took {t1-t0}s")
+    return result
+
+
+def grab_issues(repo_csv_file, base_dir, progress_file, trace=False):
+    """Load issues and pull requests for repositories in `repo_csv_file`.
+
+    When the GraphQL quota runs out the retrieval pauses until it resets,
+    a repository is only recorded as done once all of its issues and pull
+    requests are fetched. The progress is tracked in a `JobLedger` next to
+    `progress_file`, the results are exported to `progress_file` at the
+    end.
+    """
+    scheduler = QuotaScheduler(default_pool(), "graphql", trace=trace)
+    keys = list(pd.read_csv(repo_csv_file, usecols=["full_name"]).full_name)
+    with open_ledger(base_dir, progress_file, "full_name") as ledger:
+        for full_name in ledger.schedule(keys):
+            ledger.run(
+                full_name, _do_issue_fetch, full_name, base_dir, trace,
+                scheduler
+            )
+        ledger.export_csv(
+            f"{base_dir}/{progress_file}", "full_name", list(KINDS)
+        )
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Functions to plan search queries around the 1000-result cap.
+
+The github search API discards records beyond 1000 for any query. The
+planner probes the `totalCount` of candidate time windows, bisects windows
+exceeding the cap and merges runs of sparse adjacent windows so that a
+crawl issues as few search calls as possible without losing results. One
+day windows still exceeding the cap are further partitioned on star ranges.
+
+"""
+
+from datetime import timedelta
+from functools import partial
+from ..utils.common import daterange
+
+SEARCH_CAP = 1000
+
+
+def split_window(probe, start, end, cap=SEARCH_CAP):
+    """Bisect a time window until each sub window fits under the cap.
+
+    Parameters
+    ----------
+    probe : callable
+        Function accepting start and end date, returning the total count of
+        results in the window
+    start : date
+        The start date of the window
+    end : date
+        The end date of the window, inclusive
+    cap : int
+        The maximum number of results a single query may return
+
+    Returns
+    -------
+    list
+        list of (start, end, count) tuples in chronological order, a window
+        of one day is never split even if it exceeds the cap
+    """
+    count = probe(start, end)
+    if count <= cap or start >= end:
+        return [(start, end, count)]
+    mid = start + timedelta((end - start).days // 2)
+    return (
+        split_window(probe, start, mid, cap)
+        + split_window(probe, mid + timedelta(1), end, cap)
+    )
+
+
+def split_stars(probe, lo, hi, cap=SEARCH_CAP, count=None):
+    """Bisect a star range until each sub range fits under the cap.
+
+    The range is split at the geometric mean of its bounds since star
+    counts are heavily skewed towards the lower bound.
+
+    Parameters
+    ----------
+    probe : callable
+        Function accepting the lower and upper star bound, returning the
+        total count of results in the range
+    lo : int
+        The lower bound of the star range
+    hi : int
+        The upper bound of the star range, inclusive
+    cap : int
+        The maximum number of results a single query may return
+    count : int
+        The already probed count of the range, if known
+
+    Returns
+    -------
+    list
+        list of (lo, hi, count) tuples in ascending order, a range of a
+        single star count is never split even if it exceeds the cap
+    """
+    if count is None:
+        count = probe(lo, hi)
+    if count <= cap or lo >= hi:
+        return [(lo, hi, count)]
+    mid = int((max(lo, 1) * hi) ** 0.5)
+    mid = min(max(mid, lo), hi - 1)
+    return (
+        split_stars(probe, lo, mid, cap)
+        + split_stars(probe, mid + 1, hi, cap)
+    )
+
+
+def merge_windows(windows, cap=SEARCH_CAP):
+    """Merge runs of adjacent windows whose combined count fits the cap.
+
+    It works equally on star ranges since they share the same shape.
+
+    Parameters
+    ----------
+    windows : list
+        list of (start, end, count) tuples in ascending order
+    cap : int
+        The maximum number of results a single query may return
+
+    Returns
+    -------
+    list
+        list of merged (start, end, count) tuples, empty windows are
+        dropped since they need no search call at all
+    """
+    merged = []
+    for start, end, count in windows:
+        if count == 0:
+            continue
+        if merged:
+            m_start, m_end, m_count = merged[-1]
+            if m_count + count <= cap:
+                merged[-1] = (m_start, end, m_count + count)
+                continue
+        merged.append((start, end, count))
+    return merged
+
+
+def plan_windows(
+        probe, start_date, end_date, slice, cap=SEARCH_CAP, map=map):
+    """Plan the time windows to search between `start_date` and `end_date`.
+
+    Parameters
+    ----------
+    probe : callable
+        Function accepting start and end date, returning the total count of
+        results in the window
+    start_date : date
+        The start date of the range
+    end_date : date
+        The end date of the range, inclusive
+    slice : int
+        The size of the initial time windows to probe in days
+    cap : int
+        The maximum number of results a single query may return
+    map : callable
+        The order preserving map function used to probe the initial windows,
+        e.g. `Executor.map` to probe them concurrently
+
+    Returns
+    -------
+    list
+        list of (start, end, count) tuples in chronological order
+    """
+    windows = []
+    seeds = list(daterange(start_date, end_date, slice))
+    for split in map(partial(_split_seed, probe, cap), seeds):
+        windows.extend(split)
+    return merge_windows(windows, cap)
+
+
+def _split_seed(probe, cap, seed):
+    return split_window(probe, seed[0], seed[1], cap)
+
+
+def _window_probe(probe, stars, start, end):
+    return probe(start, end, stars, None)
+
+
+def plan_queries(
+        probe, max_stars, start_date, end_date, slice, stars,
+        cap=SEARCH_CAP, map=map):
+    """Plan the time windows and star ranges to search.
+
+    Parameters
+    ----------
+    probe : callable
+        Function accepting start date, end date, lower and upper star bound,
+        returning the total count of results, the upper star bound is None
+        for an open ended range
+    max_stars : callable
+        Function accepting start and end date, returning the highest star
+        count of the repositories in the window
+    start_date : date
+        The start date of the range
+    end_date : date
+        The end date of the range, inclusive
+    slice : int
+        The size of the initial time windows to probe in days
+    stars : int
+        Minimal stars
+    cap : int
+        The maximum number of results a single query may return
+    map : callable
+        The order preserving map function used to probe the initial windows
+
+    Returns
+    -------
+    list
+        list of (start, end, lo, hi, count) tuples, `hi` is None for an open
+        ended star range
+    """
+    queries = []
+    windows = plan_windows(
+        partial(_window_probe, probe, stars),
+        start_date, end_date, slice, cap, map
+    )
+    for start, end, count in windows:
+        if count <= cap:
+            queries.append((start, end, stars, None, count))
+            continue
+        hi = max(max_stars(start, end), stars)
+        ranges = merge_windows(
+            split_stars(partial(probe, start, end), stars, hi, cap, count),
+            cap
+        )
+        for i, (lo, hi, c) in enumerate(ranges):
+            # leave the top range open to catch repositories gaining stars
+            last = i == len(ranges) - 1
+            queries.append((start, end, lo, None if last else hi, c))
+    return queries
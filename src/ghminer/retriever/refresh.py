@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Functions to refresh metadata of known repositories."""
+
+import json
+import pandas as pd
+
+from pathlib import Path
+from timeit import default_timer as timer
+from ..utils import default_pool
+from ..utils.graphql import not_found
+from ..utils.graphql import run_query
+from ..utils.ratelimit import QuotaScheduler
+
+# column in the repository .csv file => field of GraphQL Repository object
+REFRESH_FIELDS = {
+    "stargazers_count": "stargazerCount",
+    "forks_count": "forkCount",
+    "archived": "isArchived",
+    "pushed_at": "pushedAt",
+}
+
+
+def _build_query(names):
+    selection = " ".join(REFRESH_FIELDS.values())
+    aliases = []
+    for i, full_name in enumerate(names):
+        owner, repo = full_name.split("/", 1)
+        aliases.append(
+            f"r{i}: repository(owner: {json.dumps(owner)}, "
+            f"name: {json.dumps(repo)}) {{ {selection} }}"
+        )
+    return "query {\n%s\n}" % "\n".join(aliases)
+
+
+def _normalize(column, value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if column == "pushed_at":
+        return pd.to_datetime(value, utc=True)
+    if column == "archived":
+        return str(value).lower() == "true"
+    return int(value)
+
+
+def _use_column(column):
+    return column == "full_name" or column in REFRESH_FIELDS
+
+
+def _diff(row, fresh):
+    changed = []
+    for column, field in REFRESH_FIELDS.items():
+        if column not in row:
+            continue
+        if _normalize(column, row[column]) != \
+                _normalize(column, fresh[field]):
+            changed.append(column)
+    return changed
+
+
+def _refresh_batch(scheduler, batch):
+    result = scheduler.call(
+        run_query, _build_query(list(batch["full_name"]))
+    )
+    missing = not_found(result)
+    data = result.get("data", None) or {}
+    deltas = []
+    for i, (_, row) in enumerate(batch.iterrows()):
+        fresh = data.get(f"r{i}", None)
+        if f"r{i}" in missing:
+            # renamed, deleted or turned private since the search crawl
+            deltas.append({"full_name": row["full_name"], "changed": "gone"})
+            continue
+        if fresh is None:
+            raise Exception(f"No data of {row['full_name']} in the response")
+        changed = _diff(row, fresh)
+        if changed:
+            delta = {"full_name": row["full_name"]}
+            for column, field in REFRESH_FIELDS.items():
+                delta[column] = fresh[field]
+            delta["changed"] = " ".join(changed)
+            deltas.append(delta)
+    return deltas
+
+
+def refresh_repos(repo_csv_file, delta_file, batch_size=100, trace=False):
+    """Refresh stars, forks, archived and pushedAt of known repositories.
+
+    The repositories are queried through aliased GraphQL queries, each of
+    which covers `batch_size` repositories. Only the repositories whose
+    metadata changed, or which are gone, are written to `delta_file`. A
+    repository is gone only when GitHub reports it `NOT_FOUND`, any other
+    error of a query is raised.
+
+    Parameters
+    ----------
+    repo_csv_file : str
+        The combined .csv file produced by `collect_data`
+    delta_file : str
+        The .csv file to store the changed repositories
+    batch_size : int
+        Number of repositories per GraphQL query, maximium 100
+    trace : bool
+        Whether to print tracing information
+
+    Returns
+    -------
+    int
+        the number of changed repositories
+    """
+    sub = Path(delta_file).parent
+    sub.mkdir(parents=True, exist_ok=True)
+    columns = ["full_name"] + list(REFRESH_FIELDS.keys()) + ["changed"]
+    changes = 0
+    scheduler = QuotaScheduler(default_pool(), "graphql", trace=trace)
+    with open(delta_file, 'w') as f:
+        f.write(f"{','.join(columns)}\n")
+        for batch in pd.read_csv(
+                repo_csv_file, usecols=_use_column, chunksize=batch_size):
+            t0 = timer()
+            deltas = _refresh_batch(scheduler, batch)
+            if deltas:
+                pd.DataFrame(deltas, columns=columns).to_csv(
+                    f, header=False, index=False
+                )
+            changes += len(deltas)
+            t1 = timer()
+            if trace:
+                print("Refresh %d repositories took %s seconds, %d changed" % (
+                    len(batch), t1-t0, len(deltas)
+                ))
+    return changes
@@ -2,56 +2,214 @@
 # -*- coding: utf-8 -*-
 """Functions for search repositories."""
 
+import json
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
-from ..utils.common import daterange
+from ..utils.common import PER_PAGE
+from ..utils.common import atomic_path
 from ..utils.common import format_date
 from ..utils.common import yearrange
-from ..utils import load_access_token
-from github import Github
+from ..utils import default_pool
+from ..utils.ratelimit import SEARCH_QUOTA
+from ..utils.ratelimit import AdaptiveConcurrency
+from ..utils.ratelimit import QuotaScheduler
+from ..utils.ratelimit import TokenBucket
+from .planner import plan_queries
+from .planner import SEARCH_CAP
+from .schema import DEFAULT_FIELDS
+from .schema import project
+from .schema import repo_schema
+from .schema import to_table
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from hashlib import md5
 from pathlib import Path
 from timeit import default_timer as timer
 
 
-def _search_repo_iteratively(
-        client, dict_list, fork, stars,
-        start, end, lang, topics=[], trace=False):
+def _build_queries(fork, lang, topics=[]):
     fork_str = "true" if fork else "false"
-    query_str = f"stars:>={stars} fork:{fork_str} created:{start}..{end}"
+    query_str = f"fork:{fork_str}"
     if lang is not None and lang != '':
         query_str = f"lang:{lang} {query_str}"
     if topics is not None and len(topics) > 0:
         # github API supports up to 5 ORs
         n = 6
         sub_lists = [topics[i:i+n] for i in range(0, len(topics), n)]
-        for sub_list in sub_lists:
-            _do_search(
-                client,
-                f"{' OR '.join(sub_list)} in:topics {query_str}",
-                dict_list,
-                trace
-            )
-    else:
-        _do_search(client, query_str, dict_list, trace)
+        return [
+            f"{' OR '.join(sub_list)} in:topics {query_str}"
+            for sub_list in sub_lists
+        ]
+    return [query_str]
 
 
-def _do_search(client, query_str, dict_list, trace):
-    if trace:
+def _qualify(query_str, start, end, lo, hi):
+    stars = f"stars:>={lo}" if hi is None else f"stars:{lo}..{hi}"
+    created = f"created:{format_date(start)}..{format_date(end)}"
+    return f"{query_str} {stars} {created}"
+
+
+class _SearchSession:
+    """Pooled github clients behind a shared limiter."""
+
+    def __init__(self, pool, limiter, trace=False):
+        self.pool = pool
+        self.limiter = limiter
+        self.trace = trace
+
+    def client(self):
+        return self.pool.client("search")
+
+
+def _probe_count(session, query_str, start, end, lo, hi):
+    repositories = session.client().search_repositories(
+        _qualify(query_str, start, end, lo, hi)
+    )
+    count = session.limiter.call(lambda: repositories.totalCount)
+    if session.trace:
+        print(f"Probe {_qualify('', start, end, lo, hi)} found {count}")
+    return count
+
+
+def _probe_max_stars(session, query_str, start, end, stars):
+    repositories = session.client().search_repositories(
+        _qualify(query_str, start, end, stars, None),
+        sort="stars", order="desc"
+    )
+    top = session.limiter.call(repositories.get_page, 0)
+    return top[0].stargazers_count if top else stars
+
+
+def _plan_searches(session, query_str, stars, start, end, slice, map):
+    queries = plan_queries(
+        partial(_probe_count, session, query_str),
+        partial(_probe_max_stars, session, query_str, stars=stars),
+        start, end, slice, stars, map=map
+    )
+    searches = []
+    for s, e, lo, hi, count in queries:
+        if count > SEARCH_CAP and session.trace:
+            print("Query %s exceeds search cap with %d results" % (
+                _qualify(query_str, s, e, lo, hi), count
+            ))
+        searches.append(_qualify(query_str, s, e, lo, hi))
+    return searches
+
+
+def _do_search(session, query_str, convert):
+    if session.trace:
         print(f"Query Str: {query_str}")
-    repositories = client.search_repositories(
+    repositories = session.client().search_repositories(
         query_str, sort="stars", order="desc"
     )
-    for repo in repositories:
-        old_dict = vars(repo)
-        dict_list.append({k: v for k, v in old_dict['_rawData'].items()})
+    dict_list = []
+    # walk the pages explicitly so that each call passes the limiter
+    for n in range(SEARCH_CAP // PER_PAGE):
+        page = session.limiter.call(repositories.get_page, n)
+        for repo in page:
+            old_dict = vars(repo)
+            dict_list.append(convert(old_dict['_rawData']))
+        if len(page) < PER_PAGE:
+            break
+    return dict_list
+
+
+def _flatten(raw_data):
+    # nested objects are kept as JSON text so every part shares flat columns
+    return {
+        k: json.dumps(v) if isinstance(v, (dict, list)) else v
+        for k, v in raw_data.items()
+    }
+
+
+def _part_path(part_dir, idx):
+    return part_dir / f"part-{idx:05d}.parquet"
+
+
+def _load_plan(part_dir):
+    plan_file = part_dir / "_plan.json"
+    if plan_file.exists():
+        with open(plan_file, 'r') as f:
+            return json.load(f)
+    return None
+
+
+def _save_plan(part_dir, searches):
+    part_dir.mkdir(parents=True, exist_ok=True)
+    with atomic_path(str(part_dir / "_plan.json")) as tmp:
+        with open(tmp, 'w') as f:
+            json.dump(searches, f, indent=1)
+
+
+def _search_to_part(session, part_dir, fields, job):
+    idx, query_str = job
+    if fields is None:
+        table = pa.Table.from_pandas(
+            pd.DataFrame(_do_search(session, query_str, _flatten)),
+            preserve_index=False
+        )
+    else:
+        table = to_table(
+            _do_search(session, query_str, partial(project, fields=fields)),
+            fields
+        )
+    # the renamed part file doubles as the checkpoint of the window
+    with atomic_path(str(_part_path(part_dir, idx))) as tmp:
+        pq.write_table(table, tmp, compression="snappy")
+    return table.num_rows
+
+
+def _combine(part_dirs, file_name, batch_size=10000):
+    parts = [
+        part
+        for part_dir in part_dirs
+        for part in sorted(part_dir.glob("part-*.parquet"))
+    ]
+    # the union of the columns of all parts, in raw fields mode each part
+    # holds only the fields its search results had
+    header = []
+    for part in parts:
+        for name in pq.read_schema(part).names:
+            if name not in header:
+                header.append(name)
+    seen = set()
+    rows = 0
+    with atomic_path(file_name) as tmp:
+        with open(tmp, 'w') as f:
+            if header:
+                f.write(f"{','.join(header)}\n")
+            for part in parts:
+                pf = pq.ParquetFile(part)
+                if "full_name" not in pf.schema_arrow.names:
+                    continue
+                for batch in pf.iter_batches(batch_size=batch_size):
+                    df = batch.to_pandas()
+                    df = df[~df["full_name"].isin(seen)]
+                    df = df.drop_duplicates(subset=["full_name"])
+                    seen.update(df["full_name"])
+                    df.reindex(columns=header).to_csv(
+                        f, header=False, index=False
+                    )
+                    rows += len(df)
+    return rows
 
 
 def collect_data(
         start_year, end_year, extra_year_range,
-        fork, stars, slice, subdir, lang, topics=[], trace=False):
+        fork, stars, slice, subdir, lang, topics=[], trace=False,
+        workers=4, fields=DEFAULT_FIELDS):
     """Collect repository information matching specified criteria.
 
+    The search results of each planned query are streamed into a Parquet
+    dataset under `subdir`, partitioned by date range. A crawl interrupted
+    midway resumes from the plan and the part files already written.
+    The combined .csv file is built by a streaming de-duplication on
+    `full_name` over the dataset. Only the projected `fields` are stored,
+    with the types declared in `schema.REPO_FIELDS`, so the dataset loads
+    quickly with `pd.read_parquet`.
+
     Parameters
     ----------
     start_year : int
@@ -64,23 +222,49 @@ def collect_data(
         Whether to include forked repositories
     stars : int
         Minimal stars
-    stars : slice
-        Time window size in days
+    slice : int
+        Initial time window size in days, windows exceeding the 1000-result
+        cap are split, by star ranges once down to a single day, and runs
+        of sparse windows are merged
     subdir : str
-        Directory to store the result .csv files
+        Directory to store the result dataset and .csv files
     topics : list
         List of topics to search, the repository matches if any of topic
         in list matches
     trace : bool
         Whether to print tracing information
+    workers : int
+        Number of concurrent search workers, all of them share one limiter
+        tuned to the search API quota of the pooled tokens, the number of
+        concurrent calls backs off on secondary rate limits
+    fields : list
+        Columns to keep, see `schema.REPO_FIELDS`, None to keep the whole
+        raw payload with nested objects as JSON text
 
     Returns
     -------
     None
     """
+    if fields is not None:
+        repo_schema(fields)
     sub = Path(subdir)
     sub.mkdir(exist_ok=True)
-    client = Github(load_access_token(), per_page=100)
+    pool = default_pool()
+    # the pool routes each search to the token with most search quota
+    # left, a token holds only 30 calls per minute, below the default
+    # reserve, so searches pause only once every token is drained
+    session = _SearchSession(
+        pool,
+        QuotaScheduler(
+            pool, "search", reserve=0,
+            limiter=TokenBucket(
+                SEARCH_QUOTA[0] * len(pool.tokens), SEARCH_QUOTA[1]
+            ),
+            concurrency=AdaptiveConcurrency(workers, trace=trace),
+            trace=trace
+        ),
+        trace
+    )
     date_ranges = []
     for t in yearrange(start_year, end_year, 2):
         date_ranges.append(t)
@@ -89,52 +273,57 @@ def collect_data(
 
     date_ranges = date_ranges[::-1]
     search_key = _search_key(lang, topics)
-    for date_range in date_ranges:
-        t0 = timer()
-        dict_list = []
-        for t in daterange(date_range[0], date_range[1], slice):
-            _search_repo_iteratively(
-                client, dict_list, fork, stars,
-                format_date(t[0]), format_date(t[1]), lang,
-                topics=topics, trace=trace
+    dataset = sub / f"{search_key}-repo-{stars}"
+    part_dirs = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for date_range in date_ranges:
+            t0 = timer()
+            part_dir = dataset / (
+                "date_range=%s_%s" % (date_range[0], date_range[1])
             )
-        t1 = timer()
-        if trace:
-            print("Collect %s data between %s and %s took %s seconds" % (
-                search_key,
-                date_range[0],
-                date_range[1],
-                t1-t0
-            ))
-        df = pd.DataFrame(dict_list)
-        df.drop_duplicates(subset=["full_name"], inplace=True)
-        file_name = "%s/%s-repo-%d-%s-%s.csv" % (
-            subdir, search_key, stars, date_range[0], date_range[1]
-        )
-        df.to_csv(file_name, index=False)
-        t2 = timer()
-        if trace:
-            print("Save %s data between %s and %s took %d seconds" % (
-                search_key, date_range[0], date_range[1], t2-t1
+            part_dirs.append(part_dir)
+            searches = _load_plan(part_dir)
+            if searches is None:
+                searches = []
+                for query_str in _build_queries(fork, lang, topics):
+                    searches.extend(_plan_searches(
+                        session, query_str, stars,
+                        date_range[0], date_range[1], slice, executor.map
+                    ))
+                _save_plan(part_dir, searches)
+            pending = [
+                (i, q) for i, q in enumerate(searches)
+                if not _part_path(part_dir, i).exists()
+            ]
+            rows = sum(executor.map(
+                partial(_search_to_part, session, part_dir, fields), pending
             ))
+            t1 = timer()
+            if trace:
+                print(
+                    "Collect %s data between %s and %s took %s seconds, "
+                    "fetched %d of %d windows with %d rows" % (
+                        search_key,
+                        date_range[0],
+                        date_range[1],
+                        t1-t0,
+                        len(pending),
+                        len(searches),
+                        rows
+                    )
+                )
 
     t3 = timer()
-    cost_dfs = []
-    for date_range in date_ranges:
-        df = pd.read_csv("%s/%s-repo-%d-%s-%s.csv" % (
-            subdir, search_key, stars, date_range[0], date_range[1]
-        ))
-        cost_dfs.append(df)
-    combined = pd.concat(cost_dfs)
-    combined.drop_duplicates(subset=["full_name"], inplace=True)
     file_name = "%s/%s-repo-%d-combined.csv" % (
         subdir, search_key, stars
     )
-    combined.to_csv(file_name, index=False)
+    rows = _combine(part_dirs, file_name)
     t4 = timer()
 
     if trace:
-        print(f"Combine and save {search_key} data took {t4-t3} seconds")
+        print(
+            f"Combine and save {rows} {search_key} rows took {t4-t3} seconds"
+        )
 
 
 def _search_key(lang, topics):
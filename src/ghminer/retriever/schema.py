@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Typed projection of repository search results.
+
+The search API returns the full repository payload including nested owner,
+license and permission objects plus dozens of URL templates. The projection
+keeps only the configured fields, flattens nested ones and assigns each an
+explicit type so the stored dataset is compact and quick to load.
+
+"""
+
+import pyarrow as pa
+
+from isodate import parse_datetime
+
+_TYPES = {
+    "int": pa.int64(),
+    "bool": pa.bool_(),
+    "string": pa.string(),
+    "timestamp": pa.timestamp("s", tz="UTC"),
+    "category": pa.dictionary(pa.int32(), pa.string()),
+}
+
+# column name => (dotted path in the raw payload, type)
+REPO_FIELDS = {
+    "id": ("id", "int"),
+    "full_name": ("full_name", "string"),
+    "name": ("name", "string"),
+    "owner_login": ("owner.login", "string"),
+    "owner_type": ("owner.type", "category"),
+    "description": ("description", "string"),
+    "homepage": ("homepage", "string"),
+    "language": ("language", "category"),
+    "license": ("license.spdx_id", "category"),
+    "topics": ("topics", "string"),
+    "default_branch": ("default_branch", "category"),
+    "fork": ("fork", "bool"),
+    "archived": ("archived", "bool"),
+    "is_template": ("is_template", "bool"),
+    "has_issues": ("has_issues", "bool"),
+    "has_wiki": ("has_wiki", "bool"),
+    "size": ("size", "int"),
+    "stargazers_count": ("stargazers_count", "int"),
+    "watchers_count": ("watchers_count", "int"),
+    "forks_count": ("forks_count", "int"),
+    "open_issues_count": ("open_issues_count", "int"),
+    "created_at": ("created_at", "timestamp"),
+    "updated_at": ("updated_at", "timestamp"),
+    "pushed_at": ("pushed_at", "timestamp"),
+}
+
+DEFAULT_FIELDS = [
+    "id", "full_name", "owner_login", "owner_type", "description",
+    "language", "license", "topics", "default_branch", "fork", "archived",
+    "size", "stargazers_count", "forks_count", "open_issues_count",
+    "created_at", "updated_at", "pushed_at",
+]
+
+
+def repo_schema(fields=DEFAULT_FIELDS):
+    """Build the arrow schema of the projected fields.
+
+    Parameters
+    ----------
+    fields : list
+        list of column names defined in `REPO_FIELDS`
+
+    Returns
+    -------
+    pyarrow.Schema
+        the schema in the order of `fields`
+    """
+    unknown = [f for f in fields if f not in REPO_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown repository fields: {', '.join(unknown)}")
+    return pa.schema([
+        pa.field(f, _TYPES[REPO_FIELDS[f][1]]) for f in fields
+    ])
+
+
+def _lookup(raw_data, path):
+    value = raw_data
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key, None)
+    return value
+
+
+def _convert(value, type_name):
+    if value is None:
+        return None
+    if type_name == "timestamp":
+        return parse_datetime(value)
+    if isinstance(value, list):
+        return ",".join(str(v) for v in value)
+    return value
+
+
+def project(raw_data, fields=DEFAULT_FIELDS):
+    """Project the raw repository payload onto `fields`.
+
+    Parameters
+    ----------
+    raw_data : dict
+        the raw repository payload returned by the search API
+    fields : list
+        list of column names defined in `REPO_FIELDS`
+
+    Returns
+    -------
+    dict
+        the flattened and converted values keyed by column name
+    """
+    return {
+        f: _convert(_lookup(raw_data, REPO_FIELDS[f][0]), REPO_FIELDS[f][1])
+        for f in fields
+    }
+
+
+def to_table(records, fields=DEFAULT_FIELDS):
+    """Convert projected records into a typed arrow table.
+
+    Parameters
+    ----------
+    records : list
+        list of dict returned by `project`
+    fields : list
+        list of column names defined in `REPO_FIELDS`
+
+    Returns
+    -------
+    pyarrow.Table
+        the table conforming to `repo_schema(fields)`
+    """
+    schema = repo_schema(fields)
+    arrays = []
+    for field in schema:
+        values = [r.get(field.name, None) for r in records]
+        if pa.types.is_dictionary(field.type):
+            arrays.append(
+                pa.array(values, type=pa.string()).dictionary_encode()
+            )
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
@@ -2,27 +2,151 @@
 # -*- coding: utf-8 -*-
 """Package to retrieve star history."""
 
-import requests
+import json
+import math
+import numpy as np
 import pandas as pd
-from ..utils import load_access_token
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shutil
 
+from collections import deque
+from pathlib import Path
+from ..utils import default_pool
+from ..utils import load_repo_info
+from ..utils.common import PER_PAGE
+from ..utils.common import atomic_path
+from ..utils.common import load_state
+from ..utils.common import save_state
+from ..utils.graphql import not_found
+from ..utils.graphql import run_query
+from ..utils.ratelimit import QuotaScheduler
 
-def _run_query(query):
-    headers = {"Authorization": f"bearer {load_access_token()}"}
-    request = requests.post(
-        'https://api.github.com/graphql',
-        json={'query': query},
-        headers=headers
-    )
-    if request.status_code == 200:
-        return request.json()
-    else:
-        raise Exception(
-            "Query failed with return code of {}. {}".format(
-                request.status_code,
-                query
-            )
+# repositories whose stargazers are paged together in one query
+STAR_BATCH = 20
+# stars buffered per row group of the .parquet file
+ROW_GROUP_SIZE = 100000
+
+# the REST stargazer list stops at this page, the newer stars are hidden
+MAX_STAR_PAGES = 400
+
+STAR_SCHEMA = pa.schema([
+    ("full_name", pa.string()),
+    ("starredAt", pa.string()),
+])
+SAMPLE_SCHEMA = pa.schema([
+    ("full_name", pa.string()),
+    ("starredAt", pa.string()),
+    ("stars", pa.int64()),
+    ("capped", pa.bool_()),
+])
+
+_NEWEST_QUERY = """
+query {
+    repository(owner: %s, name: %s) {
+        stargazers(first: 1, orderBy: {field: STARRED_AT, direction: DESC}) {
+            totalCount
+            edges { starredAt }
+        }
+    }
+}
+"""
+
+
+def _stars_query(pending, size, since):
+    aliases = []
+    for i, (full_name, cursor) in enumerate(pending):
+        owner, repo = full_name.split("/", 1)
+        if full_name in since:
+            # newest first, up to the stars already stored
+            page = f"after: {json.dumps(cursor)}, " if cursor else ""
+            page += f"first: {size}"
+        else:
+            page = f"before: {json.dumps(cursor)}, " if cursor else ""
+            page += f"last: {size}"
+        aliases.append(
+            f"r{i}: repository(owner: {json.dumps(owner)}, "
+            f"name: {json.dumps(repo)}) {{ stargazers({page}, "
+            "orderBy: {direction: DESC, field: STARRED_AT}) { "
+            "pageInfo { startCursor hasPreviousPage endCursor hasNextPage } "
+            "edges { starredAt } } }"
+        )
+    return "query {\n%s\n}" % "\n".join(aliases)
+
+
+def _star_pages(
+        scheduler, repos, size=100, batch_size=STAR_BATCH, since=None,
+        active=None, trace=False):
+    """Page the stargazers of `repos`, `batch_size` repositories per query.
+
+    A repository leaves the batch once its last page is fetched and the
+    next one of `repos` takes its place, so every query stays full. The
+    repositories in `since` are paged from the newest star and leave the
+    batch at the first star not newer than theirs. The paging of the
+    repositories in `active` resumes at their cursors.
+
+    Returns
+    -------
+    iteratable
+        the stars fetched by each query as lists of dictionaries, with the
+        cursor of each repository still paged and the repositories done
+    """
+    since = since or {}
+    queue = deque(repos)
+    # repository => cursor of the next page
+    active = dict(active or {})
+    while queue or active:
+        while queue and len(active) < batch_size:
+            active[queue.popleft()] = ""
+        names = list(active)
+        result = scheduler.call(
+            run_query,
+            _stars_query([(n, active[n]) for n in names], size, since)
         )
+        missing = not_found(result)
+        data = result.get("data", None) or {}
+        dicts = []
+        finished = []
+        for i, full_name in enumerate(names):
+            repo_dict = data.get(f"r{i}", None)
+            if f"r{i}" in missing:
+                # renamed, deleted or turned private
+                if trace:
+                    print(f"Fail to locate {full_name}")
+                del active[full_name]
+                finished.append(full_name)
+                continue
+            if repo_dict is None:
+                raise Exception(f"No data of {full_name} in the response")
+            gazers = repo_dict["stargazers"]
+            newest = since.get(full_name, None)
+            stars = [
+                star["starredAt"] for star in gazers["edges"]
+                if newest is None or star["starredAt"] > newest
+            ]
+            dicts.extend(
+                {"full_name": full_name, "starredAt": starred_at}
+                for starred_at in stars
+            )
+            info = gazers["pageInfo"]
+            if newest is not None:
+                done = len(stars) < len(gazers["edges"])
+                if info["hasNextPage"] and not done:
+                    active[full_name] = info["endCursor"]
+                else:
+                    del active[full_name]
+            elif info["hasPreviousPage"]:
+                active[full_name] = info["startCursor"]
+            else:
+                del active[full_name]
+            if full_name not in active:
+                finished.append(full_name)
+        yield dicts, dict(active), finished
+
+
+def _newest_stars(parquet_file):
+    df = pd.read_parquet(parquet_file, columns=["full_name", "starredAt"])
+    return df.groupby("full_name")["starredAt"].max().to_dict()
 
 
 def query_stars(owner, repo, size=100):
@@ -41,44 +165,250 @@ def query_stars(owner, repo, size=100):
     -------
     List of dictionary
     """
-    hasPreviousPage = True
-    cursor = ""
-
+    scheduler = QuotaScheduler(default_pool(), "graphql")
     dicts = []
-    while hasPreviousPage:
-
-        query = f"""
-        query {{
-            repository(owner:"{owner}", name:"{repo}") {{
-                stargazerCount
-                nameWithOwner
-                stargazers(
-                    {'before: ' + '"' + cursor + '",' if cursor else ""}
-                    last: {size},
-                    orderBy: {{ direction: DESC, field: STARRED_AT}}) {{
-                    pageInfo {{
-                        startCursor
-                        hasPreviousPage
-                    }}
-                    edges {{
-                        starredAt
-                    }}
-                }}
-            }}
-        }}
-        """
-        result = _run_query(query)
-        repo_dict = result["data"]["repository"]
-        repo_dict_gazers = repo_dict["stargazers"]
-        hasPreviousPage = repo_dict_gazers["pageInfo"]["hasPreviousPage"]
-        cursor = repo_dict_gazers["pageInfo"]["startCursor"]
-        for star in repo_dict_gazers["edges"]:
-            dicts.append({
-                "full_name": f"{owner}/{repo}",
-                "starredAt": star["starredAt"]
+    for page, _, _ in _star_pages(scheduler, [f"{owner}/{repo}"], size, 1):
+        dicts.extend(page)
+    return dicts
+
+
+def _write_part(parts_dir, idx, rows):
+    with atomic_path(f"{parts_dir}/{idx:05d}.parquet") as tmp:
+        pq.write_table(
+            pa.Table.from_pylist(rows, STAR_SCHEMA), tmp, compression="snappy"
+        )
+
+
+def query_stars_batch(
+        repos, dest_file, size=100, batch_size=STAR_BATCH, trace=False,
+        known_file=None):
+    """Collect star history data for many repositories into a .parquet file.
+
+    The stargazers of `batch_size` repositories are paged together through
+    aliased GraphQL queries. The stars are streamed to part files of about
+    `ROW_GROUP_SIZE` rows each in `{dest_file}.parts` instead of being
+    collected in memory. After each part the repositories done and the
+    cursors of those still paged are saved, a run interrupted by a crash
+    resumes from the last part. The parts are combined into `dest_file` at
+    the end.
+
+    Given the .parquet file of a previous run as `known_file`, only the
+    stars newer than the newest one stored there are fetched, paging stops
+    at the first stored star. `dest_file` then holds the stars of
+    `known_file` followed by the new ones, and serves as `known_file` of
+    the next run.
+
+    Parameters
+    ----------
+    repos : list
+        The full names of the repositories
+    dest_file : str
+        The .parquet file to store the `full_name` and `starredAt` columns
+    size : int
+        Number of records per page, maximium 100
+    batch_size : int
+        Number of repositories per query
+    trace : bool
+        Whether to print tracing information
+    known_file : str
+        The .parquet file of a previous run, None to fetch all stars
+
+    Returns
+    -------
+    int
+        the number of new stars written
+    """
+    since = _newest_stars(known_file) if known_file else None
+    scheduler = QuotaScheduler(default_pool(), "graphql", trace=trace)
+    parts_dir = f"{dest_file}.parts"
+    state_file = f"{parts_dir}/_state.json"
+    Path(parts_dir).mkdir(parents=True, exist_ok=True)
+    state = load_state(state_file) or {"parts": 0, "active": {}, "done": []}
+    for path in Path(parts_dir).glob("*.parquet"):
+        # written after the last saved state
+        if int(path.stem) >= state["parts"]:
+            path.unlink()
+    done = set(state["done"])
+    pending = [
+        r for r in repos if r not in done and r not in state["active"]
+    ]
+    parts = state["parts"]
+    rows = []
+    pages = _star_pages(
+        scheduler, pending, size, batch_size, since, state["active"], trace
+    )
+    for page, active, finished in pages:
+        rows.extend(page)
+        done.update(finished)
+        if len(rows) >= ROW_GROUP_SIZE:
+            _write_part(parts_dir, parts, rows)
+            parts += 1
+            rows = []
+            save_state(state_file, {
+                "parts": parts, "active": active, "done": sorted(done),
             })
+            if trace:
+                print(f"Wrote {parts} parts of stars to {parts_dir}")
+    if rows:
+        _write_part(parts_dir, parts, rows)
+        parts += 1
+        save_state(state_file, {
+            "parts": parts, "active": {}, "done": sorted(done),
+        })
 
-    return dicts
+    stars = 0
+    with atomic_path(dest_file) as tmp:
+        with pq.ParquetWriter(
+                tmp, STAR_SCHEMA, compression="snappy") as writer:
+            if known_file:
+                known = pq.ParquetFile(known_file)
+                for i in range(known.num_row_groups):
+                    writer.write_table(known.read_row_group(
+                        i, columns=STAR_SCHEMA.names
+                    ).cast(STAR_SCHEMA))
+            for idx in range(parts):
+                table = pq.read_table(
+                    f"{parts_dir}/{idx:05d}.parquet", schema=STAR_SCHEMA
+                )
+                writer.write_table(table)
+                stars += table.num_rows
+    shutil.rmtree(parts_dir)
+    return stars
+
+
+def _sample_pages(pages, error):
+    # cumulative counts are monotonic, so the error of linear interpolation
+    # is at most the stars between two samples
+    samples = min(pages, max(2, math.ceil(1 / error) + 1))
+    return sorted(set(
+        round(k * (pages - 1) / (samples - 1)) for k in range(samples)
+    )) if pages > 1 else list(range(pages))
+
+
+def _newest_star(scheduler, full_name):
+    # the REST list hides the newest stars of big repositories, GraphQL
+    # pages them newest first
+    owner, repo = full_name.split("/", 1)
+    result = scheduler.call(
+        run_query, _NEWEST_QUERY % (json.dumps(owner), json.dumps(repo))
+    )
+    repository = (result.get("data", None) or {}).get("repository", None)
+    if repository is None or not repository["stargazers"]["edges"]:
+        return None
+    gazers = repository["stargazers"]
+    return gazers["edges"][0]["starredAt"], gazers["totalCount"]
+
+
+def _sample_repo(client, scheduler, full_name, error, graphql=None):
+    repo = scheduler.call(load_repo_info, client, full_name)
+    if not repo or repo.stargazers_count == 0:
+        return []
+    total = repo.stargazers_count
+    capped = total > MAX_STAR_PAGES * PER_PAGE
+    pages = min(MAX_STAR_PAGES, math.ceil(total / PER_PAGE))
+    gazers = repo.get_stargazers_with_dates()
+    points = []
+    for n in _sample_pages(pages, error):
+        items = scheduler.call(gazers.get_page, n)
+        if not items:
+            break
+        points.append({
+            "full_name": full_name,
+            "starredAt": vars(items[0])["_rawData"]["starred_at"],
+            "stars": n * PER_PAGE + 1,
+            "capped": capped,
+        })
+        if n == pages - 1:
+            points.append({
+                "full_name": full_name,
+                "starredAt": vars(items[-1])["_rawData"]["starred_at"],
+                "stars": n * PER_PAGE + len(items),
+                "capped": capped,
+            })
+    if capped and points and graphql:
+        newest = _newest_star(graphql, full_name)
+        if newest and newest[1] > points[-1]["stars"]:
+            points.append({
+                "full_name": full_name,
+                "starredAt": newest[0],
+                "stars": newest[1],
+                "capped": capped,
+            })
+    return points
+
+
+def sample_stars(repos, dest_file, error=0.01, trace=False):
+    """Sample the star history curves of `repos` into a .parquet file.
+
+    Instead of paging all stargazers, evenly spaced pages of the REST
+    stargazer list are fetched and the starring time of their first star
+    is recorded together with its rank, the number of stars at that time.
+    Between two samples the curve is interpolated linearly, see
+    `interpolate_stars`. Since the curve never decreases, the count
+    interpolated at any time is off by less than `error` times the stars of
+    the repository.
+
+    GitHub lists no more than `MAX_STAR_PAGES` pages of stargazers, oldest
+    first. The curve of a bigger repository is sampled up to its last
+    listed star and ends at its newest star, queried through GraphQL, with
+    a straight line in between. Its samples are flagged `capped`, the
+    error bound does not hold past the listed stars.
+
+    Parameters
+    ----------
+    repos : list
+        The full names of the repositories
+    dest_file : str
+        The .parquet file to store the `full_name`, `starredAt`, `stars`
+        and `capped` columns
+    error : float
+        The error budget as fraction of the stars of a repository
+    trace : bool
+        Whether to print tracing information
+
+    Returns
+    -------
+    int
+        the number of samples written
+    """
+    pool = default_pool()
+    scheduler = QuotaScheduler(pool, trace=trace)
+    graphql = QuotaScheduler(pool, "graphql", trace=trace)
+    samples = 0
+    with pq.ParquetWriter(
+            dest_file, SAMPLE_SCHEMA, compression="snappy") as writer:
+        for full_name in repos:
+            points = _sample_repo(
+                pool.client(), scheduler, full_name, error, graphql
+            )
+            if points:
+                writer.write_table(pa.Table.from_pylist(points, SAMPLE_SCHEMA))
+            samples += len(points)
+            if trace:
+                capped = " (capped)" if points and points[0]["capped"] else ""
+                print(f"Sampled {len(points)} points of {full_name}{capped}")
+    return samples
+
+
+def interpolate_stars(samples, times):
+    """Interpolate the number of stars at `times` from sampled points.
+
+    Parameters
+    ----------
+    samples : DataFrame
+        The `starredAt` and `stars` columns of one repository written by
+        `sample_stars`
+    times : list
+        The ISO 8601 times to interpolate at
+
+    Returns
+    -------
+    ndarray
+        the number of stars at each of `times`
+    """
+    xp = pd.to_datetime(samples["starredAt"]).astype("int64")
+    x = pd.to_datetime(pd.Series(times)).astype("int64")
+    return np.interp(x, xp, samples["stars"], left=0)
 
 
 if __name__ == "__main__":
@@ -92,9 +422,4 @@ if __name__ == "__main__":
         "lencx/ChatGPT",
         # "LAION-AI/Open-Assistant",
     ]
-    dicts = []
-    for rep in repos:
-        owner, repo = rep.split("/")
-        dicts.extend(query_stars(owner, repo))
-        df = pd.DataFrame(dicts)
-        df.to_csv(f"{owner}_{repo}_stars.csv", index=False)
+    query_stars_batch(repos, "stars.parquet", trace=True)
@@ -2,12 +2,40 @@
 
 from .common import (
     load_access_token,
+    load_access_tokens,
     load_repo_info,
     eprint,
 )
 
+from .graphql import (
+    not_found,
+    run_query,
+)
+
+from .ledger import (
+    JobLedger,
+)
+
+from .ratelimit import (
+    QuotaScheduler,
+    TokenBucket,
+)
+
+from .tokens import (
+    TokenPool,
+    default_pool,
+)
+
 __all__ = [
     "load_access_token",
+    "load_access_tokens",
     "load_repo_info",
     "eprint",
+    "not_found",
+    "run_query",
+    "JobLedger",
+    "QuotaScheduler",
+    "TokenBucket",
+    "TokenPool",
+    "default_pool",
 ]
@@ -8,14 +8,23 @@ This module includes common functions such as:
     * configuration
     * date arithmetic
     * generic repository access
+    * crash-safe file replacement and checkpoints
 
 """
 
 import configparser
+import json
+import os
 import sys
 
+from contextlib import contextmanager
 from datetime import date, timedelta
+from github import RateLimitExceededException
 from isodate import parse_datetime
+from .ratelimit import limited_call
+
+# page size requested from the github API
+PER_PAGE = 100
 
 
 def eprint(*args, **kwargs):
@@ -41,6 +50,37 @@ def load_access_token():
     return section['access_token']
 
 
+def load_access_tokens():
+    """Load all github API access tokens from environment and config file.
+
+    Tokens are read from the comma separated `GITHUB_TOKENS` and the single
+    `GITHUB_TOKEN` environment variables, then from the `access_token` and
+    the comma or newline separated `access_tokens` keys in the `github`
+    section of `credential.ini`.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    list
+        the github access tokens without duplicates
+    """
+    tokens = []
+    tokens.extend(os.environ.get("GITHUB_TOKENS", "").split(","))
+    tokens.append(os.environ.get("GITHUB_TOKEN", ""))
+    parser = configparser.ConfigParser()
+    parser.read('credential.ini')
+    if parser.has_section('github'):
+        section = parser['github']
+        tokens.append(section.get('access_token', ''))
+        tokens.extend(
+            section.get('access_tokens', '').replace("\n", ",").split(",")
+        )
+    return list(dict.fromkeys(t.strip() for t in tokens if t.strip()))
+
+
 def load_repo_info(client, repo_name):
     """Access the github repository specified by `repo_name`.
 
@@ -55,11 +95,68 @@ def load_repo_info(client, repo_name):
     """
     try:
         return client.get_repo(repo_name)
+    except RateLimitExceededException:
+        # throttled is not missing, leave it to the caller to retry
+        raise
     except Exception as e:
         print(f"Fail to locate {repo_name} due to: {e}")
         return None
 
 
+def iterate_page_lists(paginated, limiter=None, per_page=PER_PAGE):
+    """Iterate a paginated list, yielding the items of each page as a list.
+
+    Every page request goes through `limiter` so that callers can pace or
+    guard each API call.
+
+    Parameters
+    ----------
+    paginated : PaginatedList
+        the paginated list returned by the github client
+    limiter : TokenBucket or QuotaScheduler
+        the limiter of each page request, None for no limit
+    per_page : int
+        the page size the client was configured with
+
+    Returns
+    -------
+    iteratable
+        the list of items of each page
+    """
+    n = 0
+    while True:
+        items = limited_call(limiter, paginated.get_page, n)
+        if items:
+            yield items
+        if len(items) < per_page:
+            break
+        n += 1
+
+
+def iterate_pages(paginated, limiter=None, per_page=PER_PAGE):
+    """Iterate a paginated list page by page.
+
+    Unlike plain iteration, every page request goes through `limiter` so
+    that callers can pace or guard each API call.
+
+    Parameters
+    ----------
+    paginated : PaginatedList
+        the paginated list returned by the github client
+    limiter : TokenBucket or QuotaScheduler
+        the limiter of each page request, None for no limit
+    per_page : int
+        the page size the client was configured with
+
+    Returns
+    -------
+    iteratable
+        the items of all pages
+    """
+    for items in iterate_page_lists(paginated, limiter, per_page):
+        yield from items
+
+
 def daterange(start_date, end_date, slice):
     """Divide date range into smaller sub ranges.
 
@@ -153,3 +250,123 @@ def format_date(d):
         the string representing date in `YYYY-MM-DD` format
     """
     return d.strftime("%Y-%m-%d")
+
+
+@contextmanager
+def atomic_path(path):
+    """Yield a temporary path which atomically replaces `path` on success.
+
+    The temporary file lives next to `path` so that the final rename stays
+    on one file system. It is removed if the body raises.
+
+    Parameters
+    ----------
+    path : str
+        the path of the file to write
+
+    Returns
+    -------
+    str
+        the temporary path to write to
+    """
+    tmp = f"{path}.tmp"
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def load_state(path):
+    """Load the JSON state saved by `save_state`.
+
+    Parameters
+    ----------
+    path : str
+        the path of the state file
+
+    Returns
+    -------
+    dict
+        the state, None if the state file does not exist
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_state(path, state):
+    """Save `state` as JSON, atomically replacing the previous state.
+
+    Parameters
+    ----------
+    path : str
+        the path of the state file
+    state : dict
+        the JSON serializable state
+
+    Returns
+    -------
+    None
+    """
+    with atomic_path(path) as tmp:
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+
+
+def save_checkpoint(path, fh, state, fh_csv=None):
+    """Save `state` once everything written to `fh` is on disk.
+
+    The byte offset of `fh` is recorded as `offset`, a resumed run cuts the
+    file back to it with `truncate_file` to drop what was written after the
+    checkpoint. The offset of the optional `fh_csv` is recorded as
+    `csv_offset` likewise.
+
+    Parameters
+    ----------
+    path : str
+        the path of the checkpoint file
+    fh : file
+        the output file opened for writing
+    state : dict
+        the JSON serializable state to resume from
+    fh_csv : file
+        a second output file written along `fh`, None if there is none
+
+    Returns
+    -------
+    None
+    """
+    state = dict(state)
+    for key, f in (("offset", fh), ("csv_offset", fh_csv)):
+        if f is not None:
+            f.flush()
+            os.fsync(f.fileno())
+            state[key] = f.tell()
+    save_state(path, state)
+
+
+def truncate_file(path, offset):
+    """Cut the file at `path` back to `offset` bytes.
+
+    Parameters
+    ----------
+    path : str
+        the path of the file
+    offset : int
+        the size to keep
+
+    Returns
+    -------
+    None
+    """
+    with open(path, 'r+') as f:
+        f.truncate(offset)
+
+
+def remove_file(path):
+    """Remove the file at `path` if it exists."""
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Queries of the GitHub GraphQL API shared by the retrievers.
+
+Every query is routed to the pooled token with the most GraphQL quota
+left, an exhausted quota is raised as `RateLimitExceededException` for the
+`QuotaScheduler` to wait on.
+
+"""
+
+import requests
+import threading
+
+from github import RateLimitExceededException
+from .tokens import default_pool
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+# one session per thread, which keeps its connections alive
+_local = threading.local()
+
+
+def _session():
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+
+def run_query(query):
+    """Run a GraphQL query with a token of the default pool.
+
+    Parameters
+    ----------
+    query : str
+        the GraphQL query
+
+    Returns
+    -------
+    dict
+        the JSON result, with its `errors` if any
+    """
+    pool = default_pool()
+    token = pool.token("graphql")
+    headers = {"Authorization": f"bearer {token}"}
+    request = _session().post(
+        GRAPHQL_URL,
+        json={'query': query},
+        headers=headers
+    )
+    if request.status_code == 401:
+        pool.discard(token)
+    pool.update(token, request.headers, "graphql")
+    if request.status_code in (403, 429) and (
+            "Retry-After" in request.headers
+            or request.headers.get("X-RateLimit-Remaining", None) == "0"):
+        raise RateLimitExceededException(
+            request.status_code, request.text, dict(request.headers)
+        )
+    if request.status_code == 200:
+        result = request.json()
+        # GraphQL reports an exhausted quota with status 200
+        if any(
+                e.get("type", None) == "RATE_LIMITED"
+                for e in result.get("errors", None) or []):
+            raise RateLimitExceededException(
+                request.status_code, result, dict(request.headers)
+            )
+        return result
+    else:
+        raise Exception(
+            "Query failed with return code of {}. {}".format(
+                request.status_code,
+                query
+            )
+        )
+
+
+def not_found(result):
+    """Return the aliases of the missing objects of a query result.
+
+    Parameters
+    ----------
+    result : dict
+        the result of `run_query`
+
+    Returns
+    -------
+    set
+        the first path item of every NOT_FOUND error
+
+    Raises
+    ------
+    Exception
+        any other error fails the query
+    """
+    missing = set()
+    for error in result.get("errors", None) or []:
+        path = error.get("path", None) or []
+        if error.get("type", None) != "NOT_FOUND" or not path:
+            raise Exception(
+                f"Query failed: {error.get('message', None) or error}"
+            )
+        missing.add(path[0])
+    return missing
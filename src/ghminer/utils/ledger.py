@@ -0,0 +1,593 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Job ledger to track the progress of retrievals.
+
+Each repository, or module, to retrieve is a job in an indexed SQLite
+table. A job is `pending` until a worker starts it, `running` while it
+is worked on and `done` or `failed` afterwards. Failed jobs are retried
+up to `MAX_ATTEMPTS` times. The result columns of done jobs can be
+exported to the .csv progress files the rest of the tooling reads.
+
+Several processes, on one host or on hosts sharing the ledger file, may
+work on one ledger. Each worker leases small batches of jobs, renews its
+leases by heartbeat while working and releases them when it stops. The
+jobs of a worker which crashed are leased again once the leases expire,
+so no job is worked on twice at the same time.
+
+A ledger of one host uses the write-ahead log of SQLite, which needs
+memory shared between the processes and is therefore unsafe on network
+file systems. A ledger shared by several hosts uses the rollback journal
+instead, its file system must still implement the byte-range locks of
+SQLite correctly, e.g. NFS with its lock manager, and the clocks of the
+hosts should agree within a fraction of `LEASE_SECONDS`.
+
+"""
+
+import json
+import os
+import pandas as pd
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from timeit import default_timer as timer
+from .common import atomic_path
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# attempts of a job before it is left failed
+MAX_ATTEMPTS = 3
+# keys per statement when jobs are added in bulk
+BATCH_SIZE = 10000
+# seconds a lease lasts without heartbeat, heartbeats renew it 3 times
+LEASE_SECONDS = 600
+# jobs leased at once, small batches spread the tail across workers
+LEASE_BATCH = 10
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    seconds REAL NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    updated_at TEXT,
+    owner TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, seq);
+"""
+
+# jobs to work on: pending, failed with attempts left or with an expired
+# lease, parameters are max attempts and the current time
+_AVAILABLE = (
+    f"(status = '{PENDING}' OR (attempts < ? AND (status = '{FAILED}' "
+    f"OR (status = '{RUNNING}' AND lease_until < ?))))"
+)
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class JobLedger:
+    """A thread-safe and transactional ledger of retrieval jobs.
+
+    Attributes
+    ----------
+    path : str
+        the path of the SQLite database file
+    max_attempts : int
+        the attempts of a job before it is left failed
+    worker : str
+        the identity of this worker in the leases
+    lease : float
+        the seconds a lease lasts without heartbeat
+    shared : bool
+        whether processes on several hosts share the file
+
+    """
+
+    def __init__(
+            self, path, max_attempts=MAX_ATTEMPTS, worker=None,
+            lease=LEASE_SECONDS, shared=False):
+        """Create an instance of `JobLedger` object.
+
+        Parameters
+        ----------
+        path : str
+            the path of the SQLite database file, created if missing
+        max_attempts : int
+            the attempts of a job before it is left failed
+        worker : str
+            the identity of this worker in the leases, unique per ledger
+            object by default
+        lease : float
+            the seconds a lease lasts without heartbeat
+        shared : bool
+            whether processes on several hosts share the file, which then
+            uses the rollback journal instead of the write-ahead log
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_attempts = max_attempts
+        self.worker = worker or "%s:%d:%s" % (
+            socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8]
+        )
+        self.lease = lease
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+        self._conn = sqlite3.connect(
+            path, timeout=60, check_same_thread=False,
+            isolation_level=None
+        )
+        if shared:
+            # the write-ahead log needs shared memory, which hosts sharing
+            # a network file system do not have
+            self._conn.execute("PRAGMA journal_mode=DELETE")
+        else:
+            # readers do not block the writer, other processes included
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        # take the write lock up front, other processes wait for it
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _write(self, sql, params=()):
+        with self._transaction() as conn:
+            if isinstance(params, list):
+                return conn.executemany(sql, params).rowcount
+            return conn.execute(sql, params).rowcount
+
+    def _read(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def add(self, keys):
+        """Add jobs, keys already in the ledger are left untouched.
+
+        Parameters
+        ----------
+        keys : iterable
+            the keys of the jobs, e.g. repository full names
+
+        Returns
+        -------
+        int
+            the number of jobs added
+        """
+        added = 0
+        batch = []
+        for key in keys:
+            batch.append((key,))
+            if len(batch) == BATCH_SIZE:
+                added += self._write(
+                    "INSERT OR IGNORE INTO jobs (key) VALUES (?)", batch
+                )
+                batch = []
+        if batch:
+            added += self._write(
+                "INSERT OR IGNORE INTO jobs (key) VALUES (?)", batch
+            )
+        return added
+
+    def import_csv(self, csv_file, key_column):
+        """Record the rows of a legacy .csv progress file as done jobs.
+
+        Parameters
+        ----------
+        csv_file : str
+            the .csv progress file written before the ledger existed
+        key_column : str
+            the column holding the job keys
+
+        Returns
+        -------
+        int
+            the number of jobs imported
+        """
+        df = pd.read_csv(csv_file, dtype=str, keep_default_na=False)
+        columns = [
+            c for c in df.columns if c not in (key_column, "last_updated")
+        ]
+        rows = [
+            (
+                r[key_column],
+                json.dumps({c: r[c] for c in columns}),
+                r.get("last_updated", None) or _now(),
+            )
+            for r in df.to_dict("records")
+        ]
+        return self._write(
+            "INSERT OR IGNORE INTO jobs (key, status, result, updated_at) "
+            f"VALUES (?, '{DONE}', ?, ?)",
+            rows
+        )
+
+    def recover(self):
+        """Return jobs whose lease expired to pending.
+
+        Returns
+        -------
+        int
+            the number of jobs recovered
+        """
+        return self._write(
+            f"UPDATE jobs SET status = '{PENDING}', owner = NULL, "
+            f"lease_until = NULL WHERE status = '{RUNNING}' "
+            "AND lease_until < ?",
+            (time.time(),)
+        )
+
+    def reset(self, keys, status=DONE, if_idle=False):
+        """Return the jobs of `keys` in `status` to pending to revisit them.
+
+        Parameters
+        ----------
+        keys : iterable
+            the keys of the jobs
+        status : str
+            the status of the jobs to reset
+        if_idle : bool
+            only reset when no job is pending or leased, so that workers
+            joining a round of revisits do not start it over
+
+        Returns
+        -------
+        int
+            the number of jobs reset
+        """
+        with self._transaction() as conn:
+            if if_idle:
+                busy = conn.execute(
+                    f"SELECT COUNT(*) FROM jobs WHERE status = '{PENDING}' "
+                    f"OR (status = '{RUNNING}' AND lease_until >= ?)",
+                    (time.time(),)
+                ).fetchone()[0]
+                if busy:
+                    return 0
+            return conn.executemany(
+                f"UPDATE jobs SET status = '{PENDING}', attempts = 0 "
+                "WHERE key = ? AND status = ?",
+                [(k, status) for k in keys]
+            ).rowcount
+
+    def todo(self):
+        """Return the keys of jobs to work on, in the order they were added.
+
+        Returns
+        -------
+        list
+            the keys of pending jobs and failed jobs with attempts left
+        """
+        rows = self._read(
+            f"SELECT key FROM jobs WHERE {_AVAILABLE} ORDER BY seq",
+            (self.max_attempts, time.time())
+        )
+        return [r[0] for r in rows]
+
+    def schedule(self, keys):
+        """Add the jobs of `keys` and return those still to work on.
+
+        Parameters
+        ----------
+        keys : list
+            the keys of the jobs, e.g. the repositories of a list file
+
+        Returns
+        -------
+        list
+            the keys to work on, in the order of `keys`
+        """
+        self.add(keys)
+        todo = set(self.todo())
+        return [k for k in dict.fromkeys(keys) if k in todo]
+
+    def lease_batch(self, size=LEASE_BATCH):
+        """Lease up to `size` jobs to this worker.
+
+        The leases are renewed by a heartbeat thread until the jobs are
+        finished or released.
+
+        Parameters
+        ----------
+        size : int
+            the maximum number of jobs to lease
+
+        Returns
+        -------
+        list
+            the keys of the leased jobs, empty when no job is left
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            keys = [r[0] for r in conn.execute(
+                f"SELECT key FROM jobs WHERE {_AVAILABLE} "
+                "ORDER BY seq LIMIT ?",
+                (self.max_attempts, now, size)
+            )]
+            conn.executemany(
+                f"UPDATE jobs SET status = '{RUNNING}', owner = ?, "
+                "lease_until = ? WHERE key = ?",
+                [(self.worker, now + self.lease, k) for k in keys]
+            )
+        if keys:
+            self._start_heartbeat()
+        return keys
+
+    def batches(self, size=LEASE_BATCH):
+        """Lease batches of jobs until no job is left.
+
+        Parameters
+        ----------
+        size : int
+            the maximum number of jobs per batch
+
+        Returns
+        -------
+        iterable
+            the lists of leased keys
+        """
+        while True:
+            keys = self.lease_batch(size)
+            if not keys:
+                return
+            yield keys
+
+    def heartbeat(self):
+        """Renew the leases of the jobs this worker is running.
+
+        Returns
+        -------
+        int
+            the number of leases renewed
+        """
+        return self._write(
+            "UPDATE jobs SET lease_until = ? "
+            f"WHERE owner = ? AND status = '{RUNNING}'",
+            (time.time() + self.lease, self.worker)
+        )
+
+    def _beat(self):
+        while not self._stop.wait(self.lease / 3):
+            self.heartbeat()
+
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(
+                    target=self._beat, daemon=True
+                )
+                self._heartbeat.start()
+
+    def release(self):
+        """Return the jobs this worker still holds to pending.
+
+        Returns
+        -------
+        int
+            the number of jobs released
+        """
+        return self._write(
+            f"UPDATE jobs SET status = '{PENDING}', owner = NULL, "
+            f"lease_until = NULL WHERE owner = ? AND status = '{RUNNING}'",
+            (self.worker,)
+        )
+
+    def start(self, key):
+        """Mark the job running under this worker and count the attempt."""
+        self._write(
+            f"UPDATE jobs SET status = '{RUNNING}', owner = ?, "
+            "lease_until = ?, attempts = attempts + 1, updated_at = ? "
+            "WHERE key = ?",
+            (self.worker, time.time() + self.lease, _now(), key)
+        )
+
+    def finish(self, key, result, seconds=0):
+        """Mark the job done with its result.
+
+        Parameters
+        ----------
+        key : str
+            the key of the job
+        result : dict
+            the result columns of the job
+        seconds : float
+            the time the attempt took
+        """
+        self._write(
+            f"UPDATE jobs SET status = '{DONE}', result = ?, error = NULL, "
+            "seconds = seconds + ?, updated_at = ?, owner = NULL, "
+            "lease_until = NULL WHERE key = ?",
+            (json.dumps(result), seconds, _now(), key)
+        )
+
+    def fail(self, key, error, seconds=0):
+        """Mark the job failed with the error of the attempt.
+
+        Parameters
+        ----------
+        key : str
+            the key of the job
+        error : str
+            the description of the error
+        seconds : float
+            the time the attempt took
+        """
+        self._write(
+            f"UPDATE jobs SET status = '{FAILED}', error = ?, "
+            "seconds = seconds + ?, updated_at = ?, owner = NULL, "
+            "lease_until = NULL WHERE key = ?",
+            (error, seconds, _now(), key)
+        )
+
+    def run(self, key, fn, *args, **kwargs):
+        """Run one job and record its outcome.
+
+        `fn` returns the result columns of the job as a dict. An exception
+        marks the job failed, it is retried by later runs while attempts
+        are left.
+
+        Parameters
+        ----------
+        key : str
+            the key of the job
+        fn : callable
+            the function doing the job
+        args : list
+            the positional arguments of `fn`
+        kwargs : dict
+            the keyword arguments of `fn`
+
+        Returns
+        -------
+        dict
+            the result of the job, None when it failed
+        """
+        self.start(key)
+        t0 = timer()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            print(f"Job {key} failed due to: {e}")
+            self.fail(key, f"{type(e).__name__}: {e}", timer() - t0)
+            return None
+        self.finish(key, result, timer() - t0)
+        return result
+
+    def counts(self):
+        """Return the number of jobs per status."""
+        return dict(self._read(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+        ))
+
+    def stats(self):
+        """Return the cost of the jobs per status.
+
+        Returns
+        -------
+        dict
+            status => (jobs, attempts, total seconds, slowest seconds)
+        """
+        rows = self._read(
+            "SELECT status, COUNT(*), SUM(attempts), SUM(seconds), "
+            "MAX(seconds) FROM jobs GROUP BY status"
+        )
+        return {r[0]: tuple(r[1:]) for r in rows}
+
+    def export_csv(self, csv_file, key_column, columns):
+        """Write the results of done jobs into a .csv progress file.
+
+        Parameters
+        ----------
+        csv_file : str
+            the .csv file to write, replaced atomically
+        key_column : str
+            the column to hold the job keys
+        columns : list
+            the result columns to write after the key
+
+        Returns
+        -------
+        int
+            the number of rows written
+        """
+        rows = self._read(
+            "SELECT key, result, updated_at FROM jobs "
+            f"WHERE status = '{DONE}' ORDER BY updated_at, seq"
+        )
+        records = []
+        for key, result, updated_at in rows:
+            values = json.loads(result) if result else {}
+            record = {key_column: key}
+            record.update({c: values.get(c, None) for c in columns})
+            record["last_updated"] = updated_at
+            records.append(record)
+        df = pd.DataFrame(
+            records, columns=[key_column] + columns + ["last_updated"]
+        )
+        with atomic_path(csv_file) as tmp:
+            df.to_csv(tmp, index=False)
+        return len(records)
+
+    def close(self):
+        """Release the jobs still held and close the database connection."""
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        self.release()
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        """Enter the runtime context."""
+        return self
+
+    def __exit__(self, *exc):
+        """Close the ledger when leaving the runtime context."""
+        self.close()
+
+    def __repr__(self):
+        """Represnt this object as a string for debug purpose."""
+        return f"path: {self.path}, worker: {self.worker}"
+
+    def __str__(self):
+        """Represnt this object as a string."""
+        return f"JobLedger at {self.path}"
+
+
+def open_ledger(base_dir, progress_file, key_column, ledger_file=None):
+    """Open the ledger kept next to a .csv progress file.
+
+    The ledger replaces `{base_dir}/{progress_file}` as the source of
+    truth, e.g. `progress.csv` is tracked in `progress.db`, unless an
+    explicit `ledger_file` is shared by workers on several hosts. An
+    existing progress file from an earlier version is imported on first
+    use, and jobs whose lease expired go back to pending.
+
+    Parameters
+    ----------
+    base_dir : str
+        the directory of the progress file
+    progress_file : str
+        the name of the .csv progress file
+    key_column : str
+        the column holding the job keys
+    ledger_file : str
+        the path of the ledger, None to keep it next to the progress file
+
+    Returns
+    -------
+    JobLedger
+        the opened ledger
+    """
+    csv_path = Path(base_dir) / progress_file
+    db_path = Path(ledger_file) if ledger_file else csv_path.with_suffix(".db")
+    fresh = not db_path.exists()
+    ledger = JobLedger(str(db_path), shared=ledger_file is not None)
+    if fresh and csv_path.exists():
+        ledger.import_csv(str(csv_path), key_column)
+    ledger.recover()
+    return ledger
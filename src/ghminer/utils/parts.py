@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Concurrent fetch of a long history split into windows.
+
+A very large history is split into windows which are fetched
+concurrently, each into its own part file in a `.parts` directory next to
+the output file, then stitched back in the order of the windows.
+
+The windows are planned once and saved in `_plan.json`. A window is
+complete once the marker `{idx:05d}.meta` is written after its part, a
+run interrupted by a crash keeps the complete windows and fetches the
+others again.
+
+"""
+
+import shutil
+
+from functools import partial
+from pathlib import Path
+from .common import atomic_path
+from .common import load_state
+from .common import save_state
+
+# the cap of the number of windows of one history
+MAX_PARTS = 1000
+# the plan of the windows in the parts directory
+PLAN_FILE = "_plan.json"
+
+
+def parts_dir(path):
+    """Return the parts directory of the output file `path`."""
+    return f"{path}.parts"
+
+
+def has_plan(path):
+    """Tell whether a concurrent fetch into `path` was interrupted."""
+    return Path(f"{parts_dir(path)}/{PLAN_FILE}").exists()
+
+
+def part_count(total, per_part, workers):
+    """Return the number of windows of `total` items.
+
+    Parameters
+    ----------
+    total : int
+        the number of items of the history
+    per_part : int
+        the number of items a window should hold
+    workers : int
+        the number of threads fetching the windows
+
+    Returns
+    -------
+    int
+        at least one window per worker and at most `MAX_PARTS`
+    """
+    return min(MAX_PARTS, max(workers, -(-total // per_part)))
+
+
+def load_plan(path, make_jobs):
+    """Load the windows of an interrupted fetch, or plan and save them.
+
+    Parameters
+    ----------
+    path : str
+        the output file
+    make_jobs : callable
+        returns the windows as lists whose first item is the index
+
+    Returns
+    -------
+    list
+        the windows as tuples
+    """
+    plan_file = f"{parts_dir(path)}/{PLAN_FILE}"
+    plan = load_state(plan_file)
+    if plan:
+        # complete windows of the interrupted run are kept
+        return [tuple(j) for j in plan["jobs"]]
+    jobs = [tuple(j) for j in make_jobs()]
+    Path(parts_dir(path)).mkdir(parents=True, exist_ok=True)
+    save_state(plan_file, {"jobs": jobs})
+    return jobs
+
+
+def _fetch_part(directory, fetch, job):
+    idx = job[0]
+    meta_file = f"{directory}/{idx:05d}.meta"
+    meta = load_state(meta_file)
+    if meta:
+        return meta
+    with atomic_path(f"{directory}/{idx:05d}.json") as tmp:
+        with open(tmp, 'w') as fh:
+            meta = fetch(job, fh)
+    # the marker of a complete window, written after its part
+    save_state(meta_file, meta)
+    return meta
+
+
+def fetch_parts(path, jobs, fetch, executor):
+    """Fetch the windows `jobs` concurrently, skipping complete ones.
+
+    Parameters
+    ----------
+    path : str
+        the output file
+    jobs : list
+        the windows, see `load_plan`
+    fetch : callable
+        writes one window to the file handle it is given with the window,
+        returns the JSON serializable marker of the window
+    executor : Executor
+        the executor running `fetch`
+
+    Returns
+    -------
+    list
+        the marker of each window
+    """
+    return list(executor.map(
+        partial(_fetch_part, parts_dir(path), fetch), jobs
+    ))
+
+
+def stitch_parts(path, jobs, fh):
+    """Copy the parts of `jobs` in their order to `fh`.
+
+    Parameters
+    ----------
+    path : str
+        the output file
+    jobs : list
+        the windows, see `load_plan`
+    fh : file
+        the output file opened for writing
+
+    Returns
+    -------
+    None
+    """
+    for job in jobs:
+        with open(f"{parts_dir(path)}/{job[0]:05d}.json", 'r') as fh_part:
+            shutil.copyfileobj(fh_part, fh)
+
+
+def remove_parts(path):
+    """Remove the parts directory once the output file is complete."""
+    shutil.rmtree(parts_dir(path))
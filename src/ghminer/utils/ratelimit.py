@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Rate limiting primitives shared by the retrievers.
+
+This module includes:
+
+    * token bucket to pace calls under a fixed quota
+    * quota scheduler to pause until the quota resets
+    * adaptive concurrency under the secondary rate limits
+
+"""
+
+import threading
+import time
+
+from github import RateLimitExceededException
+
+# github allows 30 search API calls per minute for authenticated users
+SEARCH_QUOTA = (30, 60)
+# and 5000 calls per hour for the rest of the REST API
+CORE_QUOTA = (5000, 3600)
+CORE_BURST = 100
+
+# calls kept in reserve, work pauses once the quota drops to it
+QUOTA_RESERVE = 50
+# seconds to wait past the advertised reset, clocks drift
+RESET_SLACK = 5
+# seconds to wait when a limited response carries no reset hint
+DEFAULT_BACKOFF = 60
+# share of the concurrency kept after a secondary rate limit
+DECREASE_FACTOR = 0.5
+
+
+class TokenBucket:
+    """A thread-safe token bucket to pace API calls under a quota.
+
+    Attributes
+    ----------
+    tokens : int
+        the number of calls allowed per `period`
+    period : float
+        the length of the quota period in seconds
+    burst : int
+        the maximum number of calls issued back to back
+
+    """
+
+    def __init__(self, tokens, period, burst=1):
+        """Create an instance of `TokenBucket` object.
+
+        Parameters
+        ----------
+        tokens : int
+            the number of calls allowed per `period`
+        period : float
+            the length of the quota period in seconds
+        burst : int
+            the maximum number of calls issued back to back
+        """
+        self._tokens = tokens
+        self._period = period
+        self._burst = burst
+        self._rate = tokens / period
+        self._available = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self):
+        """Return tokens per period."""
+        return self._tokens
+
+    @property
+    def period(self):
+        """Return period."""
+        return self._period
+
+    @property
+    def burst(self):
+        """Return burst."""
+        return self._burst
+
+    def acquire(self):
+        """Block until a token is available, then consume it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._available = min(
+                    self._burst,
+                    self._available + (now - self._last) * self._rate
+                )
+                self._last = now
+                if self._available >= 1:
+                    self._available -= 1
+                    return
+                wait = (1 - self._available) / self._rate
+            time.sleep(wait)
+
+    def call(self, fn, *args, **kwargs):
+        """Acquire a token, then call `fn` with the given arguments."""
+        self.acquire()
+        return fn(*args, **kwargs)
+
+    def __repr__(self):
+        """Represnt this object as a string for debug purpose."""
+        return f"tokens: {self.tokens}, period: {self.period}"
+
+    def __str__(self):
+        """Represnt this object as a string."""
+        return f"{self.tokens}/{self.period}s"
+
+
+def _headers(exception):
+    return {k.lower(): v for k, v in (exception.headers or {}).items()}
+
+
+def _is_secondary(exception):
+    # the primary limit is only hit once the quota is used up
+    return _headers(exception).get("x-ratelimit-remaining", None) != "0"
+
+
+def _reset_of(exception):
+    headers = _headers(exception)
+    if "retry-after" in headers:
+        return time.time() + int(headers["retry-after"])
+    if "x-ratelimit-reset" in headers:
+        return int(headers["x-ratelimit-reset"])
+    return time.time() + DEFAULT_BACKOFF
+
+
+class QuotaScheduler:
+    """A thread-safe scheduler that keeps calls within the token quota.
+
+    Before every call the remaining quota of the pooled tokens is checked,
+    as reported in the `X-RateLimit-Remaining` and `X-RateLimit-Reset`
+    headers of the latest responses. Once even the freshest token is down
+    to `reserve` calls, work pauses until the quota resets. A call still
+    hitting the limit, e.g. when concurrent calls drained the token, waits
+    for the reset and is retried, so it never fails because of throttling.
+
+    Attributes
+    ----------
+    pool : TokenPool
+        the pool of access tokens whose quota is watched
+    resource : str
+        the rate limit resource, `core`, `search` or `graphql`
+    reserve : int
+        the number of calls kept in reserve
+    limiter : TokenBucket
+        the optional limiter pacing the calls
+    concurrency : AdaptiveConcurrency
+        the optional gate adapting the number of concurrent calls
+
+    """
+
+    def __init__(
+            self, pool, resource="core", reserve=QUOTA_RESERVE,
+            limiter=None, concurrency=None, trace=False):
+        """Create an instance of `QuotaScheduler` object.
+
+        Parameters
+        ----------
+        pool : TokenPool
+            the pool of access tokens whose quota is watched
+        resource : str
+            the rate limit resource, `core`, `search` or `graphql`
+        reserve : int
+            the number of calls kept in reserve
+        limiter : TokenBucket
+            the optional limiter pacing the calls
+        concurrency : AdaptiveConcurrency
+            the optional gate adapting the number of concurrent calls
+        trace : bool
+            whether to print pauses
+        """
+        self.pool = pool
+        self.resource = resource
+        self.reserve = reserve
+        self.limiter = limiter
+        self.concurrency = concurrency
+        self._trace = trace
+
+    def _sleep_until(self, reset, reason):
+        wait = max(0, reset - time.time()) + RESET_SLACK
+        if self._trace:
+            print(f"Pause {wait:.0f}s for {self.resource} quota: {reason}")
+        time.sleep(wait)
+
+    def acquire(self):
+        """Block until a call fits in the quota."""
+        if self.limiter:
+            self.limiter.acquire()
+        remaining, reset = self.pool.quota(self.resource)
+        if remaining <= self.reserve:
+            self._sleep_until(reset, f"{remaining} calls left")
+
+    def call(self, fn, *args, **kwargs):
+        """Call `fn` within the quota, retrying after rate limit errors.
+
+        Parameters
+        ----------
+        fn : callable
+            the function issuing one API call
+        args : list
+            the positional arguments of `fn`
+        kwargs : dict
+            the keyword arguments of `fn`
+
+        Returns
+        -------
+        object
+            the return value of `fn`
+        """
+        while True:
+            self.acquire()
+            try:
+                return limited_call(self.concurrency, fn, *args, **kwargs)
+            except RateLimitExceededException as e:
+                # the exhausted token is recorded in the pool, retry at
+                # once when another token has quota left
+                remaining, _ = self.pool.quota(self.resource)
+                if _is_secondary(e) or remaining <= self.reserve:
+                    self._sleep_until(_reset_of(e), "rate limit exceeded")
+
+    def __repr__(self):
+        """Represnt this object as a string for debug purpose."""
+        return f"resource: {self.resource}, reserve: {self.reserve}"
+
+    def __str__(self):
+        """Represnt this object as a string."""
+        return f"{self.resource} quota scheduler"
+
+
+class AdaptiveConcurrency:
+    """A thread-safe gate adapting the number of concurrent calls.
+
+    Github answers bursts of concurrent calls with secondary rate limits,
+    403 responses carrying a `Retry-After` header. The gate follows the
+    additive increase, multiplicative decrease scheme: every successful
+    call raises the limit by one over the current limit, i.e. by one per
+    round of calls, while a secondary rate limit cuts it by
+    `DECREASE_FACTOR` and holds all calls until `Retry-After` elapses.
+    The limit thus settles just below the highest sustainable concurrency.
+
+    Attributes
+    ----------
+    limit : float
+        the current number of concurrent calls allowed
+    min_limit : int
+        the lower bound of the limit
+    max_limit : int
+        the upper bound of the limit, e.g. the number of worker threads
+
+    """
+
+    def __init__(self, max_limit, min_limit=1, limit=None, trace=False):
+        """Create an instance of `AdaptiveConcurrency` object.
+
+        Parameters
+        ----------
+        max_limit : int
+            the upper bound of the limit, e.g. the number of worker threads
+        min_limit : int
+            the lower bound of the limit
+        limit : float
+            the initial limit, `min_limit` by default
+        trace : bool
+            whether to print the adjustments
+        """
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self._limit = float(limit or min_limit)
+        self._in_flight = 0
+        self._hold_until = 0
+        self._trace = trace
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self):
+        """Return the current limit."""
+        return self._limit
+
+    def acquire(self):
+        """Block until a call is allowed, then count it in flight."""
+        with self._cond:
+            while True:
+                wait = self._hold_until - time.time()
+                if wait > 0:
+                    self._cond.wait(wait)
+                elif self._in_flight >= int(self._limit):
+                    self._cond.wait()
+                else:
+                    self._in_flight += 1
+                    return
+
+    def release(self, retry_at=None):
+        """Count a call done, `retry_at` is set when it was throttled.
+
+        Parameters
+        ----------
+        retry_at : float
+            the unix timestamp after which calls may resume, None when the
+            call succeeded
+        """
+        with self._cond:
+            self._in_flight -= 1
+            if retry_at is None:
+                self._limit = min(
+                    self.max_limit, self._limit + 1 / self._limit
+                )
+            elif time.time() >= self._hold_until:
+                # calls in flight during the same burst are throttled too,
+                # they must not cut the limit again
+                self._limit = max(
+                    self.min_limit, self._limit * DECREASE_FACTOR
+                )
+                self._hold_until = retry_at
+                if self._trace:
+                    print("Secondary rate limit, hold %.0fs at %d calls" % (
+                        retry_at - time.time(), int(self._limit)
+                    ))
+            else:
+                self._hold_until = max(self._hold_until, retry_at)
+            self._cond.notify_all()
+
+    def call(self, fn, *args, **kwargs):
+        """Call `fn` within the limit, retrying after secondary limits.
+
+        Parameters
+        ----------
+        fn : callable
+            the function issuing one API call
+        args : list
+            the positional arguments of `fn`
+        kwargs : dict
+            the keyword arguments of `fn`
+
+        Returns
+        -------
+        object
+            the return value of `fn`
+        """
+        while True:
+            self.acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except RateLimitExceededException as e:
+                if not _is_secondary(e):
+                    self.release()
+                    raise
+                self.release(_reset_of(e))
+                continue
+            except BaseException:
+                self.release()
+                raise
+            self.release()
+            return result
+
+    def __repr__(self):
+        """Represnt this object as a string for debug purpose."""
+        return f"limit: {self.limit}, max_limit: {self.max_limit}"
+
+    def __str__(self):
+        """Represnt this object as a string."""
+        return f"{int(self.limit)}/{self.max_limit} concurrent calls"
+
+
+def limited_call(limiter, fn, *args, **kwargs):
+    """Call `fn` through `limiter`, or directly when there is none.
+
+    Parameters
+    ----------
+    limiter : TokenBucket or QuotaScheduler
+        the limiter of the call, None for no limit
+    fn : callable
+        the function issuing one API call
+    args : list
+        the positional arguments of `fn`
+    kwargs : dict
+        the keyword arguments of `fn`
+
+    Returns
+    -------
+    object
+        the return value of `fn`
+    """
+    if limiter is None:
+        return fn(*args, **kwargs)
+    return limiter.call(fn, *args, **kwargs)
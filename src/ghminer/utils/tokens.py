@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Pool of github access tokens shared by all retrievers.
+
+Each token has its own hourly quota per rate limit resource. The pool
+routes every request to the token with the most remaining quota, which
+rotates away from a token as soon as it runs low, even in the middle of a
+repository.
+
+"""
+
+import threading
+import time
+
+from github import Github
+from github.Auth import Auth
+from github.Requester import WithRequester
+from urllib3.util.retry import Retry
+from .common import PER_PAGE
+from .common import load_access_tokens
+
+# quota assumed for a token not used yet
+FRESH_QUOTA = 5000
+
+# the clients retry server errors only, rate limits are left to the
+# `QuotaScheduler` and `AdaptiveConcurrency` of the callers
+_RETRY = Retry(
+    total=5, backoff_factor=1, status_forcelist=[500, 502, 503, 504],
+    raise_on_status=False
+)
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+class _PoolAuth(Auth, WithRequester):
+    """Authenticate each request with the freshest token of a pool."""
+
+    def __init__(self, pool, resource):
+        super().__init__()
+        self._pool = pool
+        self._resource = resource
+        # the token of the request in flight on each thread
+        self._local = threading.local()
+
+    @property
+    def token_type(self):
+        return "token"
+
+    @property
+    def token(self):
+        token = getattr(self._local, "token", None)
+        return token or self._pool.token(self._resource)
+
+    @property
+    def _masked_token(self):
+        return "token (oauth token removed)"
+
+    def authentication(self, headers):
+        self._local.token = self._pool.token(self._resource)
+        headers["Authorization"] = f"{self.token_type} {self._local.token}"
+
+    def withRequester(self, requester):
+        super().withRequester(requester)
+        # the requester reports every response to this debug hook, which
+        # carries the quota of the token the request was sent with
+        on_response = requester.DEBUG_ON_RESPONSE
+
+        def hook(status, headers, data):
+            on_response(status, headers, data)
+            self._on_response(status, headers)
+        requester.DEBUG_ON_RESPONSE = hook
+        return self
+
+    def _on_response(self, status, headers):
+        token = getattr(self._local, "token", None)
+        if token is None:
+            return
+        if status == 401:
+            self._pool.discard(token)
+        else:
+            resource = headers.get("x-ratelimit-resource", self._resource)
+            self._pool.update(token, headers, resource)
+
+
+class TokenPool:
+    """A thread-safe pool of github access tokens.
+
+    Github clients are not safe to share between threads, so the pool keeps
+    one client per thread. The client authenticates each request with the
+    token that has the most quota left, as reported by the rate limit
+    headers of the responses, and a token rejected as bad credentials is
+    not used again.
+
+    Attributes
+    ----------
+    tokens : list
+        the access tokens in the pool
+
+    """
+
+    def __init__(self, tokens, per_page=PER_PAGE):
+        """Create an instance of `TokenPool` object.
+
+        Parameters
+        ----------
+        tokens : list
+            the access tokens in the pool
+        per_page : int
+            the page size of the github clients
+        """
+        if not tokens:
+            raise ValueError("At least one access token is required")
+        self._tokens = list(dict.fromkeys(tokens))
+        self._per_page = per_page
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # resource => token => (remaining, reset epoch) seen in responses
+        self._quota = {}
+        self._discarded = set()
+
+    @property
+    def tokens(self):
+        """Return tokens."""
+        return self._tokens
+
+    def _remaining(self, token, resource):
+        quota = self._quota.get(resource, {}).get(token, None)
+        if quota and quota[1] > time.time():
+            return quota[0]
+        return FRESH_QUOTA
+
+    def _reset(self, token, resource):
+        quota = self._quota.get(resource, {}).get(token, None)
+        return quota[1] if quota else 0
+
+    def _best(self, resource):
+        tokens = [t for t in self._tokens if t not in self._discarded]
+        if not tokens:
+            raise ValueError("No valid access token left in the pool")
+        return max(tokens, key=lambda t: self._remaining(t, resource))
+
+    def quota(self, resource="core"):
+        """Return remaining quota and reset epoch of the best token.
+
+        Parameters
+        ----------
+        resource : str
+            the rate limit resource, `core`, `search` or `graphql`
+
+        Returns
+        -------
+        tuple
+            remaining calls and the unix timestamp when the quota resets
+        """
+        with self._lock:
+            token = self._best(resource)
+            return self._remaining(token, resource), \
+                self._reset(token, resource)
+
+    def token(self, resource="graphql"):
+        """Return the token with the most remaining quota.
+
+        Parameters
+        ----------
+        resource : str
+            the rate limit resource, `core`, `search` or `graphql`
+
+        Returns
+        -------
+        str
+            the access token
+        """
+        with self._lock:
+            return self._best(resource)
+
+    def client(self, resource="core"):
+        """Return the github client of the calling thread.
+
+        The client picks the token of each request when it is sent, so the
+        objects it returns, e.g. a repository, follow the freshest token.
+
+        Parameters
+        ----------
+        resource : str
+            the rate limit resource the requests mostly use, `core` or
+            `search`
+
+        Returns
+        -------
+        Github
+            the client owned by the calling thread
+        """
+        if not hasattr(self._local, "clients"):
+            self._local.clients = {}
+        clients = self._local.clients
+        if resource not in clients:
+            clients[resource] = Github(
+                auth=_PoolAuth(self, resource), per_page=self._per_page,
+                retry=_RETRY
+            )
+        return clients[resource]
+
+    def update(self, token, headers, resource="graphql"):
+        """Record the quota reported in the headers of a response.
+
+        Parameters
+        ----------
+        token : str
+            the access token the request was sent with
+        headers : dict
+            the response headers
+        resource : str
+            the rate limit resource, `core`, `search` or `graphql`
+
+        Returns
+        -------
+        None
+        """
+        headers = {k.lower(): v for k, v in headers.items()}
+        remaining = headers.get("x-ratelimit-remaining", None)
+        reset = headers.get("x-ratelimit-reset", None)
+        if remaining is None or reset is None:
+            return
+        with self._lock:
+            quotas = self._quota.setdefault(resource, {})
+            quotas[token] = (int(float(remaining)), int(float(reset)))
+
+    def discard(self, token):
+        """Stop using `token`, e.g. after it is rejected as bad credentials.
+
+        Parameters
+        ----------
+        token : str
+            the access token to drop
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self._discarded.add(token)
+
+    def __repr__(self):
+        """Represnt this object as a string for debug purpose."""
+        return f"tokens: {len(self.tokens)}"
+
+    def __str__(self):
+        """Represnt this object as a string."""
+        return f"TokenPool of {len(self.tokens)} tokens"
+
+
+def default_pool():
+    """Return the token pool shared by all retrievers of this process.
+
+    The pool is created on first use from `load_access_tokens`.
+
+    Returns
+    -------
+    TokenPool
+        the shared pool
+    """
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = TokenPool(load_access_tokens())
+        return _default_pool
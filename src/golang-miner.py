@@ -73,6 +73,19 @@ def _parse_args():
     parser_grb.add_argument(
         '-d', '--trace', action="store_true",
         default=False, help='Print trace messages')
+    parser_grb.add_argument(
+        '--ledger-file', default=None,
+        help='Job ledger shared by miners on several hosts, default the '
+             '.db file next to the progress file')
+    parser_grb.add_argument(
+        '-b', '--backend', choices=["rest", "graphql", "local"],
+        default="rest",
+        help='API to fetch the go.mod files with, or local bare mirrors, '
+             'default rest')
+    parser_grb.add_argument(
+        '-m', '--mirror-dir', default=None,
+        help='Directory of bare mirrors as owner/repo.git, required by the '
+             'local backend')
 
     # Parse the arguments
     args = parser.parse_args()
@@ -111,7 +124,10 @@ def _grab_go_mod(args):
         args.source_file,
         base_dir=args.output_dir,
         progress_file=args.progress_file,
-        trace=args.trace
+        trace=args.trace,
+        ledger_file=args.ledger_file,
+        backend=args.backend,
+        mirror_dir=args.mirror_dir
     )
     t1 = timer()
     print(f"grab_gomod() took {t1-t0}s")
@@ -24,6 +24,8 @@ from argparse import ArgumentParser
 from argparse import ArgumentTypeError
 from datetime import date, datetime
 from ghminer.retriever import collect_data
+from ghminer.retriever.schema import DEFAULT_FIELDS
+from ghminer.retriever.schema import REPO_FIELDS
 
 
 def _validate_date(date_string):
@@ -56,10 +58,19 @@ def _parse_args():
         '-d', '--trace', action="store_true",
         default=False, help='Print trace messages')
     parser.add_argument(
-        '-s', '--stars', default=10, help='Minimal stars')
+        '-s', '--stars', type=int, default=10, help='Minimal stars')
     parser.add_argument(
-        '--span', default=15,
-        help='Days in one search trial, default 15')
+        '--span', type=int, default=15,
+        help="Days in one initial search window, default 15")
+    parser.add_argument(
+        '-w', '--workers', type=int, default=4,
+        help='Number of concurrent search workers, default 4')
+    parser.add_argument(
+        '--fields', default=",".join(DEFAULT_FIELDS),
+        help='Comma separated repository fields to keep, default %(default)s')
+    parser.add_argument(
+        '--raw-fields', action="store_true", default=False,
+        help='Keep the whole repository payload instead of --fields')
     parser.add_argument(
         '--start-year', type=int, default=2008,
         help='Start year of the search, in YYYY format, default 2008')
@@ -73,6 +84,9 @@ def _parse_args():
     if ((args.lang is None or args.lang == '')
             and (args.topic is None or len(args.topic) == 0)):
         parser.error("Either --topic or --lang is mandatory")
+    unknown = [f for f in args.fields.split(",") if f not in REPO_FIELDS]
+    if unknown:
+        parser.error(f"Unknown fields: {','.join(unknown)}")
     return args
 
 
@@ -94,5 +108,6 @@ if __name__ == "__main__":
 
     collect_data(
         start_year, end_year, extra, fork, stars, slice, subdir,
-        lang, topics=topics, trace=trace
+        lang, topics=topics, trace=trace, workers=args.workers,
+        fields=None if args.raw_fields else args.fields.split(",")
     )
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Refresh metadata of repositories identified earlier.
+
+This script re-checks the following metadata of the repositories listed in
+the combined .csv file generated by `identify-repos.py`:
+
+    * stargazers_count - number of stars
+    * forks_count - number of forks
+    * archived - whether the repository is archived
+    * pushed_at - timestamp of the latest push
+
+It generates a delta .csv file containing only the repositories whose
+metadata changed, with a `changed` column listing the changed fields, or
+`gone` for repositories no longer accessible.
+
+This script requires that `pandas` and `requests` be installed within the
+Python environment you are running this script in.
+
+"""
+
+from argparse import ArgumentParser
+from ghminer.retriever import refresh_repos
+
+
+def _parse_args():
+    parser = ArgumentParser(description='Github repository refresher')
+    parser.add_argument(
+        '-f', '--repo-list-file', required=True,
+        help='The combined .csv file of repositories to refresh')
+    parser.add_argument(
+        '-o', '--delta-file', required=True,
+        help='Path to the .csv file to store changed repositories')
+    parser.add_argument(
+        '-b', '--batch-size', type=int, default=100,
+        help='Repositories per GraphQL query, default 100')
+    parser.add_argument(
+        '-d', '--trace', action="store_true",
+        default=False, help='Print trace messages')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    changes = refresh_repos(
+        args.repo_list_file,
+        args.delta_file,
+        batch_size=args.batch_size,
+        trace=args.trace
+    )
+    print(f"{changes} repositories changed")
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import unittest
+import pandas as pd
+from types import SimpleNamespace
+from unittest import mock
+from ghminer.golang.gomod import _is_module_path
+from ghminer.golang.gomod import grab_latest_version
+from ghminer.golang.gomod import load_mod_info_graphql
+from ghminer.golang.gomod import load_mod_tree
+from ghminer.golang.store import blob_sha
+from ghminer.golang.store import load_index
+
+
+class ModulePathTest(unittest.TestCase):
+
+    def test_nested_modules_found(self):
+        self.assertTrue(_is_module_path("go.mod"))
+        self.assertTrue(_is_module_path("tools/gen/go.mod"))
+        self.assertFalse(_is_module_path("go.mod.bak"))
+        self.assertFalse(_is_module_path("docs/notgo.mod"))
+
+    def test_ignored_directories_skipped(self):
+        self.assertFalse(_is_module_path("vendor/x/go.mod"))
+        self.assertFalse(_is_module_path("a/testdata/go.mod"))
+        self.assertFalse(_is_module_path(".github/go.mod"))
+        self.assertFalse(_is_module_path("_examples/go.mod"))
+
+
+class ModTreeTest(unittest.TestCase):
+
+    def test_truncated_tree_walked(self):
+        def entry(path, kind, sha):
+            return SimpleNamespace(path=path, type=kind, sha=sha)
+
+        trees = {
+            "root": [
+                entry("go.mod", "blob", "m0"), entry("a", "tree", "ta"),
+                entry("vendor", "tree", "tv"),
+            ],
+            "ta": [entry("go.mod", "blob", "m1"), entry("b", "tree", "tb")],
+            "tb": [entry("go.mod", "blob", "m2")],
+        }
+        listed = []
+
+        class _Repo:
+            full_name = "o/r"
+
+            def get_git_tree(self, sha, recursive=False):
+                listed.append(sha)
+                if recursive:
+                    # only part of the entries
+                    return SimpleNamespace(
+                        sha="root", truncated=True, tree=trees["root"]
+                    )
+                return SimpleNamespace(
+                    sha=sha, truncated=False, tree=trees[sha]
+                )
+
+        self.assertEqual(
+            [("go.mod", "m0"), ("a/go.mod", "m1"), ("a/b/go.mod", "m2")],
+            load_mod_tree(_Repo(), "v1.0.0")
+        )
+        self.assertEqual(["v1.0.0", "root", "ta", "tb"], listed)
+
+
+class _GraphQL:
+    """Answer the tag and object queries over the files of each tag."""
+
+    def __init__(self, tags, fail=None):
+        self.tags = tags
+        self.fail = fail
+        self.objects = {}
+        self.queries = 0
+
+    def _tree(self, files, prefix):
+        entries = {}
+        for path, text in files.items():
+            if not path.startswith(prefix):
+                continue
+            name, _, rest = path[len(prefix):].partition("/")
+            if rest:
+                entries[name] = ("tree", self._tree(files, f"{prefix}{name}/"))
+            else:
+                oid = blob_sha(text.encode())
+                self.objects[oid] = {"text": text, "oid": oid}
+                entries[name] = ("blob", oid)
+        listing = [
+            {"name": n, "type": t, "oid": o}
+            for n, (t, o) in sorted(entries.items())
+        ]
+        oid = hashlib.sha1(json.dumps(listing).encode()).hexdigest()
+        self.objects[oid] = {"oid": oid, "entries": listing}
+        return oid
+
+    def _object(self, kind, arg):
+        if kind == "oid":
+            return self.objects.get(arg, None)
+        ver, _, path = arg.partition(":")
+        if ver not in self.tags:
+            return None
+        obj = self.objects[self._tree(self.tags[ver], "")]
+        for name in filter(None, path.split("/")):
+            oids = [
+                e["oid"] for e in obj.get("entries", None) or []
+                if e["name"] == name
+            ]
+            if not oids:
+                return None
+            obj = self.objects[oids[0]]
+        return obj
+
+    def __call__(self, query):
+        self.queries += 1
+        if "refs(" in query:
+            return {"data": {"repository": {
+                "defaultBranchRef": {"name": "main"},
+                "refs": {
+                    "pageInfo": {"hasNextPage": False, "endCursor": None},
+                    "nodes": [{"name": t} for t in self.tags],
+                },
+            }}}
+        aliases = re.findall(
+            r'(o\d+): object\((expression|oid): ("[^"]*")\)', query
+        )
+        if self.queries == self.fail:
+            # a failed batch comes back with null aliases
+            return {
+                "data": {"repository": {a: None for a, _, _ in aliases}},
+                "errors": [{
+                    "type": "SERVICE_UNAVAILABLE", "message": "try again",
+                }],
+            }
+        return {"data": {"repository": {
+            a: self._object(kind, json.loads(arg))
+            for a, kind, arg in aliases
+        }}}
+
+
+class ModInfoGraphqlTest(unittest.TestCase):
+
+    tags = {
+        "v1.0.0": {"go.mod": "module x\n", "main.go": "package x\n"},
+        "v1.1.0": {"go.mod": "module x\n", "main.go": "package y\n"},
+    }
+
+    def test_modules_indexed(self):
+        with tempfile.TemporaryDirectory() as tmp, mock.patch(
+                "ghminer.golang.gomod.run_query", _GraphQL(self.tags)):
+            self.assertEqual(
+                (True, "v1.1.0"), load_mod_info_graphql("o", "r", tmp)
+            )
+            index = load_index(tmp, "o", "r")
+        self.assertEqual(
+            {("v1.0.0", ""), ("v1.1.0", "")}, set(index)
+        )
+
+    def test_nested_modules_indexed(self):
+        tags = {
+            "v1.0.0": {
+                "go.mod": "module x\n", "tools/go.mod": "module t\n",
+                "a/b/go.mod": "module b\n", "vendor/y/go.mod": "module y\n",
+            },
+            # no root go.mod, the modules one and two levels down count
+            "v1.1.0": {
+                "tools/go.mod": "module t\n", "a/b/go.mod": "module b2\n",
+            },
+        }
+        graphql = _GraphQL(tags)
+        with tempfile.TemporaryDirectory() as tmp, mock.patch(
+                "ghminer.golang.gomod.run_query", graphql):
+            self.assertEqual(
+                (True, "v1.1.0"), load_mod_info_graphql("o", "r", tmp)
+            )
+            index = load_index(tmp, "o", "r")
+        self.assertEqual({
+            ("v1.0.0", ""), ("v1.0.0", "tools"), ("v1.0.0", "a/b"),
+            ("v1.1.0", "tools"), ("v1.1.0", "a/b"),
+        }, set(index))
+        self.assertEqual(
+            index[("v1.0.0", "tools")], index[("v1.1.0", "tools")]
+        )
+        # tags, roots, two levels of trees, blobs
+        self.assertEqual(5, graphql.queries)
+
+    def test_failed_batch_raised(self):
+        with tempfile.TemporaryDirectory() as tmp, mock.patch(
+                "ghminer.golang.gomod.run_query", _GraphQL(self.tags, 2)):
+            with self.assertRaises(Exception):
+                load_mod_info_graphql("o", "r", tmp)
+            # nothing is recorded as missing
+            self.assertEqual({}, load_index(tmp, "o", "r"))
+
+
+class LatestVersionTest(unittest.TestCase):
+
+    def test_missing_flag_fails_its_job_only(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            pd.DataFrame({
+                "full_name": ["o/a", "o/b"],
+                "use_module": [1, None],
+            }).to_csv(os.path.join(tmp, "progress.csv"), index=False)
+            pool = mock.Mock()
+            with mock.patch(
+                    "ghminer.golang.gomod.default_pool",
+                    return_value=pool), mock.patch(
+                    "ghminer.golang.gomod.load_latest_ver",
+                    return_value="v1.0.0"):
+                grab_latest_version(tmp)
+            df = pd.read_csv(os.path.join(tmp, "new_progress.csv"))
+            self.assertEqual(["o/a"], list(df.full_name))
+            self.assertEqual(["v1.0.0"], list(df.latest_version))
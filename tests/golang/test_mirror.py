@@ -0,0 +1,73 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from ghminer.golang.gomod import load_mod_info_local
+from ghminer.golang.store import load_blob
+from ghminer.golang.store import load_index
+
+_ENV = dict(
+    os.environ,
+    GIT_AUTHOR_NAME="t", GIT_AUTHOR_EMAIL="t@example.com",
+    GIT_COMMITTER_NAME="t", GIT_COMMITTER_EMAIL="t@example.com",
+)
+
+
+def _git(cwd, *args):
+    subprocess.run(
+        ["git", *args], cwd=cwd, env=_ENV, check=True, capture_output=True
+    )
+
+
+def _commit(work, files, tag):
+    for path, content in files.items():
+        os.makedirs(os.path.join(work, os.path.dirname(path)), exist_ok=True)
+        with open(os.path.join(work, path), 'w') as f:
+            f.write(content)
+    _git(work, "add", "-A")
+    _git(work, "commit", "-q", "-m", tag)
+    _git(work, "tag", tag)
+
+
+class LocalMirrorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        work = os.path.join(self.tmp.name, "work")
+        os.makedirs(work)
+        _git(work, "init", "-q")
+        _commit(work, {"README": "no module yet\n"}, "v0.1.0")
+        _commit(work, {"go.mod": "module example.com/m\n"}, "v1.0.0")
+        _commit(work, {
+            "tools/gen/go.mod": "module example.com/m/tools/gen\n",
+            "vendor/x/go.mod": "module x\n",
+        }, "v1.1.0")
+        self.mirrors = os.path.join(self.tmp.name, "mirrors")
+        _git(self.tmp.name, "clone", "-q", "--mirror", work,
+             os.path.join(self.mirrors, "o", "r.git"))
+        self.base_dir = os.path.join(self.tmp.name, "mod-info")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_modules_of_all_versions(self):
+        self.assertEqual(
+            (True, "v1.1.0"),
+            load_mod_info_local(self.mirrors, "o", "r", self.base_dir)
+        )
+        index = load_index(self.base_dir, "o", "r")
+        self.assertEqual({
+            ("v1.1.0", ""), ("v1.1.0", "tools/gen"), ("v1.0.0", ""),
+        }, set(index))
+        # the unchanged root go.mod is one blob
+        self.assertEqual(index[("v1.1.0", "")], index[("v1.0.0", "")])
+        self.assertEqual(
+            b"module example.com/m/tools/gen\n",
+            load_blob(self.base_dir, index[("v1.1.0", "tools/gen")])
+        )
+
+    def test_missing_mirror(self):
+        self.assertEqual(
+            (False, ""),
+            load_mod_info_local(self.mirrors, "o", "gone", self.base_dir)
+        )
@@ -0,0 +1,42 @@
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from requests.exceptions import ConnectionError
+from ghminer.golang.nameconv import GoImportMetaHTMLParser
+from ghminer.golang.nameconv import _convert_name
+from ghminer.utils.ledger import DONE
+from ghminer.utils.ledger import FAILED
+from ghminer.utils.ledger import open_ledger
+
+META = '<meta name="go-import" content="x.io/a git https://github.com/o/a">'
+
+
+class ConvertNameTest(unittest.TestCase):
+
+    def test_transient_error_left_to_retry(self):
+        pages = {
+            "x.io/a": SimpleNamespace(status_code=200, text=META),
+            "x.io/b": SimpleNamespace(status_code=200, text="<html/>"),
+        }
+
+        def get(url, params, allow_redirects):
+            module = url[len("https://"):]
+            if module not in pages:
+                raise ConnectionError("connection reset")
+            return pages[module]
+
+        parser = GoImportMetaHTMLParser()
+        keys = ["x.io/a", "x.io/b", "x.io/c"]
+        with tempfile.TemporaryDirectory() as tmp, mock.patch(
+                "ghminer.golang.nameconv.requests.get", get):
+            with open_ledger(tmp, "progress.csv", "module") as ledger:
+                results = {
+                    key: ledger.run(key, _convert_name, parser, key)
+                    for key in ledger.schedule(keys)
+                }
+                self.assertEqual({DONE: 2, FAILED: 1}, ledger.counts())
+                self.assertEqual(["x.io/c"], ledger.schedule(keys))
+        self.assertEqual("github.com/o/a", results["x.io/a"]["github_name"])
+        # no meta after a module with one is not a github name
+        self.assertEqual("-", results["x.io/b"]["github_name"])
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+from ghminer.golang.gomod import persist_gomod
+from ghminer.golang.store import BLOB_DIR
+from ghminer.golang.store import INDEX_FILE
+from ghminer.golang.store import blob_sha
+from ghminer.golang.store import load_blob
+from ghminer.golang.store import load_index
+
+
+class ModStoreTest(unittest.TestCase):
+
+    def test_blob_sha_matches_git(self):
+        # git hash-object of a file holding "module x\n"
+        self.assertEqual(
+            "c1914353d51b10060f3dd66d82b39adb086b0eb4",
+            blob_sha(b"module x\n")
+        )
+
+    def test_identical_files_stored_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for ver in ("v1.0.0", "v1.1.0"):
+                persist_gomod("o", "r", ver, b"module x\n", "go.mod", tmp)
+            persist_gomod("o", "r", "v1.1.0", b"module y\n", "y/go.mod", tmp)
+            index = load_index(tmp, "o", "r")
+            self.assertEqual(3, len(index))
+            self.assertEqual(
+                index[("v1.0.0", "")], index[("v1.1.0", "")]
+            )
+            self.assertEqual(
+                b"module y\n", load_blob(tmp, index[("v1.1.0", "y")])
+            )
+            blobs = os.path.join(tmp, BLOB_DIR)
+            self.assertEqual(2, sum(
+                len(files) for _, _, files in os.walk(blobs)
+            ))
+
+    def test_torn_index_line_skipped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            persist_gomod("o", "r", "v1.0.0", b"module x\n", "go.mod", tmp)
+            # a crash tore the line of the next version
+            with open(os.path.join(tmp, "o", "r", INDEX_FILE), 'a') as f:
+                f.write('{"version": "v1.1.0", "mo')
+            self.assertEqual(1, len(load_index(tmp, "o", "r")))
+            persist_gomod("o", "r", "v1.1.0", b"module x\n", "go.mod", tmp)
+            self.assertEqual(2, len(load_index(tmp, "o", "r")))
@@ -0,0 +1,55 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from ghminer.retriever.comment import _plan_windows
+
+START = datetime(2015, 1, 1)
+
+
+class _Page:
+
+    def __init__(self, count):
+        self.totalCount = count
+
+
+class _Repo:
+
+    full_name = "o/r"
+
+    def __init__(self, times):
+        self.times = times
+
+    def get_issues_comments(self, sort, direction, since):
+        since = since.replace(tzinfo=None)
+        return _Page(sum(1 for t in self.times if t >= since))
+
+
+class _Pool:
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def client(self):
+        return self
+
+    def get_repo(self, full_name, lazy=False):
+        return self.repo
+
+
+class PlanWindowsTest(unittest.TestCase):
+
+    def test_windows_follow_comment_density(self):
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        # a quiet start, then most comments in the recent past
+        times = [START + timedelta(days=i) for i in range(100)]
+        times += [now - timedelta(hours=i) for i in range(900)]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            jobs = _plan_windows(
+                _Pool(_Repo(times)), "o/r", START, len(times), 4, executor,
+                None, False
+            )
+        self.assertEqual(START.strftime('%Y-%m-%dT%H:%M:%SZ'), jobs[0][1])
+        self.assertIsNone(jobs[-1][2])
+        # all but the first window lie within the busy recent year
+        recent = (now - timedelta(days=365)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        self.assertTrue(all(start > recent for _, start, _ in jobs[1:]))
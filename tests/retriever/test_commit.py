@@ -0,0 +1,268 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+from ghminer.retriever.commit import _next_slice
+from ghminer.retriever.commit import grab_commits
+from ghminer.retriever.commit import load_commits
+from ghminer.retriever.commit import load_commits_graphql
+from ghminer.retriever.commit import MAX_SLICE
+from ghminer.retriever.commit import MIN_SLICE
+
+
+class NextSliceTest(unittest.TestCase):
+
+    def test_grow_on_empty_window(self):
+        self.assertEqual(120, _next_slice(30, 0))
+        self.assertEqual(MAX_SLICE, _next_slice(3000, 0))
+
+    def test_scale_towards_target(self):
+        self.assertEqual(60, _next_slice(30, 250, target=500))
+        self.assertEqual(15, _next_slice(30, 1000, target=500))
+
+    def test_damp_bursts(self):
+        self.assertEqual(7, _next_slice(30, 100000, target=500))
+        self.assertEqual(MIN_SLICE, _next_slice(2, 100000, target=500))
+        self.assertEqual(120, _next_slice(30, 1, target=500))
+
+
+def _history(shas, cursor, has_next, days=None, branch="main"):
+    nodes = [{
+        "oid": sha,
+        "author": {"name": "a", "date": "2024-01-01T00:00:00Z"},
+        "committer": {"date": f"2024-01-0{day}T00:00:00Z"},
+        "message": "m", "signature": None, "additions": 1, "deletions": 0,
+    } for sha, day in zip(shas, days or range(1, len(shas) + 1))]
+    return {"data": {"repository": {"defaultBranchRef": {
+        "name": branch, "target": {"history": {
+            "pageInfo": {"hasNextPage": has_next, "endCursor": cursor},
+            "nodes": nodes,
+        }},
+    }}}}
+
+
+class _Page:
+
+    def __init__(self, commits, fail_page=None):
+        self.commits = commits
+        self.fail_page = fail_page
+
+    @property
+    def totalCount(self):
+        return len(self.commits)
+
+    def get_page(self, n):
+        if n == self.fail_page:
+            raise RuntimeError("connection reset")
+        return self.commits[n * 100:(n + 1) * 100]
+
+
+class _Repo:
+    """The REST commit list of a branch, newest first."""
+
+    full_name = "o/r"
+    created_at = datetime(2024, 1, 1)
+
+    def __init__(self, commits, branch="main"):
+        self.commits = commits
+        self.default_branch = branch
+        # the `since` of a window and the page of it to fail
+        self.fail = None
+        self.windows = []
+
+    def get_commits(self, sha, since=None, until=None):
+        self.windows.append(since)
+        commits = [
+            SimpleNamespace(_rawData={"sha": c, "commit": {
+                "author": {"name": "a", "date": "2024-01-01T00:00:00Z"},
+                "committer": {"date": dt.strftime("%Y-%m-%dT%H:%M:%SZ")},
+            }})
+            for c, dt in sorted(self.commits, key=lambda c: c[1])[::-1]
+            if (since is None or dt >= since)
+            and (until is None or dt <= until)
+        ]
+        fail = self.fail if self.fail and self.fail[0] == since else None
+        return _Page(commits, fail[1] if fail else None)
+
+
+class _RepoTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = _Repo([])
+        patcher = mock.patch(
+            "ghminer.retriever.commit.load_repo_info",
+            lambda client, name: self.repo
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _load(self, incremental=False, window_workers=1):
+        return load_commits(
+            None, "o", "r", self.tmp.name, incremental=incremental,
+            window_workers=window_workers
+        )
+
+    def _rows(self, name="commits.csv"):
+        with open(os.path.join(self.tmp.name, "o", "r", name)) as fh:
+            if name == "commits.json":
+                return [json.loads(x)["sha"] for x in fh if x.strip()]
+            return [x.split(",")[1:3] for x in fh]
+
+
+class LoadCommitsTest(_RepoTestCase):
+
+    def test_incremental_skips_boundary_commits(self):
+        day = datetime(2024, 1, 5, 12)
+        self.repo.commits = [
+            ("s1", datetime(2024, 1, 2)), ("s2", day), ("s3", day),
+        ]
+        self.assertEqual(("main", 3), self._load())
+        # `since` is inclusive, s2 and s3 come again with s4
+        self.repo.commits += [("s4", day), ("s5", day + timedelta(1))]
+        self.assertEqual(("main", 5), self._load(True))
+        self.assertEqual(("main", 5), self._load(True))
+        self.assertEqual(
+            ["s3", "s2", "s1", "s5", "s4"], self._rows("commits.json")
+        )
+        self.assertEqual(
+            ["s3", "s2", "s1", "s5", "s4"], [r[1] for r in self._rows()]
+        )
+
+    def test_branch_change_refetched(self):
+        self.repo.commits = [("s1", datetime(2024, 1, 2))]
+        self._load()
+        self.repo.default_branch = "dev"
+        self.repo.commits = [
+            ("t1", datetime(2024, 1, 2)), ("t2", datetime(2024, 1, 3)),
+        ]
+        self.assertEqual(("dev", 2), self._load(True))
+        self.assertEqual([["dev", "t2"], ["dev", "t1"]], self._rows())
+
+    def test_checkpoint_resumed(self):
+        self.repo.commits = [("s0", datetime(2024, 1, 2))] + [
+            (f"s{i}", datetime(2024, 2, 1) + timedelta(minutes=i))
+            for i in range(1, 151)
+        ]
+        # the second page of the second window fails
+        self.repo.fail = (datetime(2024, 1, 31), 1)
+        with self.assertRaises(RuntimeError):
+            self._load()
+        self.repo.fail = None
+        self.repo.windows = []
+        self.assertEqual(("main", 151), self._load())
+        # resumed after the first window
+        self.assertEqual(datetime(2024, 1, 31), self.repo.windows[0])
+        shas = self._rows("commits.json")
+        self.assertEqual(151, len(set(shas)))
+        self.assertEqual(shas, [r[1] for r in self._rows()])
+
+
+class LoadCommitsParallelTest(_RepoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for name, value in (
+                ("LARGE_HISTORY", 100), ("PART_COMMITS", 50),
+                ("default_pool", mock.Mock())):
+            patcher = mock.patch(f"ghminer.retriever.commit.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.repo.commits = [
+            (f"s{i}", datetime(2024, 1, 1, 12) + timedelta(days=3 * i))
+            for i in range(200)
+        ]
+
+    def test_windows_stitched(self):
+        self.assertEqual(("main", 200), self._load(window_workers=3))
+        shas = self._rows("commits.json")
+        self.assertEqual({c for c, _ in self.repo.commits}, set(shas))
+        self.assertEqual(shas, [r[1] for r in self._rows()])
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tmp.name, "o", "r", "commits.json.parts")
+        ))
+        # the state of the next incremental run
+        with open(os.path.join(
+                self.tmp.name, "o", "r", "commits.state")) as fh:
+            self.assertEqual(["s199"], json.load(fh)["shas"])
+
+    def test_complete_windows_kept(self):
+        # the first window fails
+        self.repo.fail = (datetime(2024, 1, 1), 0)
+        with self.assertRaises(RuntimeError):
+            self._load(window_workers=3)
+        # the windows not started yet are cancelled by the failure
+        fetched = set(self.repo.windows[1:]) - {datetime(2024, 1, 1)}
+        self.repo.fail = None
+        self.repo.windows = []
+        self.assertEqual(("main", 200), self._load(window_workers=3))
+        # neither counted again nor the complete windows fetched again
+        self.assertIn(datetime(2024, 1, 1), self.repo.windows)
+        self.assertNotIn(None, self.repo.windows)
+        self.assertFalse(fetched & set(self.repo.windows))
+        self.assertEqual(200, len(set(self._rows("commits.json"))))
+
+
+class LoadCommitsGraphqlTest(unittest.TestCase):
+
+    def test_failed_page_raised(self):
+        pages = [
+            _history(["s1", "s2"], "c1", True),
+            {"data": None, "errors": [{"message": "timeout"}]},
+            _history(["s3"], "c2", False),
+        ]
+        with tempfile.TemporaryDirectory() as tmp, mock.patch(
+                "ghminer.retriever.commit.run_query", side_effect=pages):
+            with self.assertRaises(Exception):
+                load_commits_graphql("o", "r", tmp)
+            self.assertEqual(("main", 3), load_commits_graphql("o", "r", tmp))
+            with open(os.path.join(tmp, "o", "r", "commits.json")) as fh:
+                shas = [json.loads(x)["sha"] for x in fh if x.strip()]
+            self.assertEqual(["s1", "s2", "s3"], shas)
+            with open(os.path.join(tmp, "o", "r", "commits.csv")) as fh:
+                self.assertEqual(
+                    ["s1", "s2", "s3"], [x.split(",")[2] for x in fh]
+                )
+
+    def test_incremental_skips_newest_commits(self):
+        pages = [
+            # two commits share the newest committer date
+            _history(["s3", "s2", "s1"], "c1", False, [2, 2, 1]),
+            # `since` is inclusive, both come again with a new one
+            _history(["s4", "s3", "s2"], "c2", False, [2, 2, 2]),
+            # the default branch changed, queried again without `since`
+            _history(["t1"], "c3", False, branch="dev"),
+            _history(["t1"], "c3", False, branch="dev"),
+        ]
+        with tempfile.TemporaryDirectory() as tmp, mock.patch(
+                "ghminer.retriever.commit.run_query", side_effect=pages):
+            load_commits_graphql("o", "r", tmp)
+            self.assertEqual(
+                ("main", 4), load_commits_graphql("o", "r", tmp, False, True)
+            )
+            csv_file = os.path.join(tmp, "o", "r", "commits.csv")
+            with open(csv_file) as fh:
+                self.assertEqual(
+                    ["s3", "s2", "s1", "s4"], [x.split(",")[2] for x in fh]
+                )
+            self.assertEqual(
+                ("dev", 1), load_commits_graphql("o", "r", tmp, False, True)
+            )
+            with open(csv_file) as fh:
+                self.assertEqual(["t1"], [x.split(",")[2] for x in fh])
+
+
+class GrabCommitsTest(unittest.TestCase):
+
+    def test_incremental_refused_with_shared_ledger(self):
+        with self.assertRaises(ValueError):
+            grab_commits(
+                "repos.csv", "out", "progress.csv", incremental=True,
+                ledger_file="shared.db"
+            )
@@ -0,0 +1,60 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from ghminer.retriever.issue import load_issues
+
+
+def _page(numbers, cursor, has_next):
+    return {"data": {"repository": {"pullRequests": {
+        "pageInfo": {"hasNextPage": has_next, "endCursor": cursor},
+        "nodes": [{"number": n} for n in numbers],
+    }}}}
+
+
+class LoadIssuesTest(unittest.TestCase):
+
+    def test_resume_after_last_complete_page(self):
+        pages = {
+            None: _page([1, 2], "c1", True),
+            "c1": _page([3, 4], "c2", True),
+            "c2": _page([5], "c3", False),
+        }
+        queries = []
+
+        def run_query(query):
+            cursor = None
+            if "after:" in query:
+                cursor = query.split('after: "')[1].split('"')[0]
+            queries.append(cursor)
+            if cursor == "c2" and queries.count("c2") == 1:
+                raise KeyboardInterrupt
+            return pages[cursor]
+
+        with tempfile.TemporaryDirectory() as tmp, mock.patch(
+                "ghminer.retriever.issue.run_query", run_query):
+            with self.assertRaises(KeyboardInterrupt):
+                load_issues("o", "r", tmp, "pulls")
+            self.assertEqual(5, load_issues("o", "r", tmp, "pulls"))
+            self.assertEqual([None, "c1", "c2", "c2"], queries)
+            with open(os.path.join(tmp, "o", "r", "pulls.json")) as fh:
+                numbers = [json.loads(x)["number"] for x in fh if x.strip()]
+            self.assertEqual([1, 2, 3, 4, 5], numbers)
+            self.assertFalse(
+                os.path.exists(os.path.join(tmp, "o", "r", "pulls.checkpoint"))
+            )
+
+    def test_failed_page_raised(self):
+        pages = [
+            _page([1, 2], "c1", True),
+            {"data": None, "errors": [{"message": "timeout"}]},
+            _page([3], "c2", False),
+        ]
+
+        with tempfile.TemporaryDirectory() as tmp, mock.patch(
+                "ghminer.retriever.issue.run_query",
+                side_effect=pages):
+            with self.assertRaises(Exception):
+                load_issues("o", "r", tmp, "pulls")
+            self.assertEqual(3, load_issues("o", "r", tmp, "pulls"))
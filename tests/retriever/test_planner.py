@@ -0,0 +1,97 @@
+import unittest
+from datetime import date, timedelta
+from ghminer.retriever.planner import merge_windows
+from ghminer.retriever.planner import plan_queries
+from ghminer.retriever.planner import plan_windows
+from ghminer.retriever.planner import split_stars
+from ghminer.retriever.planner import split_window
+
+
+class DailyProbe:
+
+    def __init__(self, daily):
+        self.daily = daily
+        self.calls = 0
+
+    def __call__(self, start, end):
+        self.calls += 1
+        return sum(
+            self.daily.get(start + timedelta(n), 0)
+            for n in range((end - start).days + 1)
+        )
+
+
+class PlannerTest(unittest.TestCase):
+
+    def test_split_dense_window(self):
+        start = date(2023, 1, 1)
+        probe = DailyProbe({start + timedelta(n): 300 for n in range(8)})
+        windows = split_window(probe, start, start + timedelta(7), cap=1000)
+        self.assertEqual(4, len(windows))
+        self.assertTrue(all(c <= 1000 for _, _, c in windows))
+        self.assertEqual(2400, sum(c for _, _, c in windows))
+        self.assertEqual(start, windows[0][0])
+        self.assertEqual(start + timedelta(7), windows[-1][1])
+
+    def test_single_day_never_split(self):
+        day = date(2023, 3, 1)
+        probe = DailyProbe({day: 5000})
+        self.assertEqual(
+            [(day, day, 5000)], split_window(probe, day, day, cap=1000)
+        )
+
+    def test_merge_sparse_windows(self):
+        d = date(2023, 1, 1)
+        windows = [
+            (d, d, 400),
+            (d + timedelta(1), d + timedelta(1), 0),
+            (d + timedelta(2), d + timedelta(2), 500),
+            (d + timedelta(3), d + timedelta(3), 200),
+        ]
+        self.assertEqual(
+            [(d, d + timedelta(2), 900),
+             (d + timedelta(3), d + timedelta(3), 200)],
+            merge_windows(windows, cap=1000)
+        )
+
+    def test_plan_covers_all_results(self):
+        start = date(2022, 1, 1)
+        end = date(2022, 12, 31)
+        daily = {start + timedelta(n): (n % 7) * 5 for n in range(365)}
+        daily[date(2022, 6, 1)] = 1500
+        probe = DailyProbe(daily)
+        windows = plan_windows(probe, start, end, 15, cap=1000)
+        self.assertEqual(sum(daily.values()), sum(c for _, _, c in windows))
+        for s, e, c in windows:
+            self.assertTrue(c <= 1000 or s == e)
+        self.assertLess(len(windows), len(range(0, 365, 15)))
+
+    def test_split_stars_skewed(self):
+        hist = {s: 4000 // s for s in range(10, 5001)}
+
+        def probe(lo, hi):
+            return sum(hist.get(s, 0) for s in range(lo, hi + 1))
+
+        ranges = split_stars(probe, 10, 5000, cap=1000)
+        self.assertEqual(sum(hist.values()), sum(c for _, _, c in ranges))
+        self.assertTrue(all(c <= 1000 for _, _, c in ranges))
+        self.assertEqual(10, ranges[0][0])
+        self.assertEqual(5000, ranges[-1][1])
+
+    def test_plan_queries_partitions_dense_day(self):
+        day = date(2023, 3, 1)
+        stars = {10 + n: 30 for n in range(100)}
+
+        def probe(start, end, lo, hi):
+            if start <= day <= end:
+                top = max(stars) if hi is None else hi
+                return sum(stars.get(s, 0) for s in range(lo, top + 1))
+            return 0
+
+        queries = plan_queries(
+            probe, lambda s, e: max(stars), day, day, 1, 10, cap=1000
+        )
+        self.assertTrue(len(queries) > 1)
+        self.assertTrue(all(c <= 1000 for *_, c in queries))
+        self.assertEqual(3000, sum(c for *_, c in queries))
+        self.assertIsNone(queries[-1][3])
@@ -0,0 +1,65 @@
+import unittest
+import pandas as pd
+from unittest import mock
+from ghminer.retriever.refresh import _refresh_batch
+
+
+class _Scheduler:
+
+    def call(self, fn, *args):
+        return fn(*args)
+
+
+def _batch():
+    return pd.DataFrame({
+        "full_name": ["o/same", "o/gone", "o/starred"],
+        "stargazers_count": [10, 5, 7],
+        "forks_count": [1, 2, 3],
+        "archived": [False, False, False],
+        "pushed_at": ["2024-01-01T00:00:00Z"] * 3,
+    })
+
+
+def _fresh(stars, forks):
+    return {
+        "stargazerCount": stars, "forkCount": forks, "isArchived": False,
+        "pushedAt": "2024-01-01T00:00:00Z",
+    }
+
+
+class RefreshBatchTest(unittest.TestCase):
+
+    def test_changed_and_gone(self):
+        result = {
+            "data": {"r0": _fresh(10, 1), "r1": None, "r2": _fresh(9, 3)},
+            "errors": [{"type": "NOT_FOUND", "path": ["r1"]}],
+        }
+        with mock.patch(
+                "ghminer.retriever.refresh.run_query",
+                return_value=result):
+            deltas = _refresh_batch(_Scheduler(), _batch())
+        self.assertEqual(
+            [("o/gone", "gone"), ("o/starred", "stargazers_count")],
+            [(d["full_name"], d["changed"]) for d in deltas]
+        )
+        self.assertEqual(9, deltas[1]["stargazers_count"])
+
+    def test_query_error_raised(self):
+        result = {
+            "data": {"r0": _fresh(10, 1), "r1": None, "r2": None},
+            "errors": [
+                {"type": "NOT_FOUND", "path": ["r1"]},
+                {"type": "SERVICE_UNAVAILABLE", "path": ["r2"],
+                 "message": "timeout"},
+            ],
+        }
+        with mock.patch(
+                "ghminer.retriever.refresh.run_query",
+                return_value=result):
+            with self.assertRaises(Exception):
+                _refresh_batch(_Scheduler(), _batch())
+        with mock.patch(
+                "ghminer.retriever.refresh.run_query",
+                return_value={"data": None}):
+            with self.assertRaises(Exception):
+                _refresh_batch(_Scheduler(), _batch())
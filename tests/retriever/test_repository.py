@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pathlib import Path
+from ghminer.retriever.repository import _combine
+
+
+class CombineTest(unittest.TestCase):
+
+    def test_columns_of_later_parts_kept(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            part_dir = Path(tmp, "2020-01-01_2020-12-31")
+            part_dir.mkdir()
+            pq.write_table(pa.table({
+                "full_name": ["o/a", "o/b"],
+                "stargazers_count": [10, 20],
+            }), part_dir / "part-00000.parquet")
+            # raw fields, a later part has a field the first one lacks
+            pq.write_table(pa.table({
+                "full_name": ["o/b", "o/c"],
+                "stargazers_count": [20, 30],
+                "homepage": ["x", "y"],
+            }), part_dir / "part-00001.parquet")
+            file_name = os.path.join(tmp, "combined.csv")
+            self.assertEqual(3, _combine([part_dir], file_name))
+            df = pd.read_csv(file_name)
+            self.assertEqual(
+                ["full_name", "stargazers_count", "homepage"],
+                list(df.columns)
+            )
+            self.assertEqual("y", df.set_index("full_name").homepage["o/c"])
@@ -0,0 +1,50 @@
+import unittest
+import pyarrow as pa
+from ghminer.retriever.schema import project
+from ghminer.retriever.schema import repo_schema
+from ghminer.retriever.schema import to_table
+
+
+class SchemaTest(unittest.TestCase):
+
+    raw = {
+        "id": 42,
+        "full_name": "golang/go",
+        "owner": {"login": "golang", "type": "Organization"},
+        "license": {"spdx_id": "BSD-3-Clause", "url": "https://..."},
+        "permissions": {"admin": False},
+        "topics": ["go", "language"],
+        "stargazers_count": 120000,
+        "fork": False,
+        "created_at": "2014-08-19T04:33:40Z",
+        "pushed_at": None,
+        "hooks_url": "https://api.github.com/repos/golang/go/hooks",
+    }
+
+    def test_project_flattens_selected_fields(self):
+        fields = ["full_name", "owner_type", "license", "topics", "fork"]
+        self.assertEqual({
+            "full_name": "golang/go",
+            "owner_type": "Organization",
+            "license": "BSD-3-Clause",
+            "topics": "go,language",
+            "fork": False,
+        }, project(self.raw, fields))
+
+    def test_to_table_applies_types(self):
+        fields = [
+            "id", "language", "stargazers_count", "created_at", "pushed_at"
+        ]
+        table = to_table([project(self.raw, fields)], fields)
+        self.assertEqual(repo_schema(fields), table.schema)
+        self.assertEqual(pa.int64(), table.schema.field("id").type)
+        self.assertTrue(
+            pa.types.is_dictionary(table.schema.field("language").type)
+        )
+        row = table.to_pylist()[0]
+        self.assertEqual(2014, row["created_at"].year)
+        self.assertIsNone(row["pushed_at"])
+
+    def test_unknown_field(self):
+        with self.assertRaises(ValueError):
+            repo_schema(["full_name", "hooks_url"])
@@ -0,0 +1,152 @@
+import os
+import re
+import tempfile
+import unittest
+import pandas as pd
+from unittest import mock
+from ghminer.retriever.star import _sample_pages
+from ghminer.retriever.star import _sample_repo
+from ghminer.retriever.star import interpolate_stars
+from ghminer.retriever.star import query_stars_batch
+from ghminer.utils.tokens import TokenPool
+
+
+class SampleStarsTest(unittest.TestCase):
+
+    def test_pages_spaced_within_error(self):
+        pages = _sample_pages(400, 0.05)
+        self.assertEqual(0, pages[0])
+        self.assertEqual(399, pages[-1])
+        gaps = [b - a for a, b in zip(pages, pages[1:])]
+        self.assertLessEqual(max(gaps), 400 * 0.05)
+        self.assertEqual([0, 1, 2], _sample_pages(3, 0.01))
+        self.assertEqual([0], _sample_pages(1, 0.01))
+
+    def test_interpolate_between_samples(self):
+        samples = pd.DataFrame({
+            "starredAt": ["2020-01-01T00:00:00Z", "2020-01-11T00:00:00Z"],
+            "stars": [1, 101],
+        })
+        counts = interpolate_stars(
+            samples, ["2019-12-01T00:00:00Z", "2020-01-06T00:00:00Z"]
+        )
+        self.assertEqual([0, 51], list(counts))
+
+    def test_capped_curve_ends_at_newest_star(self):
+        class _Star:
+            def __init__(self, rank):
+                self._rawData = {"starred_at": f"2020-01-01T{rank:08d}"}
+
+        class _Gazers:
+            def get_page(self, n):
+                return [_Star(n * 100 + k + 1) for k in range(100)]
+
+        class _Repo:
+            stargazers_count = 50000
+
+            def get_stargazers_with_dates(self):
+                return _Gazers()
+
+        class _Client:
+            def get_repo(self, full_name):
+                return _Repo()
+
+        class _Scheduler:
+            def call(self, fn, *args):
+                return fn(*args)
+
+        newest = {"data": {"repository": {"stargazers": {
+            "totalCount": 50000, "edges": [{"starredAt": "2024-01-01"}],
+        }}}}
+        with mock.patch(
+                "ghminer.retriever.star.run_query", return_value=newest):
+            points = _sample_repo(
+                _Client(), _Scheduler(), "o/r", 0.1, _Scheduler()
+            )
+        self.assertEqual(40000, points[-2]["stars"])
+        self.assertEqual(
+            ("2024-01-01", 50000),
+            (points[-1]["starredAt"], points[-1]["stars"])
+        )
+        self.assertTrue(all(p["capped"] for p in points))
+
+
+class QueryStarsBatchTest(unittest.TestCase):
+
+    def test_resume_after_last_part(self):
+        stars = {"o/a": 250, "o/b": 0, "o/c": 1000, "o/d": 5}
+        calls = []
+
+        def run_query(query):
+            calls.append(query)
+            if len(calls) == 5:
+                raise KeyboardInterrupt
+            data, errors = {}, []
+            for alias, name, before, size in re.findall(
+                    r'(r\d+): repository\(owner: "o", name: "(\w)"\) '
+                    r'\{ stargazers\((?:before: "(\d+)", )?last: (\d+)',
+                    query):
+                total = stars.get(f"o/{name}", None)
+                if total is None:
+                    data[alias] = None
+                    errors.append({"type": "NOT_FOUND", "path": [alias]})
+                    continue
+                end = int(before) if before else total
+                start = max(0, end - int(size))
+                data[alias] = {"stargazers": {
+                    "pageInfo": {
+                        "startCursor": str(start),
+                        "hasPreviousPage": start > 0,
+                    },
+                    "edges": [
+                        {"starredAt": f"{name}{k:04d}"}
+                        for k in range(start, end)
+                    ],
+                }}
+            return {"data": data, "errors": errors}
+
+        repos = list(stars) + ["o/e"]
+        with tempfile.TemporaryDirectory() as tmp, mock.patch(
+                "ghminer.retriever.star.run_query", run_query), mock.patch(
+                "ghminer.retriever.star.ROW_GROUP_SIZE", 300), mock.patch(
+                "ghminer.retriever.star.default_pool",
+                return_value=TokenPool(["t"])):
+            dest = os.path.join(tmp, "stars.parquet")
+            with self.assertRaises(KeyboardInterrupt):
+                query_stars_batch(repos, dest, batch_size=2)
+            self.assertFalse(os.path.exists(dest))
+            self.assertEqual(
+                1255, query_stars_batch(repos, dest, batch_size=2)
+            )
+            df = pd.read_parquet(dest)
+            self.assertEqual(1255, df.starredAt.nunique())
+            self.assertFalse(os.path.exists(f"{dest}.parts"))
+
+    def test_incremental_keeps_known_stars(self):
+        def run_query(query):
+            # newest first, three stars newer than the known ones
+            self.assertIn("first: 100", query)
+            return {"data": {"r0": {"stargazers": {
+                "pageInfo": {"endCursor": "x", "hasNextPage": False},
+                "edges": [
+                    {"starredAt": f"a{k:04d}"} for k in range(12, -1, -1)
+                ],
+            }}}}
+
+        with tempfile.TemporaryDirectory() as tmp, mock.patch(
+                "ghminer.retriever.star.run_query", run_query), mock.patch(
+                "ghminer.retriever.star.default_pool",
+                return_value=TokenPool(["t"])):
+            known = os.path.join(tmp, "known.parquet")
+            pd.DataFrame({
+                "full_name": ["o/a"] * 10,
+                "starredAt": [f"a{k:04d}" for k in range(10)],
+            }).to_parquet(known)
+            dest = os.path.join(tmp, "stars.parquet")
+            self.assertEqual(
+                3, query_stars_batch(["o/a"], dest, known_file=known)
+            )
+            df = pd.read_parquet(dest)
+            self.assertEqual(
+                [f"a{k:04d}" for k in range(13)], sorted(df.starredAt)
+            )
@@ -0,0 +1 @@
+"""ghminer."""
@@ -0,0 +1,23 @@
+import os
+import tempfile
+import unittest
+from ghminer.utils.common import load_state
+from ghminer.utils.common import save_checkpoint
+from ghminer.utils.common import truncate_file
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def test_resume_drops_writes_after_checkpoint(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            data = os.path.join(tmp, "commits.json")
+            checkpoint = os.path.join(tmp, "commits.checkpoint")
+            with open(data, 'w') as fh:
+                fh.write("\n{\"sha\": \"a\"}\n")
+                save_checkpoint(checkpoint, fh, {"commits": 1})
+                fh.write("{\"sha\": \"b\"")
+            state = load_state(checkpoint)
+            self.assertEqual(1, state["commits"])
+            truncate_file(data, state["offset"])
+            with open(data, 'r') as fh:
+                self.assertEqual("\n{\"sha\": \"a\"}\n", fh.read())
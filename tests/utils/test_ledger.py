@@ -0,0 +1,85 @@
+import os
+import tempfile
+import time
+import unittest
+import pandas as pd
+from unittest import mock
+from ghminer.utils.ledger import DONE
+from ghminer.utils.ledger import FAILED
+from ghminer.utils.ledger import LEASE_SECONDS
+from ghminer.utils.ledger import PENDING
+from ghminer.utils.ledger import JobLedger
+from ghminer.utils.ledger import open_ledger
+
+
+class JobLedgerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base_dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_run_retry_and_export(self):
+        attempts = []
+
+        def job(key):
+            attempts.append(key)
+            if key == "o/b" and len(attempts) < 3:
+                raise RuntimeError("boom")
+            return {"commits": len(key)}
+
+        with open_ledger(self.base_dir, "progress.csv", "full_name") as ledger:
+            for key in ledger.schedule(["o/a", "o/b"]):
+                ledger.run(key, job, key)
+            self.assertEqual({DONE: 1, FAILED: 1}, ledger.counts())
+            # only the failed job is left to retry
+            self.assertEqual(["o/b"], ledger.schedule(["o/a", "o/b"]))
+            for key in ledger.schedule(["o/a", "o/b"]):
+                ledger.run(key, job, key)
+            self.assertEqual({DONE: 2}, ledger.counts())
+            self.assertEqual((2, 3), ledger.stats()[DONE][:2])
+            ledger.export_csv(
+                os.path.join(self.base_dir, "progress.csv"), "full_name",
+                ["commits"]
+            )
+        df = pd.read_csv(os.path.join(self.base_dir, "progress.csv"))
+        self.assertEqual(["o/a", "o/b"], sorted(df.full_name))
+        self.assertEqual([3, 3], list(df.commits))
+
+    def test_import_legacy_progress(self):
+        pd.DataFrame({
+            "full_name": ["o/a"], "commits": [7],
+            "last_updated": ["2023-01-01 00:00:00"],
+        }).to_csv(os.path.join(self.base_dir, "p.csv"), index=False)
+        with open_ledger(self.base_dir, "p.csv", "full_name") as ledger:
+            self.assertEqual(["o/c"], ledger.schedule(["o/a", "o/c"]))
+            ledger.reset(["o/a"])
+            self.assertEqual(["o/a", "o/c"], ledger.schedule(["o/a", "o/c"]))
+
+    def test_leases_across_workers(self):
+        path = os.path.join(self.base_dir, "jobs.db")
+        a = JobLedger(path, worker="a")
+        b = JobLedger(path, worker="b")
+        a.add([f"o/{i}" for i in range(5)])
+        self.assertEqual(["o/0", "o/1"], a.lease_batch(2))
+        self.assertEqual(["o/2", "o/3"], b.lease_batch(2))
+        a.run("o/0", lambda: {})
+        # b dies without releasing, a keeps its lease alive by heartbeat
+        later = time.time() + 2 * LEASE_SECONDS
+        with mock.patch("ghminer.utils.ledger.time.time", return_value=later):
+            a.heartbeat()
+            self.assertEqual(["o/2", "o/3", "o/4"], a.lease_batch(5))
+            self.assertEqual([], b.lease_batch(5))
+        a.close()
+        self.assertEqual({DONE: 1, PENDING: 4}, b.counts())
+        b.close()
+
+    def test_shared_ledger_avoids_wal(self):
+        shared = os.path.join(self.base_dir, "shared.db")
+        with open_ledger(self.base_dir, "p.csv", "full_name", shared) as a:
+            mode = a._read("PRAGMA journal_mode")[0][0]
+            self.assertEqual("delete", mode)
+        with open_ledger(self.base_dir, "p.csv", "full_name") as b:
+            self.assertEqual("wal", b._read("PRAGMA journal_mode")[0][0])
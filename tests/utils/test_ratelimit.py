@@ -0,0 +1,120 @@
+import threading
+import time
+import unittest
+from unittest import mock
+from github import RateLimitExceededException
+from ghminer.utils.ratelimit import AdaptiveConcurrency
+from ghminer.utils.ratelimit import QuotaScheduler
+from ghminer.utils.ratelimit import TokenBucket
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_paces_calls_across_threads(self):
+        bucket = TokenBucket(20, 1)
+        stamps = []
+        lock = threading.Lock()
+
+        def worker():
+            for _ in range(3):
+                bucket.acquire()
+                with lock:
+                    stamps.append(time.monotonic())
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        t0 = time.monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(12, len(stamps))
+        # one token up front, the other 11 refill at 20 per second
+        self.assertGreaterEqual(time.monotonic() - t0, 11 / 20 - 0.05)
+
+
+class _Pool:
+
+    def __init__(self, remaining, reset):
+        self.remaining = remaining
+        self.reset = reset
+
+    def quota(self, resource="core"):
+        return self.remaining, self.reset
+
+
+class QuotaSchedulerTest(unittest.TestCase):
+
+    @mock.patch("ghminer.utils.ratelimit.time.sleep")
+    def test_pauses_until_reset_near_exhaustion(self, sleep):
+        reset = time.time() + 100
+        scheduler = QuotaScheduler(_Pool(10, reset), reserve=50)
+        self.assertEqual(3, scheduler.call(lambda: 3))
+        self.assertEqual(1, sleep.call_count)
+        self.assertGreater(sleep.call_args[0][0], 99)
+
+    @mock.patch("ghminer.utils.ratelimit.time.sleep")
+    def test_retries_after_rate_limit(self, sleep):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            if len(calls) < 3:
+                raise RateLimitExceededException(
+                    403, None, {"Retry-After": "30"}
+                )
+            return "page"
+
+        scheduler = QuotaScheduler(_Pool(5000, 0))
+        self.assertEqual("page", scheduler.call(fetch))
+        self.assertEqual(3, len(calls))
+        self.assertEqual(2, sleep.call_count)
+        self.assertGreaterEqual(sleep.call_args[0][0], 30)
+
+
+class AdaptiveConcurrencyTest(unittest.TestCase):
+
+    def test_additive_increase(self):
+        gate = AdaptiveConcurrency(4)
+        for _ in range(20):
+            gate.call(lambda: None)
+        self.assertEqual(4, gate.limit)
+
+    @mock.patch("ghminer.utils.ratelimit.time.time", return_value=1000.0)
+    def test_multiplicative_decrease(self, _):
+        gate = AdaptiveConcurrency(8, limit=8)
+        # two calls of one burst are throttled, the limit is cut once
+        gate.acquire()
+        gate.acquire()
+        gate.release(1000.0 + 30)
+        self.assertEqual(4, gate.limit)
+        gate.release(1000.0 + 60)
+        self.assertEqual(4, gate.limit)
+
+    @mock.patch("ghminer.utils.ratelimit.time.sleep")
+    def test_primary_limit_left_to_scheduler(self, sleep):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            if len(calls) == 1:
+                raise RateLimitExceededException(
+                    403, None, {"X-RateLimit-Remaining": "0",
+                                "X-RateLimit-Reset": "0"}
+                )
+            return "page"
+
+        gate = AdaptiveConcurrency(4)
+        with self.assertRaises(RateLimitExceededException):
+            gate.call(fetch)
+        calls.clear()
+        pool = _Pool(5000, 0)
+        scheduler = QuotaScheduler(pool, concurrency=gate)
+        # the exhausted token is the only one left, wait for its reset
+        with mock.patch.object(
+                pool, "quota", side_effect=[(5000, 0), (0, 0), (5000, 0)]):
+            self.assertEqual("page", scheduler.call(fetch))
+        self.assertEqual(1, sleep.call_count)
+        # another token has quota left, retry on it at once
+        calls.clear()
+        self.assertEqual("page", scheduler.call(fetch))
+        self.assertEqual(1, sleep.call_count)
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+from ghminer.utils.common import load_access_tokens
+from ghminer.utils.tokens import TokenPool
+
+
+class TokenPoolTest(unittest.TestCase):
+
+    def test_route_to_most_remaining(self):
+        pool = TokenPool(["a", "b", "c"])
+        reset = str(int(time.time()) + 600)
+        pool.update("a", {
+            "X-RateLimit-Remaining": "10", "X-RateLimit-Reset": reset
+        })
+        pool.update("b", {
+            "X-RateLimit-Remaining": "4000", "X-RateLimit-Reset": reset
+        })
+        pool.update("c", {
+            "X-RateLimit-Remaining": "20", "X-RateLimit-Reset": reset
+        })
+        self.assertEqual("b", pool.token())
+        pool.update("b", {
+            "X-RateLimit-Remaining": "0", "X-RateLimit-Reset": reset
+        })
+        self.assertEqual("c", pool.token())
+
+    def test_quota_restored_after_reset(self):
+        pool = TokenPool(["a", "b"])
+        past = str(int(time.time()) - 1)
+        future = str(int(time.time()) + 600)
+        pool.update("a", {
+            "X-RateLimit-Remaining": "0", "X-RateLimit-Reset": past
+        })
+        pool.update("b", {
+            "X-RateLimit-Remaining": "100", "X-RateLimit-Reset": future
+        })
+        self.assertEqual("a", pool.token())
+
+    def test_client_picks_token_per_request(self):
+        pool = TokenPool(["a", "b"])
+        future = str(int(time.time()) + 600)
+        pool.update("a", {
+            "X-RateLimit-Remaining": "10", "X-RateLimit-Reset": future
+        }, "core")
+        requester = pool.client().requester
+        headers = {}
+        requester.auth.authentication(headers)
+        self.assertEqual("token b", headers["Authorization"])
+        # the response of a search does not touch the core quota
+        requester.DEBUG_ON_RESPONSE(200, {
+            "x-ratelimit-remaining": "0", "x-ratelimit-reset": future,
+            "x-ratelimit-resource": "search",
+        }, "")
+        requester.auth.authentication(headers)
+        self.assertEqual("token b", headers["Authorization"])
+        # the same client moves to the other token once b runs low
+        requester.DEBUG_ON_RESPONSE(200, {
+            "x-ratelimit-remaining": "5", "x-ratelimit-reset": future,
+            "x-ratelimit-resource": "core",
+        }, "")
+        requester.auth.authentication(headers)
+        self.assertEqual("token a", headers["Authorization"])
+        self.assertIs(pool.client(), pool.client())
+
+    def test_bad_token_discarded(self):
+        pool = TokenPool(["a", "b"])
+        requester = pool.client().requester
+        headers = {}
+        requester.auth.authentication(headers)
+        bad = headers["Authorization"].split()[1]
+        requester.DEBUG_ON_RESPONSE(401, {}, "")
+        requester.auth.authentication(headers)
+        self.assertNotEqual(bad, headers["Authorization"].split()[1])
+        requester.DEBUG_ON_RESPONSE(401, {}, "")
+        with self.assertRaises(ValueError):
+            requester.auth.authentication(headers)
+
+    def test_empty_pool(self):
+        with self.assertRaises(ValueError):
+            TokenPool([])
+
+    def test_load_tokens_from_env_and_config(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as d:
+            with open(os.path.join(d, "credential.ini"), "w") as f:
+                f.write("[github]\naccess_token=t1\naccess_tokens=t2, t3\n")
+            os.chdir(d)
+            try:
+                env = {"GITHUB_TOKENS": "t0,t1", "GITHUB_TOKEN": ""}
+                with mock.patch.dict(os.environ, env):
+                    self.assertEqual(
+                        ["t0", "t1", "t2", "t3"], load_access_tokens()
+                    )
+            finally:
+                os.chdir(cwd)